@@ -0,0 +1,159 @@
+import asyncio
+import math
+import os
+from collections import Counter, OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict
+
+from fastapi import Depends, HTTPException
+
+from auth import get_current_user
+from tracing import span
+
+# Route class -> number of requests of that class allowed to run at once
+ROUTE_CLASS_CONCURRENCY = {
+    "quotations": int(os.getenv("QUOTATION_CONCURRENCY", "4")),
+    "imports": int(os.getenv("IMPORT_CONCURRENCY", "2")),
+}
+# Requests allowed to wait for a slot, per route class; beyond that new requests are shed
+ADMISSION_QUEUE_SIZE = int(os.getenv("ADMISSION_QUEUE_SIZE", "32"))
+# Longest a request waits for a slot before giving up with 503
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "10"))
+# Running plus waiting requests one user may have in a route class
+ADMISSION_PER_USER = int(os.getenv("ADMISSION_PER_USER", "2"))
+
+
+class Overloaded(Exception):
+    def __init__(self, message: str, status_code: int, retry_after: int):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class RouteClassLimiter:
+    """Concurrency limit for one class of routes with a bounded, per-user fair wait queue.
+
+    Waiting requests are grouped by user and slots are handed out round-robin
+    across users, so one user's burst queues behind everyone else's requests
+    instead of in front of them. Runs on the event loop; not thread-safe.
+    """
+
+    def __init__(self, name: str, max_concurrent: int, max_queue: int = ADMISSION_QUEUE_SIZE,
+                 queue_timeout: float = ADMISSION_QUEUE_TIMEOUT, max_per_user: int = ADMISSION_PER_USER):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.max_per_user = max_per_user
+        self.active = 0
+        self._active_by_user: Counter = Counter()
+        # user -> waiting futures, in the order users get their next turn
+        self._waiting: "OrderedDict[str, Deque[asyncio.Future]]" = OrderedDict()
+        self._queued = 0
+
+    @property
+    def retry_after(self) -> int:
+        return max(1, math.ceil(self.queue_timeout))
+
+    def _queued_for(self, user_id: str) -> int:
+        return len(self._waiting.get(user_id, ()))
+
+    async def acquire(self, user_id: str):
+        if self._active_by_user[user_id] + self._queued_for(user_id) >= self.max_per_user:
+            raise Overloaded(
+                f"Too many concurrent {self.name} requests for this user (limit {self.max_per_user})",
+                status_code=429, retry_after=self.retry_after,
+            )
+        if self.active < self.max_concurrent and not self._queued:
+            self._grant(user_id)
+            return
+        if self._queued >= self.max_queue:
+            raise Overloaded(f"Server is busy with {self.name} requests, try again later",
+                             status_code=503, retry_after=self.retry_after)
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiting.setdefault(user_id, deque()).append(future)
+        self._queued += 1
+        try:
+            with span("admission.wait", route_class=self.name):
+                await asyncio.wait_for(future, self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._discard(user_id, future)
+            raise Overloaded(f"Timed out waiting for a free {self.name} slot, try again later",
+                             status_code=503, retry_after=self.retry_after)
+        except asyncio.CancelledError:
+            # Client went away: give the slot back if it was granted in the meantime
+            if future.done() and not future.cancelled():
+                self.release(user_id)
+            else:
+                self._discard(user_id, future)
+            raise
+
+    @asynccontextmanager
+    async def slot(self, user_id: str):
+        await self.acquire(user_id)
+        try:
+            yield
+        finally:
+            self.release(user_id)
+
+    def release(self, user_id: str):
+        self.active -= 1
+        self._active_by_user[user_id] -= 1
+        if self._active_by_user[user_id] <= 0:
+            del self._active_by_user[user_id]
+        self._dispatch()
+
+    def _grant(self, user_id: str):
+        self.active += 1
+        self._active_by_user[user_id] += 1
+
+    def _discard(self, user_id: str, future: asyncio.Future):
+        queue = self._waiting.get(user_id)
+        if queue is not None and future in queue:
+            queue.remove(future)
+            self._queued -= 1
+            if not queue:
+                del self._waiting[user_id]
+
+    def _dispatch(self):
+        while self.active < self.max_concurrent and self._waiting:
+            user_id, queue = next(iter(self._waiting.items()))
+            future = queue.popleft()
+            self._queued -= 1
+            # The user goes to the back of the line for their next request
+            del self._waiting[user_id]
+            if queue:
+                self._waiting[user_id] = queue
+            if future.done():
+                continue
+            self._grant(user_id)
+            future.set_result(None)
+
+
+limiters: Dict[str, RouteClassLimiter] = {
+    name: RouteClassLimiter(name, concurrency) for name, concurrency in ROUTE_CLASS_CONCURRENCY.items()
+}
+
+
+def overloaded(error: Overloaded) -> HTTPException:
+    return HTTPException(status_code=error.status_code, detail=str(error),
+                         headers={"Retry-After": str(error.retry_after)})
+
+
+def admit(route_class: str):
+    """Dependency that holds a slot of `route_class` for the duration of the request."""
+    limiter = limiters[route_class]
+
+    async def dependency(user: dict = Depends(get_current_user)):
+        user_id = user.get("sub")
+        try:
+            await limiter.acquire(user_id)
+        except Overloaded as e:
+            raise overloaded(e)
+        try:
+            yield
+        finally:
+            limiter.release(user_id)
+
+    return dependency
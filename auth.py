@@ -1,11 +1,14 @@
 import jwt
 import os
+import uuid
 from datetime import datetime, timedelta
 from db import db_manager  
 from dotenv import load_dotenv
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from functools import wraps
+from metrics import TOKEN_CHECKS
+from tracing import span
 
 load_dotenv()
 
@@ -21,14 +24,15 @@ oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/login")
 def create_access_token(data: dict):
     to_encode = data.copy()
     expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    to_encode.update({"exp": expire})
+    # jti keeps tokens issued within the same second distinct, so blacklisting one never hits its successor
+    to_encode.update({"exp": expire, "jti": uuid.uuid4().hex})
     return jwt.encode(to_encode, JWT_SECRET, algorithm=JWT_ALGORITHM)
 
 
 def create_refresh_token(data: dict):
     to_encode = data.copy()
     expire = datetime.utcnow() + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
-    to_encode.update({"exp": expire})
+    to_encode.update({"exp": expire, "jti": uuid.uuid4().hex})
     return jwt.encode(to_encode, JWT_SECRET, algorithm=JWT_ALGORITHM)
 
 
@@ -43,12 +47,19 @@ def decode_token(token: str) -> dict:
 
 
 def get_current_user(token: str = Depends(oauth2_scheme)) -> dict:
-    if db_manager.is_token_blacklisted(token):
+    with span("auth.is_token_blacklisted"):
+        blacklisted = db_manager.is_token_blacklisted(token)
+    if blacklisted:
+        TOKEN_CHECKS.labels("blacklisted").inc()
         raise HTTPException(status_code=401, detail="Token has been blacklisted")
 
     try:
-        return decode_token(token)
+        with span("auth.decode_token"):
+            payload = decode_token(token)
+        TOKEN_CHECKS.labels("valid").inc()
+        return payload
     except ValueError as e:
+        TOKEN_CHECKS.labels("invalid").inc()
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail=str(e),
@@ -56,14 +67,18 @@ def get_current_user(token: str = Depends(oauth2_scheme)) -> dict:
         )
 
 
+def ensure_admin(user: dict) -> dict:
+    if user.get("role") != "admin":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Admin privileges required",
+        )
+    return user
+
+
 def admin_only_route(route_func):
     @wraps(route_func)
     async def wrapper(*args, user: dict = Depends(get_current_user), **kwargs):
-        if user.get("role") != "admin":
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail="Admin privileges required",
-            )
-        return await route_func(*args, user=user, **kwargs)
+        return await route_func(*args, user=ensure_admin(user), **kwargs)
 
     return wrapper
\ No newline at end of file
@@ -0,0 +1,355 @@
+"""Micro-benchmarks for the quotation engine and inventory hot paths.
+
+Runs offline: MongoDB is replaced by the in-memory stand-in from
+memory_mongo.py, and routes are called directly (no HTTP). Each scenario is
+timed over several repeats, then run once more under tracemalloc for peak
+memory. Before timing, incrementally patched quotation sets are checked
+against full rebuilds after add, remove and reprice edits. Results can be
+saved as a baseline and later runs compared against it; a scenario whose
+median time or peak memory exceeds the baseline by more than --tolerance
+makes the run exit with status 1, if the baseline was recorded on the same
+host and Python (or with --strict).
+
+    python benchmark.py --save-baseline            # record benchmark_baseline.json
+    python benchmark.py                            # compare against it
+    python benchmark.py --panels 40 --inverters 20 --only generate
+"""
+import argparse
+import asyncio
+import gc
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+import memory_mongo
+
+memory_mongo.install()
+
+from bson import ObjectId  # noqa: E402
+
+import routes  # noqa: E402
+from db import db_manager  # noqa: E402
+from pricing import PricingRules  # noqa: E402
+from quotation_engine import QuotationSet, QuotationSpace, quotation_budget, quotation_sets  # noqa: E402
+
+BASELINE_FILE = "benchmark_baseline.json"
+# Arguments that shape the synthetic inventory; results are only comparable when these match
+SIZE_ARGS = ("panels", "inverters", "mounts", "earthing", "bos", "protection", "net_metering", "add_items", "seed")
+BENCH_USER = {"sub": "bench@example.com", "role": "admin"}
+
+
+def synthetic_rows(prefix: str, count: int, rng: random.Random):
+    return [
+        [f"{prefix}-{i:05d}", str(rng.randint(1, 50)), str(rng.randint(500, 60000)), str(rng.randint(50, 5000))]
+        for i in range(count)
+    ]
+
+
+def synthetic_inventory(args, rng: random.Random) -> dict:
+    sizes = {
+        "SolarPanels": args.panels,
+        "Inverters": args.inverters,
+        "MountingStructures": args.mounts,
+        "EarthingSystems": args.earthing,
+        "BOSComponents": args.bos,
+        "ProtectionEquipment": args.protection,
+        "NetMetering": args.net_metering,
+    }
+    inventory = {"user_id": BENCH_USER["sub"], "created_at": datetime.now(), "updated_at": datetime.now()}
+    for category, count in sizes.items():
+        inventory[category] = synthetic_rows(category, count, rng)
+    return inventory
+
+
+# GST slabs, a margin and discount tiers, for the priced generation scenario
+BENCH_PRICING_RULES = {
+    "gst_percent": {"default": 18, "SolarPanels": 12},
+    "margin_percent": {"default": 5, "Inverters": 10},
+    "volume_discounts": [{"min_subtotal": 50000, "percent": 2}, {"min_subtotal": 100000, "percent": 4}],
+    "include_row_profit": True,
+}
+
+
+def reset_database(inventory: dict):
+    for name in ("inventories", "users", "versions", "quotations", "inventory_snapshots", "pricing_rules"):
+        db_manager.collections[name].delete_many({})
+    db_manager.collections["inventories"].insert_one(dict(inventory))
+    db_manager.collections["users"].insert_one({
+        "email": BENCH_USER["sub"], "gstin": "22AAAAA0000A1Z5", "company_name": "Bench Solar",
+        "company_address": "1 Test Road", "phone": "0000000000", "created_at": datetime.utcnow(),
+    })
+    quotation_sets.invalidate(BENCH_USER["sub"])
+
+
+def build_scenarios(args, inventory: dict):
+    """Scenario name -> (setup, run). setup runs untimed before every repeat."""
+    rng = random.Random(args.seed + 1)
+    space = QuotationSpace({**inventory, "_id": ObjectId()})
+    full = space.size
+    new_rows = {
+        "Inverters": synthetic_rows("NewInverter", args.add_items, rng),
+        # Half of these repeat existing models and are skipped by the duplicate check
+        "SolarPanels": inventory["SolarPanels"][:args.add_items // 2] + synthetic_rows("NewPanel", args.add_items // 2, rng),
+    }
+    user_doc = {"_id": ObjectId(), "email": BENCH_USER["sub"], "created_at": datetime.utcnow(),
+                "updated_at": datetime.utcnow(), **{f"field_{i}": "x" * 20 for i in range(20)}}
+
+    def fresh():
+        reset_database(inventory)
+
+    def generate(**params):
+        return asyncio.run(routes.generate_user_quotations(user=BENCH_USER, **{
+            "max_quotations": None, "sample": None, "seed": None, **params,
+        }))
+
+    def add_items():
+        asyncio.run(routes.add_to_inventory(items=new_rows, user=BENCH_USER))
+
+    def save_and_read():
+        saved = asyncio.run(routes.save_user_quotations(max_quotations=None, sample=None, seed=None, user=BENCH_USER))
+        asyncio.run(routes.get_saved_quotations(saved["batch_id"], offset=0, limit=1000, user=BENCH_USER))
+
+    def warm():
+        fresh()
+        generate()
+
+    def priced():
+        fresh()
+        db_manager.save_pricing_rules(BENCH_USER["sub"], BENCH_PRICING_RULES)
+
+    return {
+        "quotation_space.build": (None, lambda: QuotationSpace({**inventory, "_id": ObjectId()})),
+        "quotation_space.summary": (None, lambda: space.summary(20)),
+        "quotation_space.sample_100": (None, lambda: space.quotations(space.sample_indices(100, args.seed))),
+        f"generate.all_{full}.cold": (fresh, generate),
+        f"generate.all_{full}.warm": (warm, generate),
+        f"generate.all_{full}.priced": (priced, generate),
+        "generate.first_100": (fresh, lambda: generate(max_quotations=100)),
+        "generate.sample_100": (fresh, lambda: generate(sample=100, seed=args.seed)),
+        f"add_to_inventory.{args.add_items * 2}_items": (fresh, add_items),
+        f"saved_batch.save_{full}_read_1000": (fresh, save_and_read),
+        "sanitize_mongo_document": (None, lambda: [routes.sanitize_mongo_document(user_doc) for _ in range(1000)]),
+    }
+
+
+def inventory_edits(inventory: dict, rng: random.Random) -> list:
+    """(description, edited inventory) steps, each applied on top of the previous one."""
+    def edit(change):
+        current = {**edited[-1][1]}
+        change(current)
+        edited.append((description, current))
+
+    def set_field(category: str, position: int, field: int, value: str):
+        def change(current):
+            rows = [list(row) for row in current[category]]
+            rows[position][field] = value
+            current[category] = rows
+        return change
+
+    edited = [("original", inventory)]
+    steps = [
+        ("add inverters and a BOS row", lambda current: current.update(
+            Inverters=current["Inverters"] + synthetic_rows("CheckInverter", 3, rng),
+            BOSComponents=current["BOSComponents"] + synthetic_rows("CheckBOS", 1, rng),
+        )),
+        ("remove a panel and a protection row", lambda current: current.update(
+            SolarPanels=current["SolarPanels"][1:], ProtectionEquipment=current["ProtectionEquipment"][1:],
+        )),
+        ("reprice a mounting structure", set_field("MountingStructures", 0, 2, "12345")),
+        ("reprice a net-metering row", set_field("NetMetering", 0, 2, "777")),
+        ("change a BOS row's profit only", set_field("BOSComponents", 0, 3, "4321")),
+        ("change an earthing system's profit only", set_field("EarthingSystems", 0, 3, "99")),
+        ("reprice a panel", set_field("SolarPanels", 0, 2, "31337")),
+    ]
+    for description, change in steps:
+        edit(change)
+    return edited[1:]
+
+
+def check_patched_sets(inventory: dict, seed: int) -> list:
+    """Patch a fully built QuotationSet through a series of edits, comparing it with a rebuild after each."""
+    failures = []
+    inventory_id = ObjectId()
+    for pricing in (None, PricingRules(BENCH_PRICING_RULES, version=1)):
+        label = "priced" if pricing else "plain"
+        space = QuotationSpace({**inventory, "_id": inventory_id}, pricing)
+        quotation_set = QuotationSet(space, 0, max_size=space.size)
+        quotation_set.quotations(space.iter_indices())
+        for version, (description, edited) in enumerate(inventory_edits(inventory, random.Random(seed)), 1):
+            space = QuotationSpace({**edited, "_id": inventory_id}, pricing)
+            quotation_set.patch(space, version)
+            indices = list(space.iter_indices())
+            wrong = sum(
+                patched != rebuilt
+                for patched, rebuilt in zip(quotation_set.quotations(indices), space.quotations(indices))
+            )
+            if wrong:
+                failures.append(f"{label}, after {description}: {wrong} of {len(indices)} quotations differ from a rebuild")
+    return failures
+
+
+def measure(setup, run, repeats: int) -> dict:
+    timings = []
+    for _ in range(repeats):
+        if setup:
+            setup()
+        # Like timeit: keep collector pauses out of the timings
+        gc.collect()
+        gc.disable()
+        try:
+            started = time.perf_counter()
+            run()
+            timings.append(time.perf_counter() - started)
+        finally:
+            gc.enable()
+
+    if setup:
+        setup()
+    tracemalloc.start()
+    try:
+        run()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "min_ms": round(min(timings) * 1000, 3),
+        "median_ms": round(statistics.median(timings) * 1000, 3),
+        "peak_kb": round(peak / 1024, 1),
+    }
+
+
+def environment() -> dict:
+    """Where timings were taken; only baselines from the same environment gate a run."""
+    return {"host": platform.node(), "python": platform.python_version(), "machine": platform.machine()}
+
+
+def compare(results: dict, baseline: dict, tolerance: float, noise_ms: float):
+    """Return (scenario, metric, baseline value, current value) for each regression.
+
+    Time is compared on the median repeat: between runs of the same code the
+    fastest repeat of a millisecond-scale case varies by more than 25%, the
+    median by far less. Changes smaller than noise_ms are ignored.
+    """
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if not previous:
+            continue
+        if (current["median_ms"] > previous["median_ms"] * (1 + tolerance)
+                and current["median_ms"] - previous["median_ms"] > noise_ms):
+            regressions.append((name, "median_ms", previous["median_ms"], current["median_ms"]))
+        if current["peak_kb"] > previous["peak_kb"] * (1 + tolerance):
+            regressions.append((name, "peak_kb", previous["peak_kb"], current["peak_kb"]))
+    return regressions
+
+
+def print_table(results: dict, baseline: dict):
+    print(f"{'scenario':44} {'min ms':>10} {'median ms':>10} {'peak KiB':>10} {'vs base':>8}")
+    for name, result in results.items():
+        previous = baseline.get(name, {}).get("median_ms")
+        change = f"{(result['median_ms'] / previous - 1) * 100:+.0f}%" if previous else "-"
+        print(f"{name:44} {result['min_ms']:>10.3f} {result['median_ms']:>10.3f} {result['peak_kb']:>10.1f} {change:>8}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark quotation and inventory hot paths offline")
+    parser.add_argument("--panels", type=int, default=20)
+    parser.add_argument("--inverters", type=int, default=10)
+    parser.add_argument("--mounts", type=int, default=5)
+    parser.add_argument("--earthing", type=int, default=4)
+    parser.add_argument("--bos", type=int, default=10)
+    parser.add_argument("--protection", type=int, default=5)
+    parser.add_argument("--net-metering", type=int, default=2)
+    parser.add_argument("--add-items", type=int, default=50, help="Rows per category posted to add_to_inventory")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--only", help="Run only scenarios whose name contains this text")
+    parser.add_argument("--baseline", default=BASELINE_FILE)
+    parser.add_argument("--save-baseline", action="store_true", help="Write results to --baseline instead of comparing")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown/growth before failing (0.25 = 25%%)")
+    parser.add_argument("--noise-ms", type=float, default=2.0, help="Ignore time changes smaller than this")
+    parser.add_argument("--confirm", type=int, default=2,
+                        help="Re-time a scenario that looks slower up to this many times before reporting it")
+    parser.add_argument("--strict", action="store_true",
+                        help="Fail on regressions even against a baseline recorded on another host or Python")
+    parser.add_argument("--output", help="Also write results as JSON to this file")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    # The benchmark measures the hot paths, not the admission limits
+    quotation_budget.per_request = quotation_budget.per_user = float("inf")
+
+    inventory = synthetic_inventory(args, random.Random(args.seed))
+    failures = check_patched_sets(inventory, args.seed)
+    for failure in failures:
+        print(f"MISMATCH {failure}")
+    if failures:
+        return 1
+
+    scenarios = build_scenarios(args, inventory)
+    results = {}
+    for name, (setup, run) in scenarios.items():
+        if args.only and args.only not in name:
+            continue
+        results[name] = measure(setup, run, args.repeats)
+
+    baseline, same_environment = {}, False
+    if not args.save_baseline and os.path.exists(args.baseline):
+        with open(args.baseline, "r") as file:
+            recorded = json.load(file)
+        differing = [arg for arg in SIZE_ARGS if recorded["args"].get(arg) != getattr(args, arg)]
+        if differing:
+            print(f"Baseline {args.baseline} was recorded with different {', '.join(differing)}; not comparing")
+        else:
+            baseline = recorded["results"]
+            same_environment = all(recorded.get(key) == value for key, value in environment().items())
+    # A shared machine has slow spells that can cover a whole scenario; only a slowdown that
+    # persists across re-timings counts, and the fastest median is kept
+    for _ in range(args.confirm):
+        suspects = {name for name, metric, _, _ in compare(results, baseline, args.tolerance, args.noise_ms)
+                    if metric == "median_ms"}
+        for name in suspects:
+            setup, run = scenarios[name]
+            retimed = measure(setup, run, args.repeats)
+            if retimed["median_ms"] < results[name]["median_ms"]:
+                results[name] = {**retimed, "peak_kb": results[name]["peak_kb"]}
+    print_table(results, baseline)
+
+    report = {
+        **environment(),
+        "created_at": datetime.utcnow().isoformat(),
+        "args": {key: value for key, value in vars(args).items() if key not in ("save_baseline", "output")},
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, "w") as file:
+            json.dump(report, file, indent=2)
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    regressions = compare(results, baseline, args.tolerance, args.noise_ms)
+    for name, metric, previous, current in regressions:
+        print(f"REGRESSION {name}: {metric} {previous} -> {current}")
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; run with --save-baseline to record one")
+    if regressions and not (same_environment or args.strict):
+        # Timings from another machine are a reference, not a gate
+        print("Baseline was recorded on another host or Python; not failing (use --strict to fail anyway)")
+        return 0
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,125 @@
+import logging
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from pymongo.errors import PyMongoError
+
+from db import db_manager, material_version_key, MATERIAL_TYPES
+from invalidation import invalidation_bus
+from metrics import cache_hit, cache_miss
+
+logger = logging.getLogger(__name__)
+
+# How often (seconds) a table checks its collection version in Mongo; this bounds staleness
+# for writes made by other processes. Writes made through this process are seen immediately.
+CATALOG_REFRESH_SECONDS = float(os.getenv("CATALOG_REFRESH_SECONDS", "5"))
+
+_MISSING = object()
+
+
+class MaterialTable:
+    """One material collection stored column-wise: field names once, one tuple per document."""
+
+    __slots__ = ("version", "fields", "rows", "checked_at")
+
+    def __init__(self, version: int, documents: List[Dict]):
+        fields: Dict[str, None] = {}
+        for document in documents:
+            fields.update(dict.fromkeys(document))
+        self.version = version
+        self.fields: Tuple[str, ...] = tuple(fields)
+        self.rows: List[tuple] = [
+            tuple(document.get(field, _MISSING) for field in self.fields) for document in documents
+        ]
+        self.checked_at = time.monotonic()
+
+    def to_dicts(self, fields: Optional[List[str]] = None) -> List[Dict]:
+        wanted = set(fields) | {"_id"} if fields else None
+        columns = [(i, field) for i, field in enumerate(self.fields) if wanted is None or field in wanted]
+        return [
+            {field: row[i] for i, field in columns if row[i] is not _MISSING}
+            for row in self.rows
+        ]
+
+
+class CatalogSnapshot:
+    """Lazily loaded, in-process copy of the material collections.
+
+    Each table remembers the collection version it was loaded at and re-checks
+    it at most every CATALOG_REFRESH_SECONDS. If Mongo is unreachable during a
+    check the previous table keeps being served.
+    """
+
+    def __init__(self, refresh_seconds: float = CATALOG_REFRESH_SECONDS):
+        self.refresh_seconds = refresh_seconds
+        self._tables: Dict[str, MaterialTable] = {}
+        self._lock = threading.Lock()
+
+    def _load(self, material_type: str) -> MaterialTable:
+        # The version is read first: a write racing the load bumps it and triggers another reload
+        version, documents = db_manager.load_materials(material_type)
+        for document in documents:
+            document["_id"] = str(document["_id"])
+        table = MaterialTable(version, documents)
+        self._tables[material_type] = table
+        return table
+
+    def table(self, material_type: str) -> MaterialTable:
+        if material_type not in MATERIAL_TYPES:
+            raise ValueError(f"Invalid material type: {material_type}")
+        table = self._tables.get(material_type)
+        if table is not None and time.monotonic() - table.checked_at < self.refresh_seconds:
+            cache_hit("catalog_snapshot")
+            return table
+
+        with self._lock:
+            table = self._tables.get(material_type)
+            if table is None:
+                cache_miss("catalog_snapshot")
+                return self._load(material_type)
+            if time.monotonic() - table.checked_at < self.refresh_seconds:
+                cache_hit("catalog_snapshot")
+                return table
+            # A database hiccup at either step serves the cached table until the next check
+            try:
+                version = db_manager.get_version(material_version_key(material_type))
+            except PyMongoError as e:
+                logger.warning("Serving cached %s catalog, version check failed: %s", material_type, e)
+                version = table.version
+            if version != table.version:
+                cache_miss("catalog_snapshot")
+                try:
+                    return self._load(material_type)
+                except PyMongoError as e:
+                    logger.warning("Serving cached %s catalog at version %d, reload failed: %s",
+                                   material_type, table.version, e)
+            table.checked_at = time.monotonic()
+            cache_hit("catalog_snapshot")
+            return table
+
+    def get(self, material_type: str, fields: Optional[List[str]] = None) -> List[Dict]:
+        return self.table(material_type).to_dicts(fields)
+
+    def invalidate(self, material_type: str, *_):
+        # Force a version check on the next read; used as a db_manager material listener
+        table = self._tables.get(material_type)
+        if table is not None:
+            table.checked_at = float("-inf")
+
+    def expire(self, material_type: str, version: int):
+        # Another worker wrote the collection; used as an invalidation bus subscriber
+        table = self._tables.get(material_type)
+        if table is not None and table.version < version:
+            table.checked_at = float("-inf")
+
+    def invalidate_all(self):
+        for material_type in list(self._tables):
+            self.invalidate(material_type)
+
+
+catalog_snapshot = CatalogSnapshot()
+db_manager.material_listeners.append(catalog_snapshot.invalidate)
+invalidation_bus.subscribe("material", catalog_snapshot.expire)
+invalidation_bus.on_reset(catalog_snapshot.invalidate_all)
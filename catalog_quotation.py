@@ -0,0 +1,227 @@
+import bisect
+import heapq
+import math
+import os
+import re
+import uuid
+from typing import Dict, List
+
+from db import db_manager
+from models import (
+    ComponentQuotation, MountingQuotation, QuotationFilterRequest, QuotationOption, QuotationResponse,
+)
+
+# An inverter may be undersized relative to the array by at most this DC/AC ratio...
+MAX_DC_AC_RATIO = float(os.getenv("MAX_DC_AC_RATIO", "1.3"))
+# ...and oversized by at most this factor.
+MAX_INVERTER_OVERSIZE = float(os.getenv("MAX_INVERTER_OVERSIZE", "1.5"))
+
+PANEL_FIELDS = {"brand": 1, "model_number": 1, "power_w": 1, "efficiency_percent": 1, "quantity": 1, "rate": 1, "profit": 1}
+INVERTER_FIELDS = {
+    "brand": 1, "model_number": 1, "efficiency_percent": 1, "mppt_channels": 1, "warranty": 1,
+    "capacity_kw": 1, "rate": 1, "profit": 1,
+}
+MOUNT_FIELDS = {"brand": 1, "material": 1, "coating_type": 1, "specifications": 1, "warranty": 1, "rate": 1, "profit": 1}
+EXTRA_FIELDS = {"brand": 1, "model": 1, "component_type": 1, "specifications": 1, "warranty": 1, "rate": 1, "profit": 1}
+
+_NUMBER_RE = re.compile(r"\d+(?:\.\d+)?")
+
+
+def parse_power_w(value) -> float:
+    # power_w is free text in the catalog ("540", "540W", "540 Wp")
+    if isinstance(value, (int, float)):
+        return float(value)
+    match = _NUMBER_RE.search(str(value or ""))
+    return float(match.group()) if match else 0.0
+
+
+def _one_of(values: List[str]):
+    return values[0] if len(values) == 1 else {"$in": values}
+
+
+def _price(cost: float, profit: float) -> float:
+    # Catalog profit is a margin fraction on cost
+    return cost * (1 + profit)
+
+
+def _find(material_type: str, query: Dict, fields: Dict) -> List[Dict]:
+    # Catalog quotations tolerate replica lag, so these reads may go to a secondary
+    return list(db_manager.secondary(material_type).find(query, fields))
+
+
+def _sized_panels(request: QuotationFilterRequest) -> List[Dict]:
+    """Panels in stock for the target capacity, with their count and cost, sorted by array size."""
+    query = {"quantity": {"$gt": 0}}
+    if request.panel_brands:
+        query["brand"] = _one_of(request.panel_brands)
+
+    target_w = request.system_capacity_kw * 1000
+    panels = []
+    for panel in _find("solar_panel", query, PANEL_FIELDS):
+        power_w = parse_power_w(panel.get("power_w"))
+        if power_w <= 0:
+            continue
+        count = max(1, math.ceil(round(target_w / power_w, 6)))
+        if count > panel.get("quantity", 0):
+            continue
+        cost = panel.get("rate", 0) * count
+        panels.append({
+            **panel,
+            "power": power_w,
+            "count": count,
+            "array_kw": count * power_w / 1000,
+            "cost": cost,
+            "price": _price(cost, panel.get("profit", 0)),
+        })
+    panels.sort(key=lambda panel: panel["array_kw"])
+    return panels
+
+
+def _candidate_inverters(request: QuotationFilterRequest, panels: List[Dict]) -> List[Dict]:
+    query = {"quantity": {"$gt": 0}}
+    if request.inverter_brands:
+        query["brand"] = _one_of(request.inverter_brands)
+    # Only inverters that fit at least one sized array; unrated inverters are kept
+    query["$or"] = [
+        {"capacity_kw": None},
+        {"capacity_kw": {
+            "$gte": panels[0]["array_kw"] / MAX_DC_AC_RATIO,
+            "$lte": panels[-1]["array_kw"] * MAX_INVERTER_OVERSIZE,
+        }},
+    ]
+    inverters = _find("inverter", query, INVERTER_FIELDS)
+    for inverter in inverters:
+        inverter["cost"] = inverter.get("rate", 0)
+        inverter["price"] = _price(inverter["cost"], inverter.get("profit", 0))
+    return inverters
+
+
+def _candidate_mounts(request: QuotationFilterRequest, limit: int) -> List[Dict]:
+    query = {"quantity": {"$gt": 0}}
+    if request.mounting_material:
+        query["material"] = _one_of(request.mounting_material)
+    if request.mounting_coating:
+        query["coating_type"] = _one_of(request.mounting_coating)
+    mounts = _find("mounting_structure", query, MOUNT_FIELDS)
+    for mount in mounts:
+        mount["cost"] = mount.get("rate", 0)
+        mount["price"] = _price(mount["cost"], mount.get("profit", 0))
+    # Only the cheapest mounts can appear among the cheapest options
+    return heapq.nsmallest(limit, mounts, key=lambda mount: mount["price"])
+
+
+def _compatible_pairs(panels: List[Dict], inverters: List[Dict]):
+    """Yield (price, panel index, inverter index) for pairs whose sizes are compatible."""
+    array_sizes = [panel["array_kw"] for panel in panels]
+    for inverter_index, inverter in enumerate(inverters):
+        capacity = inverter.get("capacity_kw")
+        if capacity:
+            # Panels are sorted by array size, so compatible panels form one contiguous range
+            start = bisect.bisect_left(array_sizes, capacity / MAX_INVERTER_OVERSIZE)
+            end = bisect.bisect_right(array_sizes, capacity * MAX_DC_AC_RATIO)
+        else:
+            start, end = 0, len(panels)
+        for panel_index in range(start, end):
+            yield panels[panel_index]["price"] + inverter["price"], panel_index, inverter_index
+
+
+def _component(item: Dict, model: str, specifications: str, cost: float) -> ComponentQuotation:
+    profit = item.get("profit", 0)
+    return ComponentQuotation(
+        id=str(item["_id"]),
+        brand=item.get("brand", ""),
+        model=model,
+        specifications=specifications,
+        warranty=item.get("warranty", 0),
+        cost=cost,
+        profit=profit,
+        total_price=_price(cost, profit),
+    )
+
+
+def build_catalog_quotations(request: QuotationFilterRequest) -> QuotationResponse:
+    """Cheapest catalog systems for request.system_capacity_kw.
+
+    Filters are pushed into Mongo, panels are sized from power_w, and
+    inverter/panel pairs that cannot serve the capacity are dropped before
+    combining with mounting structures, so work grows with the number of
+    compatible pairs instead of with panels x inverters x mounts.
+    """
+    limit = request.max_options
+    empty = QuotationResponse(quotation_options=[], total_options=0, system_capacity_kw=request.system_capacity_kw)
+
+    panels = _sized_panels(request)
+    if not panels:
+        return empty
+    inverters = _candidate_inverters(request, panels)
+    mounts = _candidate_mounts(request, limit)
+    if not inverters or not mounts:
+        return empty
+
+    cheapest_pairs = heapq.nsmallest(limit, _compatible_pairs(panels, inverters))
+    options = heapq.nsmallest(
+        limit,
+        ((pair_price + mount["price"], panel_index, inverter_index, mount_index)
+         for pair_price, panel_index, inverter_index in cheapest_pairs
+         for mount_index, mount in enumerate(mounts)),
+    )
+
+    # BOS and protection equipment are part of every system
+    bos_components = [
+        _component(item, item.get("component_type", ""), item.get("specifications", ""), item.get("rate", 0))
+        for item in _find("bos_component", {}, EXTRA_FIELDS)
+    ]
+    protection_equipment = [
+        _component(item, item.get("model", ""), item.get("specifications", ""), item.get("rate", 0))
+        for item in _find("protection_equipment", {}, EXTRA_FIELDS)
+    ]
+    extras = bos_components + protection_equipment
+    extras_cost = sum(item.cost for item in extras)
+    extras_profit = sum(item.cost * item.profit for item in extras)
+
+    quotation_options = []
+    for i, (_, panel_index, inverter_index, mount_index) in enumerate(options):
+        panel, inverter, mount = panels[panel_index], inverters[inverter_index], mounts[mount_index]
+
+        inverter_quotation = _component(
+            inverter, inverter.get("model_number", ""),
+            f"{inverter.get('efficiency_percent', 0)}% efficiency, {inverter.get('mppt_channels', 0)} MPPT channels",
+            inverter["cost"],
+        )
+        panel_quotation = _component(
+            panel, panel.get("model_number", ""),
+            f"{panel['power']:g}W, {panel.get('efficiency_percent', 0)}% efficiency, {panel['count']} panels",
+            panel["cost"],
+        )
+        mounting_quotation = MountingQuotation(
+            id=str(mount["_id"]),
+            material=mount.get("material", ""),
+            coating_type=mount.get("coating_type") or "",
+            brand=mount.get("brand", ""),
+            specifications=mount.get("specifications", ""),
+            warranty=mount.get("warranty", 0),
+            cost=mount["cost"],
+            profit=mount.get("profit", 0),
+            total_price=mount["price"],
+        )
+
+        main_components = (inverter_quotation, panel_quotation, mounting_quotation)
+        total_system_cost = sum(item.cost for item in main_components) + extras_cost
+        total_profit = sum(item.cost * item.profit for item in main_components) + extras_profit
+        quotation_options.append(QuotationOption(
+            quotation_id=f"QT-{i+1}-{uuid.uuid4().hex[:6]}",
+            inverter=inverter_quotation,
+            solar_panel=panel_quotation,
+            mounting_structure=mounting_quotation,
+            bos_components=bos_components,
+            protection_equipment=protection_equipment,
+            total_system_cost=total_system_cost,
+            total_profit=total_profit,
+            total_price=total_system_cost + total_profit,
+        ))
+
+    return QuotationResponse(
+        quotation_options=quotation_options,
+        total_options=len(quotation_options),
+        system_capacity_kw=request.system_capacity_kw,
+    )
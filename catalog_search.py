@@ -0,0 +1,203 @@
+import heapq
+import re
+import threading
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from db import db_manager, MATERIAL_TYPES
+from invalidation import invalidation_bus
+
+# Longest prefix kept in the autocomplete index; longer query tokens are
+# resolved by checking candidates against their full tokens.
+MAX_PREFIX_LENGTH = 16
+DEFAULT_RESULT_LIMIT = 10
+
+# Field -> weight used when ranking matches
+SEARCH_FIELDS = {
+    "model_number": 3.0,
+    "model": 3.0,
+    "brand": 2.0,
+    "specifications": 1.0,
+}
+# First field present is shown as the "model" of an item
+LABEL_FIELDS = ("model_number", "model", "component_type", "structure_type", "type", "meter_type")
+# Fields loaded from Mongo to build the index
+INDEX_PROJECTION = {field: 1 for field in (*SEARCH_FIELDS, *LABEL_FIELDS, "rate")}
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text) -> List[str]:
+    if text is None:
+        return []
+    return _TOKEN_RE.findall(str(text).lower())
+
+
+class CatalogSearchIndex:
+    """In-memory prefix/token index over every catalog collection.
+
+    Every prefix of every token maps to {entry id: score}, so a keystroke is
+    answered from precomputed, score-ordered candidate lists. The index is built
+    from Mongo on the first search and then kept current through
+    db_manager.material_listeners, so searches never hit the database. Writes
+    made by other workers arrive over the invalidation bus and mark their
+    material type stale; the next search re-reads that collection.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._built = False
+        # Material types written by other workers since they were last loaded
+        self._stale: Set[str] = set()
+        self._entries: Dict[str, dict] = {}
+        # id -> {token: best field weight}
+        self._entry_tokens: Dict[str, Dict[str, float]] = {}
+        # prefix -> {id: score of the item for a query token equal to prefix}
+        self._prefixes: Dict[str, Dict[str, float]] = {}
+        # prefix -> [(score, id)] best first; dropped whenever the prefix changes
+        self._ranked: Dict[str, List[Tuple[float, str]]] = {}
+
+    # ------------------ maintenance ------------------
+
+    def _index(self, material_type: str, material: dict):
+        entry_id = str(material["_id"])
+        self._unindex(entry_id)
+
+        tokens: Dict[str, float] = {}
+        for field, weight in SEARCH_FIELDS.items():
+            for token in tokenize(material.get(field)):
+                tokens[token] = max(tokens.get(token, 0.0), weight)
+        label = next((material[field] for field in LABEL_FIELDS if material.get(field)), "")
+        for token in tokenize(label):
+            tokens.setdefault(token, SEARCH_FIELDS["model"])
+
+        self._entries[entry_id] = {
+            "id": entry_id,
+            "material_type": material_type,
+            "brand": material.get("brand", ""),
+            "model": label,
+            "specifications": material.get("specifications", ""),
+            "rate": material.get("rate"),
+        }
+        self._entry_tokens[entry_id] = tokens
+        for prefix, score in self._prefix_scores(tokens).items():
+            self._prefixes.setdefault(prefix, {})[entry_id] = score
+            self._ranked.pop(prefix, None)
+
+    def _unindex(self, entry_id: str):
+        tokens = self._entry_tokens.pop(entry_id, None)
+        if tokens is None:
+            return
+        self._entries.pop(entry_id, None)
+        for prefix in self._prefix_scores(tokens):
+            scores = self._prefixes.get(prefix)
+            if scores is not None:
+                scores.pop(entry_id, None)
+                if not scores:
+                    del self._prefixes[prefix]
+            self._ranked.pop(prefix, None)
+
+    @staticmethod
+    def _prefix_scores(tokens: Dict[str, float]) -> Dict[str, float]:
+        # Whole-token matches outrank prefix matches, longer prefixes outrank shorter ones
+        scores: Dict[str, float] = {}
+        for token, weight in tokens.items():
+            for end in range(1, min(len(token), MAX_PREFIX_LENGTH) + 1):
+                prefix = token[:end]
+                score = weight * 2 if end == len(token) else weight * end / len(token)
+                if score > scores.get(prefix, 0.0):
+                    scores[prefix] = score
+        return scores
+
+    def add(self, material_type: str, materials: Iterable[dict]):
+        """Index (or re-index) materials; used as a db_manager material listener."""
+        with self._lock:
+            for material in materials:
+                self._index(material_type, material)
+
+    def rebuild(self, material_types: Iterable[str] = MATERIAL_TYPES):
+        material_types = list(material_types)
+        # Clear first: a write marking a type stale during the load is picked up next time
+        self._stale.difference_update(material_types)
+        loaded: List[Tuple[str, dict]] = []
+        for material_type in material_types:
+            _, materials = db_manager.load_materials(material_type, INDEX_PROJECTION)
+            loaded.extend((material_type, material) for material in materials)
+        with self._lock:
+            # Entries added by listeners while loading are simply re-indexed
+            for material_type, material in loaded:
+                self._index(material_type, material)
+            self._built = True
+
+    def ensure_built(self):
+        if not self._built:
+            self.rebuild()
+        elif self._stale:
+            self.rebuild(self._stale & set(MATERIAL_TYPES))
+
+    def mark_stale(self, material_type: str, *_):
+        # Used as an invalidation bus subscriber; batches of remote writes cost one reload
+        self._stale.add(material_type)
+
+    def mark_all_stale(self):
+        self._stale.update(MATERIAL_TYPES)
+
+    # ------------------ queries ------------------
+
+    def _ranked_for(self, prefix: str) -> List[Tuple[float, str]]:
+        ranked = self._ranked.get(prefix)
+        if ranked is None:
+            ranked = sorted(((score, entry_id) for entry_id, score in self._prefixes[prefix].items()), reverse=True)
+            self._ranked[prefix] = ranked
+        return ranked
+
+    def _matches_long_token(self, entry_id: str, query_token: str) -> bool:
+        return any(token.startswith(query_token) for token in self._entry_tokens[entry_id])
+
+    def search(self, query: str, limit: int = DEFAULT_RESULT_LIMIT,
+               material_types: Optional[List[str]] = None) -> List[dict]:
+        """Return the best matches where every query token prefixes a token of the item."""
+        query_tokens = list(dict.fromkeys(tokenize(query)))
+        if not query_tokens:
+            return []
+        self.ensure_built()
+
+        with self._lock:
+            prefixes = [token[:MAX_PREFIX_LENGTH] for token in query_tokens]
+            if any(prefix not in self._prefixes for prefix in prefixes):
+                return []
+            long_tokens = [token for token in query_tokens if len(token) > MAX_PREFIX_LENGTH]
+
+            # Walk the smallest candidate list best-first and look the item up in the others
+            prefixes.sort(key=lambda prefix: len(self._prefixes[prefix]))
+            driver, others = prefixes[0], [self._prefixes[prefix] for prefix in prefixes[1:]]
+            # Best score any item can still collect from the other tokens, for early exit
+            others_bound = sum(self._ranked_for(prefix)[0][0] for prefix in prefixes[1:])
+
+            best: List[Tuple[float, str]] = []
+            for driver_score, entry_id in self._ranked_for(driver):
+                if len(best) == limit and best[0][0] >= driver_score + others_bound:
+                    break
+                if material_types and self._entries[entry_id]["material_type"] not in material_types:
+                    continue
+                total = driver_score
+                for scores in others:
+                    score = scores.get(entry_id)
+                    if score is None:
+                        break
+                    total += score
+                else:
+                    if long_tokens and not all(self._matches_long_token(entry_id, token) for token in long_tokens):
+                        continue
+                    if len(best) < limit:
+                        heapq.heappush(best, (total, entry_id))
+                    elif (total, entry_id) > best[0]:
+                        heapq.heapreplace(best, (total, entry_id))
+
+            best.sort(reverse=True)
+            return [{**self._entries[entry_id], "score": round(score, 3)} for score, entry_id in best]
+
+
+catalog_index = CatalogSearchIndex()
+db_manager.material_listeners.append(catalog_index.add)
+invalidation_bus.subscribe("material", catalog_index.mark_stale)
+invalidation_bus.on_reset(catalog_index.mark_all_stale)
@@ -1,37 +1,208 @@
-from pymongo import MongoClient, ASCENDING
-from typing import Dict, List, Optional
+from pymongo import MongoClient, ASCENDING, DESCENDING, ReturnDocument, UpdateOne
+from pymongo.client_session import ClientSession
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from pymongo.read_preferences import SecondaryPreferred
+from bson import ObjectId, json_util
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+import base64
+import hashlib
+import json
+import logging
 import os
+import threading
 from datetime import datetime
+import uuid
+import pymongo
 import bcrypt
 import dotenv
 
+from metrics import MongoCommandMetrics
+from tracing import MongoTracing
+from pricing import PricingRules
+from quotation_engine import CONFIGURABLE_CATEGORIES, FIXED_CATEGORIES, QuotationSpace
+
 dotenv.load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+MATERIAL_TYPES = (
+    "solar_panel",
+    "inverter",
+    "mounting_structure",
+    "bos_component",
+    "protection_equipment",
+    "earthing_system",
+    "net_metering",
+)
+
+# Fields identifying a catalog item; batch ingestion upserts on these so re-runs are idempotent
+MATERIAL_KEY_FIELDS = {
+    "solar_panel": ("brand", "model_number"),
+    "inverter": ("brand", "model_number"),
+    "mounting_structure": ("brand", "structure_type", "specifications"),
+    "bos_component": ("brand", "component_type", "specifications"),
+    "protection_equipment": ("brand", "model"),
+    "earthing_system": ("brand", "type", "specifications"),
+    "net_metering": ("brand", "model"),
+}
+
+# Catalog listings can be sorted on these fields; each has a supporting (field, _id) index
+MATERIAL_SORT_FIELDS = ("_id", "brand", "rate", "created_at")
+
+# Saved quotations per document in the quotations collection
+SAVED_QUOTATION_CHUNK_SIZE = 1000
+
+# Catalog and quotation reads go to secondaries lagging at most this much (MongoDB's minimum is 90)
+SECONDARY_READS = os.getenv("SECONDARY_READS", "1").lower() not in ("0", "false", "off")
+READ_MAX_STALENESS_SECONDS = max(90, int(os.getenv("READ_MAX_STALENESS_SECONDS", "90")))
+
+# Collections whose reads may be served by secondaries
+SECONDARY_READ_COLLECTIONS = (*MATERIAL_TYPES, "inventories", "quotations", "inventory_snapshots")
+
+# db_manager.collections key -> collection name
+COLLECTION_NAMES = {
+    "solar_panel": "solar_panels",
+    "inverter": "inverters",
+    "mounting_structure": "mounting_structures",
+    "bos_component": "bos_components",
+    "protection_equipment": "protection_equipments",
+    "earthing_system": "earthing_systems",
+    "net_metering": "net_meterings",
+    "quotations": "quotations",
+    "inventories": "inventories",
+    "users": "users",
+    "blacklisted_tokens": "blacklisted_tokens",
+    "refresh_tokens": "refresh_tokens",
+    "access_tokens": "access_tokens",
+    "versions": "versions",
+    "inventory_snapshots": "inventory_snapshots",
+    "pricing_rules": "pricing_rules",
+}
+
+
+def encode_cursor(sort_value, last_id) -> str:
+    payload = json_util.dumps([sort_value, last_id])
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple:
+    try:
+        sort_value, last_id = json_util.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+    except Exception:
+        raise ValueError("Invalid cursor")
+    return sort_value, last_id
+
+
+def material_version_key(material_type: str) -> str:
+    return f"material:{material_type}"
+
+
+def inventory_version_key(user_id: str) -> str:
+    return f"inventory:{user_id}"
+
+
+def pricing_version_key(user_id: str) -> str:
+    return f"pricing:{user_id}"
+
+
 class MongoDBManager:
+    """Data access for the API.
+
+    Reads are routed per operation. Tokens, users, versions and every read
+    that precedes a write stay on the primary. Catalog reads go to
+    secondaries. Inventory and saved-quotation reads go to secondaries inside
+    a causal_session that first read a version on the primary, so the
+    secondary waits until it has applied that version and the caller still
+    reads its own writes.
+    """
+
     def __init__(self):
-        mongo_uri = os.environ.get("MONGO_URI")
-        if not mongo_uri:
-            raise ValueError("MONGO_URI environment variable not set")
-        self.client = MongoClient(mongo_uri)
-        self.db = self.client["solar_quotation_system"]
-
-        self.collections = {
-            "solar_panel": self.db["solar_panels"],
-            "inverter": self.db["inverters"],
-            "mounting_structure": self.db["mounting_structures"],
-            "bos_component": self.db["bos_components"],
-            "protection_equipment": self.db["protection_equipments"],
-            "earthing_system": self.db["earthing_systems"],
-            "net_metering": self.db["net_meterings"],
-            "quotations": self.db["quotations"],
-            "inventories": self.db["inventories"],
-            "users": self.db["users"],
-            "blacklisted_tokens": self.db["blacklisted_tokens"],
-            "refresh_tokens": self.db["refresh_tokens"],
-            "access_tokens": self.db["access_tokens"],
-        }
+        # The client is created on first use and indexes are built by ensure_indexes (run in the
+        # background by the app lifespan), so importing this module never waits on the network
+        self._client = None
+        self._db = None
+        self._collections = None
+        self._secondary_collections = None
+        self._lock = threading.Lock()
+        # pending -> building -> ready, or failed until a retry succeeds
+        self.index_state = "pending"
+
+        # Called with (material_type, documents) after catalog writes, e.g. to update in-memory indexes
+        self.material_listeners: List[Callable[[str, List[Dict]], None]] = []
+        # Called with (key, new version) after every bump_version, e.g. to tell other workers
+        self.version_listeners: List[Callable[[str, int], None]] = []
+
+    def _connect(self):
+        with self._lock:
+            if self._client is not None:
+                return
+            mongo_uri = os.environ.get("MONGO_URI")
+            if not mongo_uri:
+                raise ValueError("MONGO_URI environment variable not set")
+            # connect=False: servers are contacted by the first operation, not here
+            client = MongoClient(mongo_uri, connect=False, event_listeners=[MongoCommandMetrics(), MongoTracing()])
+            self._db = client["solar_quotation_system"]
+            self._collections = {key: self._db[name] for key, name in COLLECTION_NAMES.items()}
+            read_preference = SecondaryPreferred(max_staleness=READ_MAX_STALENESS_SECONDS)
+            self._secondary_collections = {
+                key: self._collections[key].with_options(read_preference=read_preference) if SECONDARY_READS
+                else self._collections[key]
+                for key in SECONDARY_READ_COLLECTIONS
+            }
+            self._client = client
+
+    @property
+    def client(self) -> MongoClient:
+        if self._client is None:
+            self._connect()
+        return self._client
+
+    @property
+    def db(self):
+        if self._client is None:
+            self._connect()
+        return self._db
+
+    @property
+    def collections(self) -> Dict:
+        if self._client is None:
+            self._connect()
+        return self._collections
 
-        self._ensure_ttl_index()
+    def secondary(self, key: str):
+        """The collection for key, reading from a secondary when one is fresh enough."""
+        if self._client is None:
+            self._connect()
+        return self._secondary_collections[key]
+
+    @contextmanager
+    def causal_session(self) -> Iterator[ClientSession]:
+        # Each read in the session sees at least what the previous one saw, even across members
+        with self.client.start_session(causal_consistency=True) as session:
+            yield session
+
+    def ping(self, timeout: float):
+        """Round trip to the server; raises if it cannot be reached within timeout seconds."""
+        with pymongo.timeout(timeout):
+            self.client.admin.command("ping")
+
+    def ensure_indexes(self):
+        self.index_state = "building"
+        try:
+            self._ensure_ttl_index()
+            self._ensure_material_indexes()
+            self._ensure_quotation_indexes()
+        except Exception:
+            self.index_state = "failed"
+            raise
+        self.index_state = "ready"
+
+    def close(self):
+        with self._lock:
+            if self._client is not None:
+                self._client.close()
+            self._client = self._db = self._collections = self._secondary_collections = None
 
     def _ensure_ttl_index(self):
         self.collections["blacklisted_tokens"].create_index(
@@ -49,6 +220,50 @@ class MongoDBManager:
             expireAfterSeconds=604800
         )
 
+    def _ensure_material_indexes(self):
+        # Keyset pagination walks (sort_field, _id); brand filters combine with rate sorting
+        for material_type in MATERIAL_TYPES:
+            collection = self.collections[material_type]
+            for field in MATERIAL_SORT_FIELDS[1:]:
+                collection.create_index([(field, ASCENDING), ("_id", ASCENDING)])
+            collection.create_index([("brand", ASCENDING), ("rate", ASCENDING), ("_id", ASCENDING)])
+            self._ensure_material_key_index(material_type)
+        self.collections["solar_panel"].create_index(
+            [("technology", ASCENDING), ("rate", ASCENDING), ("_id", ASCENDING)]
+        )
+        # Catalog quotations filter on these
+        self.collections["inverter"].create_index([("brand", ASCENDING), ("capacity_kw", ASCENDING)])
+        self.collections["mounting_structure"].create_index([("material", ASCENDING), ("coating_type", ASCENDING)])
+
+    def _ensure_material_key_index(self, material_type: str):
+        # Unique, so concurrent batches carrying the same item cannot both insert it
+        collection = self.collections[material_type]
+        keys = [(field, ASCENDING) for field in MATERIAL_KEY_FIELDS[material_type]]
+        name = "_".join(f"{field}_1" for field in MATERIAL_KEY_FIELDS[material_type])
+        existing = collection.index_information().get(name)
+        if existing and existing.get("unique"):
+            return
+        if existing:
+            # Non-unique index from before keys were enforced; the same keys cannot carry two indexes
+            collection.drop_index(name)
+        try:
+            collection.create_index(keys, unique=True)
+        except DuplicateKeyError as e:
+            # Data written before the index existed may repeat a key; keep serving and say what to clean up
+            collection.create_index(keys)
+            logger.error(
+                "%s has items sharing %s, so the key index is not unique and upserts of those items may "
+                "insert duplicates. Remove the duplicates and restart to enforce it: %s",
+                COLLECTION_NAMES[material_type], ", ".join(MATERIAL_KEY_FIELDS[material_type]), e,
+            )
+
+    def _ensure_quotation_indexes(self):
+        self.collections["quotations"].create_index([("batch_id", ASCENDING), ("position", ASCENDING)])
+        self.collections["inventory_snapshots"].create_index(
+            [("user_id", ASCENDING), ("content_hash", ASCENDING)], unique=True
+        )
+        self.collections["pricing_rules"].create_index([("user_id", ASCENDING)], unique=True)
+
     # ------------------ BLACKLIST FUNCTIONS ------------------
 
     def blacklist_token(self, token: str):
@@ -100,6 +315,25 @@ class MongoDBManager:
     def clear_all_refresh_tokens(self, username: str):
         self.collections["refresh_tokens"].delete_many({"username": username})
 
+    # ------------------ VERSION FUNCTIONS ------------------
+    # Monotonic counters bumped after every write, used for ETags on reads
+
+    def get_version(self, key: str, session: Optional[ClientSession] = None) -> int:
+        # Always the primary: inside a causal_session this is what later secondary reads wait for
+        version_doc = self.collections["versions"].find_one({"_id": key}, session=session)
+        return version_doc["version"] if version_doc else 0
+
+    def bump_version(self, key: str) -> int:
+        version_doc = self.collections["versions"].find_one_and_update(
+            {"_id": key},
+            {"$inc": {"version": 1}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        for listener in self.version_listeners:
+            listener(key, version_doc["version"])
+        return version_doc["version"]
+
     # ------------------ MATERIAL FUNCTIONS ------------------
 
     def add_material(self, material_type: str, material_data: Dict) -> str:
@@ -107,35 +341,311 @@ class MongoDBManager:
             raise ValueError(f"Invalid material type: {material_type}")
         material_data["created_at"] = datetime.now()
         result = self.collections[material_type].insert_one(material_data)
+        self.bump_version(material_version_key(material_type))
+        self._notify_material_listeners(material_type, [material_data])
         return str(result.inserted_id)
 
-    def get_all_materials(self, material_type: str, user_id: Optional[str] = None) -> List[Dict]:
-        if material_type not in self.collections:
+    def upsert_materials(self, material_type: str, materials: List[Dict]) -> List[Dict]:
+        """Upsert materials by their key fields in one unordered bulk write.
+
+        Returns one {"status", "id"/"error"} result per input item, in input order.
+        """
+        if material_type not in MATERIAL_KEY_FIELDS:
+            raise ValueError(f"Invalid material type: {material_type}")
+        key_fields = MATERIAL_KEY_FIELDS[material_type]
+        now = datetime.now()
+
+        operations, keys = [], []
+        for material in materials:
+            key = {field: material.get(field) for field in key_fields}
+            data = {field: value for field, value in material.items() if field not in ("_id", "created_at")}
+            data["updated_at"] = now
+            operations.append(UpdateOne(key, {"$set": data, "$setOnInsert": {"created_at": now}}, upsert=True))
+            keys.append(key)
+
+        results = [{"status": "updated"} for _ in materials]
+        if not operations:
+            return results
+        pending = list(range(len(operations)))
+        # An upsert racing another writer's insert of the same key fails on the unique key index;
+        # retried once, it finds that item and updates it
+        for attempt in range(2):
+            try:
+                bulk_result = self.collections[material_type].bulk_write(
+                    [operations[index] for index in pending], ordered=False
+                )
+                upserted_ids, write_errors = bulk_result.upserted_ids, []
+            except BulkWriteError as e:
+                upserted_ids = {item["index"]: item["_id"] for item in e.details.get("upserted", [])}
+                write_errors = e.details.get("writeErrors", [])
+            for position, upserted_id in upserted_ids.items():
+                results[pending[position]] = {"status": "inserted", "id": str(upserted_id)}
+            retry = []
+            for error in write_errors:
+                index = pending[error["index"]]
+                if error.get("code") == 11000 and attempt == 0:
+                    retry.append(index)
+                else:
+                    results[index] = {"status": "error", "error": error.get("errmsg", "Write failed")}
+            if not retry:
+                break
+            pending = retry
+
+        # Resolve ids of updated items and hand the stored documents to listeners
+        written = [keys[index] for index, result in enumerate(results) if result["status"] != "error"]
+        stored = list(self.collections[material_type].find({"$or": written})) if written else []
+        ids_by_key = {tuple(doc.get(field) for field in key_fields): doc["_id"] for doc in stored}
+        for index, result in enumerate(results):
+            if result["status"] == "updated":
+                stored_id = ids_by_key.get(tuple(keys[index].values()))
+                result["id"] = str(stored_id) if stored_id is not None else None
+
+        self.bump_version(material_version_key(material_type))
+        self._notify_material_listeners(material_type, stored)
+        return results
+
+    def _notify_material_listeners(self, material_type: str, materials: List[Dict]):
+        for listener in self.material_listeners:
+            listener(material_type, materials)
+
+    def load_materials(self, material_type: str, projection: Optional[Dict] = None) -> Tuple[int, List[Dict]]:
+        """A whole material collection from a secondary, with the version it is at least as new as."""
+        with self.causal_session() as session:
+            version = self.get_version(material_version_key(material_type), session=session)
+            materials = list(self.secondary(material_type).find({}, projection, session=session).sort("_id", ASCENDING))
+        return version, materials
+
+    def query_materials(
+        self,
+        material_type: str,
+        filters: Optional[Dict] = None,
+        sort_field: str = "_id",
+        descending: bool = False,
+        limit: Optional[int] = None,
+        cursor: Optional[str] = None,
+        fields: Optional[List[str]] = None,
+        session: Optional[ClientSession] = None,
+    ) -> Tuple[List[Dict], Optional[str]]:
+        """Return one page of materials and the cursor for the next page (None on the last page).
+
+        Reads a secondary; pass the causal_session the listing's version was read in.
+        """
+        if material_type not in MATERIAL_TYPES:
             raise ValueError(f"Invalid material type: {material_type}")
-        query = {"user_id": user_id} if user_id else {}
-        materials = list(self.collections[material_type].find(query))
+        if sort_field not in MATERIAL_SORT_FIELDS:
+            raise ValueError(f"Cannot sort by {sort_field}")
+
+        conditions = [filters] if filters else []
+        if cursor:
+            sort_value, last_id = decode_cursor(cursor)
+            op = "$lt" if descending else "$gt"
+            if sort_field == "_id":
+                conditions.append({"_id": {op: last_id}})
+            else:
+                conditions.append({"$or": [
+                    {sort_field: {op: sort_value}},
+                    {sort_field: sort_value, "_id": {op: last_id}},
+                ]})
+        query = {"$and": conditions} if len(conditions) > 1 else (conditions[0] if conditions else {})
+
+        projection = None
+        if fields:
+            # The sort key is needed to build the next cursor
+            projection = {field: 1 for field in fields}
+            projection[sort_field] = 1
+
+        direction = DESCENDING if descending else ASCENDING
+        sort = [(sort_field, direction)] if sort_field == "_id" else [(sort_field, direction), ("_id", direction)]
+        find = self.secondary(material_type).find(query, projection, session=session).sort(sort)
+        if limit:
+            # One extra document tells us whether there is a next page
+            find = find.limit(limit + 1)
+        materials = list(find)
+
+        next_cursor = None
+        if limit and len(materials) > limit:
+            materials = materials[:limit]
+            last = materials[-1]
+            next_cursor = encode_cursor(last.get(sort_field), last["_id"])
         for material in materials:
             material["_id"] = str(material["_id"])
-        return materials
+        return materials, next_cursor
+
+    # ------------------ SAVED QUOTATIONS ------------------
+    # Saved quotations reference an inventory snapshot by id and store only the combination
+    # index (which encodes the chosen item per category) plus totals; full documents are
+    # rebuilt from the snapshot on read
+
+    def save_inventory_snapshot(self, inventory: Dict, version: int, pricing: Optional[PricingRules] = None) -> str:
+        """Store the quotation-relevant rows of an inventory, and its pricing rules, once per distinct content."""
+        rows = {
+            category: inventory.get(category, [])
+            for category in (*(category for category, _ in CONFIGURABLE_CATEGORIES), *FIXED_CATEGORIES)
+        }
+        if pricing is not None:
+            rows["pricing_rules"] = pricing.document
+        content_hash = hashlib.sha1(json.dumps(rows, sort_keys=True).encode()).hexdigest()
+        snapshot = self.collections["inventory_snapshots"].find_one_and_update(
+            {"user_id": inventory["user_id"], "content_hash": content_hash},
+            {"$setOnInsert": {
+                **rows,
+                "inventory_id": str(inventory["_id"]),
+                "version": version,
+                "created_at": datetime.utcnow(),
+            }},
+            upsert=True,
+            projection={"_id": 1},
+            return_document=ReturnDocument.AFTER,
+        )
+        return str(snapshot["_id"])
+
+    def save_quotation_batch(self, user_id: str, snapshot_id: str, rows: List[Dict]) -> str:
+        """Store rows from QuotationSpace.compact as a batch, SAVED_QUOTATION_CHUNK_SIZE per document."""
+        batch_id = uuid.uuid4().hex
+        created_at = datetime.utcnow()
+        chunks = [
+            {
+                "batch_id": batch_id,
+                "position": start,
+                "user_id": user_id,
+                "snapshot_id": snapshot_id,
+                "batch_size": len(rows),
+                "created_at": created_at,
+                "index": [row["index"] for row in chunk],
+                "total_cost": [row["total_cost"] for row in chunk],
+                "total_profit": [row["total_profit"] for row in chunk],
+            }
+            for start in range(0, len(rows), SAVED_QUOTATION_CHUNK_SIZE)
+            for chunk in [rows[start:start + SAVED_QUOTATION_CHUNK_SIZE]]
+        ]
+        if chunks:
+            self.collections["quotations"].insert_many(chunks, ordered=False)
+        return batch_id
+
+    def _snapshot_space(self, snapshot_id: str, session: Optional[ClientSession] = None) -> Optional[QuotationSpace]:
+        snapshot = self.secondary("inventory_snapshots").find_one({"_id": ObjectId(snapshot_id)}, session=session)
+        if not snapshot:
+            return None
+        pricing = PricingRules(snapshot["pricing_rules"]) if snapshot.get("pricing_rules") else None
+        return QuotationSpace({**snapshot, "_id": snapshot["inventory_id"]}, pricing)
+
+    def count_quotation_batch(self, batch_id: str, user_id: Optional[str] = None) -> int:
+        query = {"batch_id": batch_id}
+        if user_id is not None:
+            query["user_id"] = user_id
+        chunk = self.collections["quotations"].find_one(query, {"batch_size": 1})
+        if chunk and "batch_size" in chunk:
+            return chunk["batch_size"]
+        # Batches saved fully expanded, one document per quotation
+        return self.collections["quotations"].count_documents(query)
 
-    def get_quotation_batch(self, batch_id: str) -> List[Dict]:
-        quotations = list(self.collections["quotations"].find({"batch_id": batch_id}))
-        for quotation in quotations:
-            quotation["_id"] = str(quotation["_id"])
+    def get_quotation_batch(self, batch_id: str, user_id: Optional[str] = None,
+                            offset: int = 0, limit: Optional[int] = None) -> List[Dict]:
+        query = {"batch_id": batch_id}
+        if user_id is not None:
+            query["user_id"] = user_id
+        # A batch is read right after it is saved: find its first chunk on the primary, then the
+        # chunks and snapshot on a secondary that has caught up with it
+        with self.causal_session() as session:
+            first = self.collections["quotations"].find_one(query, {"snapshot_id": 1}, session=session)
+            if not first:
+                return []
+            if "snapshot_id" not in first:
+                find = self.secondary("quotations").find(query, session=session).sort("position", ASCENDING).skip(offset)
+                if limit:
+                    find = find.limit(limit)
+                quotations = list(find)
+                for quotation in quotations:
+                    quotation["_id"] = str(quotation["_id"])
+                return quotations
+
+            # Only the chunks overlapping [offset, offset + limit) are read and expanded
+            position = {"$gt": offset - SAVED_QUOTATION_CHUNK_SIZE}
+            if limit:
+                position["$lt"] = offset + limit
+            chunks = list(
+                self.secondary("quotations").find({**query, "position": position}, session=session)
+                .sort("position", ASCENDING)
+            )
+            space = self._snapshot_space(first["snapshot_id"], session=session)
+        if space is None:
+            raise ValueError(f"Inventory snapshot {first['snapshot_id']} of batch {batch_id} is missing")
+
+        selected = []
+        end = offset + limit if limit else None
+        for chunk in chunks:
+            for i, index in enumerate(chunk["index"]):
+                position = chunk["position"] + i
+                if position < offset or (end is not None and position >= end):
+                    continue
+                selected.append((chunk, i, position, space.decode(index)))
+
+        quotations = space.build([digits for _, _, _, digits in selected])
+        for quotation, (chunk, i, position, _) in zip(quotations, selected):
+            quotation.update(
+                batch_id=batch_id,
+                position=position,
+                total_cost=chunk["total_cost"][i],
+                total_profit=chunk["total_profit"][i],
+                created_at=chunk["created_at"],
+            )
         return quotations
 
+    # ------------------ PRICING RULES ------------------
+
+    def get_pricing_rules(self, user_id: str) -> Optional[Dict]:
+        document = self.collections["pricing_rules"].find_one({"user_id": user_id}, {"rules": 1})
+        return document["rules"] if document else None
+
+    def save_pricing_rules(self, user_id: str, rules: Optional[Dict]) -> int:
+        """Replace (or with None, delete) the user's pricing rules; returns the new rules version."""
+        if rules is None:
+            self.collections["pricing_rules"].delete_one({"user_id": user_id})
+        else:
+            self.collections["pricing_rules"].update_one(
+                {"user_id": user_id},
+                {"$set": {"rules": rules, "updated_at": datetime.utcnow()}},
+                upsert=True,
+            )
+        return self.bump_version(pricing_version_key(user_id))
+
+    # ------------------ INVENTORY FUNCTIONS ------------------
+
     def user_inventories(self, user_id: str) -> List[Dict]:
         inventories = list(self.collections["inventories"].find({"user_id": user_id}))
         for inventory in inventories:
             inventory["_id"] = str(inventory["_id"])
         return inventories
 
-    def get_user_inventory(self, user_id: str) -> Optional[Dict]:
-        inventory = self.collections["inventories"].find_one({"user_id": user_id})
+    def get_user_inventory(self, user_id: str, categories: Optional[List[str]] = None,
+                           session: Optional[ClientSession] = None) -> Optional[Dict]:
+        """The user's inventory, from the primary unless read in a causal_session."""
+        projection = None
+        if categories:
+            projection = {"user_id": 1, "created_at": 1, "updated_at": 1}
+            projection.update({category: 1 for category in categories})
+        collection = self.secondary("inventories") if session is not None else self.collections["inventories"]
+        inventory = collection.find_one({"user_id": user_id}, projection, session=session)
         if inventory:
             inventory["_id"] = str(inventory["_id"])
         return inventory
 
+    def get_inventory_at_version(self, user_id: str,
+                                 categories: Optional[List[str]] = None) -> Tuple[int, Optional[Dict]]:
+        """The inventory version (primary) and an inventory at least that new (secondary)."""
+        with self.causal_session() as session:
+            version = self.get_version(inventory_version_key(user_id), session=session)
+            return version, self.get_user_inventory(user_id, categories, session=session)
+
+    def push_inventory_components(self, user_id: str, components: Dict[str, List[List]]) -> None:
+        # One round trip appends a whole chunk of components across every category
+        push = {category: {"$each": items} for category, items in components.items() if items}
+        update = {"$set": {"updated_at": datetime.now()}}
+        if push:
+            update["$push"] = push
+        self.collections["inventories"].update_one({"user_id": user_id}, update)
+        self.bump_version(inventory_version_key(user_id))
+
     def register_user(self, username: str, full_name: str, role: str) -> bool:
         if self.collections["users"].find_one({"email": username}):
             return False
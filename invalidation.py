@@ -0,0 +1,177 @@
+"""Cross-worker cache invalidation over a capped MongoDB collection.
+
+Every db_manager.bump_version is published as an event {key, version,
+origin}. Each worker tails the collection with a tailable cursor and hands
+events from other workers to the subscribers of the key's prefix (the
+catalog snapshot and search index subscribe to "material"), which evict
+whatever they hold at an older version. Events are idempotent, so a worker that reconnects re-reads the
+last few seconds of events; if the events it missed have already been
+overwritten in the capped collection, every reset handler runs instead and
+caches start over.
+
+Caches keep their own version checks, so a lost event delays an eviction by
+at most the cache's refresh interval and never serves data older than that.
+"""
+import logging
+import os
+import threading
+import uuid
+from collections import OrderedDict, defaultdict
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+
+from bson import ObjectId
+from pymongo import CursorType
+from pymongo.errors import CollectionInvalid, PyMongoError
+
+from db import db_manager
+from metrics import INVALIDATION_EVENTS
+
+INVALIDATION_COLLECTION = "invalidations"
+INVALIDATION_BUS_BYTES = int(os.getenv("INVALIDATION_BUS_BYTES", str(16 * 1024 * 1024)))
+INVALIDATION_BUS_ENABLED = os.getenv("INVALIDATION_BUS", "1").lower() not in ("0", "false", "off")
+# Events re-read after a reconnect, covering ObjectIds that are out of order across hosts
+REPLAY_SECONDS = 5
+# Latest version seen per key, for dropping duplicates and late arrivals
+MAX_TRACKED_KEYS = 10000
+
+logger = logging.getLogger(__name__)
+
+
+class InvalidationBus:
+    def __init__(self):
+        self.origin = uuid.uuid4().hex
+        self._subscribers: Dict[str, List[Callable[[str, int], None]]] = defaultdict(list)
+        self._reset_handlers: List[Callable[[], None]] = []
+        self._versions: "OrderedDict[str, int]" = OrderedDict()
+        self._ready = False
+        self._started_at = datetime.utcnow()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def subscribe(self, prefix: str, handler: Callable[[str, int], None]):
+        """Call handler(name, version) for events on "<prefix>:<name>" keys from other workers."""
+        self._subscribers[prefix].append(handler)
+
+    def on_reset(self, handler: Callable[[], None]):
+        """Call handler() when events may have been missed, so everything must be re-checked."""
+        self._reset_handlers.append(handler)
+
+    @property
+    def collection(self):
+        return db_manager.db[INVALIDATION_COLLECTION]
+
+    def _ensure_collection(self):
+        try:
+            db_manager.db.create_collection(INVALIDATION_COLLECTION, capped=True, size=INVALIDATION_BUS_BYTES)
+        except CollectionInvalid:
+            pass  # created by another worker
+        self._ready = True
+
+    # ------------------ publishing ------------------
+
+    def publish(self, key: str, version: int):
+        """Broadcast a version bump; used as a db_manager version listener."""
+        # Until the capped collection exists an insert would create a plain one
+        if not self._ready:
+            return
+        try:
+            self.collection.insert_one({
+                "key": key, "version": version, "origin": self.origin, "created_at": datetime.utcnow(),
+            })
+            INVALIDATION_EVENTS.labels(key.partition(":")[0], "published").inc()
+        except PyMongoError as e:
+            # The write itself succeeded; other workers fall back to their version checks
+            INVALIDATION_EVENTS.labels(key.partition(":")[0], "publish_failed").inc()
+            logger.warning("Publishing invalidation for %s failed: %s", key, e)
+
+    # ------------------ consuming ------------------
+
+    def dispatch(self, event: Dict):
+        if event.get("origin") == self.origin:
+            return
+        key, version = event["key"], event["version"]
+        prefix, _, name = key.partition(":")
+        if self._versions.get(key, -1) >= version:
+            INVALIDATION_EVENTS.labels(prefix, "duplicate").inc()
+            return
+        self._versions[key] = version
+        self._versions.move_to_end(key)
+        while len(self._versions) > MAX_TRACKED_KEYS:
+            self._versions.popitem(last=False)
+
+        for handler in self._subscribers.get(prefix, []):
+            try:
+                handler(name, version)
+            except Exception:
+                logger.exception("Invalidation handler failed for %s", key)
+        INVALIDATION_EVENTS.labels(prefix, "applied").inc()
+
+    def reset(self):
+        INVALIDATION_EVENTS.labels("*", "reset").inc()
+        self._versions.clear()
+        for handler in self._reset_handlers:
+            try:
+                handler()
+            except Exception:
+                logger.exception("Invalidation reset handler failed")
+
+    def _missed_events(self, last_id: ObjectId) -> bool:
+        # The capped collection overwrote the last event we read, and possibly some after it
+        return self.collection.find_one({"_id": last_id}, {"_id": 1}) is None
+
+    def _tail(self, last_id: Optional[ObjectId]) -> Optional[ObjectId]:
+        if last_id is None:
+            # Nothing read yet: events since this worker started (its caches are empty before that)
+            since = self._started_at
+        else:
+            if self._missed_events(last_id):
+                self.reset()
+            since = last_id.generation_time
+        query = {"_id": {"$gte": ObjectId.from_datetime(since - timedelta(seconds=REPLAY_SECONDS))}}
+
+        cursor = self.collection.find(query, cursor_type=CursorType.TAILABLE_AWAIT).max_await_time_ms(1000)
+        try:
+            while cursor.alive and not self._stop.is_set():
+                for event in cursor:
+                    self.dispatch(event)
+                    last_id = event["_id"]
+        finally:
+            cursor.close()
+        return last_id
+
+    def _run(self):
+        last_id, delay = None, 1.0
+        while not self._stop.is_set():
+            try:
+                if not self._ready:
+                    self._ensure_collection()
+                last_id = self._tail(last_id)
+                delay = 1.0
+                # A tailable cursor on an empty collection dies at once; wait before reopening
+                self._stop.wait(1.0)
+            except PyMongoError as e:
+                logger.warning("Invalidation bus disconnected, retrying in %.0fs: %s", delay, e)
+                self._stop.wait(delay)
+                delay = min(delay * 2, 30.0)
+
+    def start(self):
+        if not INVALIDATION_BUS_ENABLED or self._thread is not None:
+            return
+        db_manager.version_listeners.append(self.publish)
+        self._started_at = datetime.utcnow()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="invalidation-bus", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        db_manager.version_listeners.remove(self.publish)
+        self._thread.join(timeout=5)
+        self._thread = None
+        self._ready = False
+
+
+invalidation_bus = InvalidationBus()
@@ -0,0 +1,116 @@
+import csv
+import io
+from typing import IO, Iterator, List, Optional, Tuple, Union
+
+from openpyxl import load_workbook
+
+INVENTORY_CATEGORIES = (
+    "SolarPanels",
+    "Inverters",
+    "MountingStructures",
+    "BOSComponents",
+    "ProtectionEquipment",
+    "EarthingSystems",
+    "NetMetering",
+)
+
+# Rows are written to Mongo in chunks of this size, so memory stays bounded
+# no matter how many rows the spreadsheet has.
+IMPORT_CHUNK_SIZE = 1000
+# Only the first MAX_REPORTED_ERRORS row errors are returned to the client
+MAX_REPORTED_ERRORS = 500
+
+HEADER = ("category", "model", "quantity", "rate", "profit")
+
+# "Solar Panels", "solar_panels" and "SolarPanels" all map to "SolarPanels"
+_CATEGORY_LOOKUP = {name.lower(): name for name in INVENTORY_CATEGORIES}
+
+
+def _normalize_category(value) -> Optional[str]:
+    if value is None:
+        return None
+    key = str(value).replace(" ", "").replace("_", "").lower()
+    return _CATEGORY_LOOKUP.get(key)
+
+
+def _parse_number(value, field: str) -> Union[str, int]:
+    # Same rules as the JSON inventory endpoint: blanks and "N/A" are kept as is
+    if value is None:
+        return ""
+    if isinstance(value, str):
+        value = value.strip()
+        if value in ["", "N/A"]:
+            return value
+    try:
+        number = float(value)
+    except (ValueError, TypeError):
+        raise ValueError(f"{field} must be a number, got {value!r}")
+    if not number.is_integer():
+        raise ValueError(f"{field} must be a whole number, got {value!r}")
+    return int(number)
+
+
+def validate_row(values) -> Tuple[str, List[Union[str, int]]]:
+    """Turn a spreadsheet row into (category, [model, quantity, rate, profit])."""
+    values = list(values) + [None] * (len(HEADER) - len(values))
+    category_value, model, quantity, rate, profit = values[:len(HEADER)]
+
+    category = _normalize_category(category_value)
+    if not category:
+        raise ValueError(f"Unknown category {category_value!r}")
+
+    model = str(model).strip() if model is not None else ""
+    if not model:
+        raise ValueError("model is required")
+
+    return category, [
+        model,
+        _parse_number(quantity, "quantity"),
+        _parse_number(rate, "rate"),
+        _parse_number(profit, "profit"),
+    ]
+
+
+def _is_header(values) -> bool:
+    return bool(values) and str(values[0] or "").strip().lower() == HEADER[0]
+
+
+def _is_blank(values) -> bool:
+    return all(value is None or str(value).strip() == "" for value in values)
+
+
+def _iter_csv(fileobj: IO[bytes]) -> Iterator[tuple]:
+    text = io.TextIOWrapper(fileobj, encoding="utf-8-sig", newline="")
+    try:
+        for values in csv.reader(text):
+            yield tuple(values)
+    finally:
+        # Leave the underlying upload open, FastAPI closes it
+        text.detach()
+
+
+def _iter_xlsx(fileobj: IO[bytes]) -> Iterator[tuple]:
+    workbook = load_workbook(fileobj, read_only=True, data_only=True)
+    try:
+        for values in workbook.active.iter_rows(values_only=True):
+            yield values
+    finally:
+        workbook.close()
+
+
+def iter_inventory_rows(filename: str, fileobj: IO[bytes]) -> Iterator[Tuple[int, tuple]]:
+    """Yield (row_number, values) for every data row, one row at a time."""
+    name = (filename or "").lower()
+    if name.endswith(".csv"):
+        rows = _iter_csv(fileobj)
+    elif name.endswith(".xlsx"):
+        rows = _iter_xlsx(fileobj)
+    else:
+        raise ValueError("Only .csv and .xlsx files are supported")
+
+    for row_number, values in enumerate(rows, 1):
+        if _is_blank(values):
+            continue
+        if row_number == 1 and _is_header(values):
+            continue
+        yield row_number, values
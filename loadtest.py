@@ -0,0 +1,289 @@
+"""Async load generator for the full API stack.
+
+Virtual users run a weighted mix of requests from a scenario file (see
+loadtest_scenarios/) against main:app in-process, or against a running
+server with --base-url. Each virtual user gets its own account with an
+inventory, company details and a refresh token, and authenticates with a
+JWT minted by create_access_token, so every request goes through
+get_current_user, Mongo, the route and response serialization.
+
+In-process runs use the in-memory Mongo stand-in unless --mongo-uri is
+given. Against a server, pass the server's --mongo-uri so the test users can
+be seeded, and run with the server's JWT_SECRET.
+
+    python loadtest.py loadtest_scenarios/mixed.json
+    python loadtest.py loadtest_scenarios/quotation_burst.json --users 50 --duration 20
+    JWT_SECRET=... python loadtest.py loadtest_scenarios/mixed.json \\
+        --base-url http://localhost:8000 --mongo-uri mongodb://localhost:27017
+"""
+import argparse
+import asyncio
+import bisect
+import json
+import os
+import random
+import sys
+import time
+from collections import Counter, defaultdict
+from datetime import datetime
+
+import httpx
+
+# Upper bounds (ms) of the latency histogram buckets; the last bucket is open-ended
+HISTOGRAM_BOUNDS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Load test the Solar Quotation System API")
+    parser.add_argument("scenario", help="Scenario JSON file")
+    parser.add_argument("--base-url", help="Target a running server instead of main:app in-process")
+    parser.add_argument("--mongo-uri", help="Seed (and, in-process, serve from) this MongoDB instead of the in-memory stand-in")
+    parser.add_argument("--users", type=int, help="Override the scenario's virtual users")
+    parser.add_argument("--duration", type=float, help="Override the scenario's duration in seconds")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="Also write the report as JSON to this file")
+    return parser.parse_args(argv)
+
+
+def load_scenario(path: str, args) -> dict:
+    with open(path, "r") as file:
+        scenario = json.load(file)
+    if args.users:
+        scenario["users"] = args.users
+    if args.duration:
+        scenario["duration"] = args.duration
+    scenario.setdefault("name", os.path.splitext(os.path.basename(path))[0])
+    scenario.setdefault("users", 10)
+    scenario.setdefault("duration", 30)
+    scenario.setdefault("ramp_up", 0)
+    scenario.setdefault("think_time", [0, 0])
+    scenario.setdefault("role", "user")
+    scenario.setdefault("inventory", {})
+    if not scenario.get("steps"):
+        raise ValueError(f"{path}: scenario has no steps")
+    return scenario
+
+
+# ------------------ SEEDING ------------------
+
+def synthetic_inventory(user_id: str, sizes: dict, rng: random.Random) -> dict:
+    inventory = {"user_id": user_id, "created_at": datetime.now(), "updated_at": datetime.now()}
+    for category in ("SolarPanels", "Inverters", "MountingStructures", "EarthingSystems",
+                     "BOSComponents", "ProtectionEquipment", "NetMetering"):
+        inventory[category] = [
+            [f"{category}-{i:04d}", rng.randint(1, 50), rng.randint(500, 60000), rng.randint(50, 5000)]
+            for i in range(sizes.get(category, 2))
+        ]
+    return inventory
+
+
+def synthetic_catalog(rng: random.Random) -> dict:
+    panels = [{
+        "brand": f"PanelCo{i % 4}", "model_number": f"P-{i:03d}", "technology": "Mono PERC",
+        "power_w": f"{rng.choice([400, 450, 540, 580])}W", "efficiency_percent": "21.3",
+        "dimensions_mm": "2278x1134x35", "weight_kg": 27.5, "cell_configuration": "144",
+        "quantity": 500, "rate": rng.randint(9000, 16000), "profit": 0.12,
+    } for i in range(40)]
+    inverters = [{
+        "brand": f"InvCo{i % 3}", "model_number": f"I-{i:03d}", "efficiency_percent": 97.6, "mppt_channels": 2,
+        "input_voltage_range": "120-550V", "output_voltage": "230V", "ip_rating": "IP65", "cooling_method": "Natural",
+        "communication": "WiFi", "warranty": 5, "dimensions": "400x300x150", "weight_kg": 12,
+        "certifications": "IEC 62109", "quantity": 50, "rate": rng.randint(25000, 90000), "profit": 0.1,
+        "capacity_kw": rng.choice([3, 5, 8, 10, 15]),
+    } for i in range(20)]
+    mounts = [{
+        "structure_type": "Rooftop", "material": rng.choice(["Aluminium", "GI"]), "brand": f"MountCo{i % 2}",
+        "specifications": f"Spec {i}", "gsm_rating": 80, "wind_speed_rating": 150, "warranty": 10,
+        "quantity": 100, "rate": rng.randint(8000, 20000), "profit": 0.15, "coating_type": "Hot-dip",
+    } for i in range(10)]
+    return {"solar_panel": panels, "inverter": inverters, "mounting_structure": mounts}
+
+
+def seed(scenario: dict, rng: random.Random) -> list:
+    """Create the virtual users' accounts and data; returns (email, refresh token) per user."""
+    from auth import create_refresh_token
+    from db import db_manager
+
+    sizes = scenario["inventory"]
+    accounts = []
+    for i in range(scenario["users"]):
+        email = f"loadtest-{i:04d}@example.com"
+        db_manager.collections["users"].delete_many({"email": email})
+        db_manager.collections["inventories"].delete_many({"user_id": email})
+        db_manager.collections["users"].insert_one({
+            "email": email, "full_name": f"Load Test {i}", "role": scenario["role"],
+            "gstin": "22AAAAA0000A1Z5", "company_name": "Load Test Solar", "company_address": "1 Test Road",
+            "phone": "0000000000", "created_at": datetime.utcnow(), "updated_at": datetime.utcnow(),
+        })
+        db_manager.collections["inventories"].insert_one(synthetic_inventory(email, sizes, rng))
+        refresh_token = create_refresh_token({"sub": email, "role": scenario["role"]})
+        db_manager.store_refresh_token(email, refresh_token)
+        accounts.append((email, refresh_token))
+
+    if scenario.get("catalog"):
+        for material_type, materials in synthetic_catalog(rng).items():
+            db_manager.upsert_materials(material_type, materials)
+    return accounts
+
+
+# ------------------ RUNNING ------------------
+
+class Recorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(Counter)
+
+    def record(self, step: str, status, seconds: float):
+        self.latencies[step].append(seconds * 1000)
+        self.statuses[step][status] += 1
+
+
+class VirtualUser:
+    def __init__(self, email: str, refresh_token: str, role: str):
+        from auth import create_access_token
+
+        self.email = email
+        self.refresh_token = refresh_token
+        self.access_token = create_access_token({"sub": email, "role": role})
+
+    def request_kwargs(self, step: dict) -> dict:
+        kwargs = {"headers": {"Authorization": f"Bearer {self.access_token}"}}
+        if step.get("params"):
+            kwargs["params"] = step["params"]
+        if step.get("refresh"):
+            kwargs["json"] = {"refresh_token": self.refresh_token}
+        elif "json" in step:
+            kwargs["json"] = step["json"]
+        return kwargs
+
+    def after(self, step: dict, response: httpx.Response):
+        # A refresh blacklists the previous access token, so switch to the new one
+        if step.get("refresh") and response.status_code == 200:
+            self.access_token = response.json()["access_token"]
+
+
+async def run_user(client, user: VirtualUser, scenario: dict, recorder: Recorder, deadline: float,
+                   start_delay: float, rng: random.Random):
+    steps = scenario["steps"]
+    weights = [step.get("weight", 1) for step in steps]
+    think_min, think_max = scenario["think_time"]
+    await asyncio.sleep(start_delay)
+    while time.monotonic() < deadline:
+        step = rng.choices(steps, weights)[0]
+        started = time.perf_counter()
+        try:
+            response = await client.request(step.get("method", "GET"), step["path"], **user.request_kwargs(step))
+            status = response.status_code
+            user.after(step, response)
+        except httpx.HTTPError as e:
+            status = type(e).__name__
+        recorder.record(step["name"], status, time.perf_counter() - started)
+        if think_max:
+            await asyncio.sleep(rng.uniform(think_min, think_max))
+
+
+async def run(scenario: dict, accounts: list, base_url: str, app, rng: random.Random):
+    recorder = Recorder()
+    if app is not None:
+        transport = httpx.ASGITransport(app=app)
+        client = httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=120)
+    else:
+        limits = httpx.Limits(max_connections=scenario["users"], max_keepalive_connections=scenario["users"])
+        client = httpx.AsyncClient(base_url=base_url, limits=limits, timeout=120)
+
+    users = [VirtualUser(email, refresh_token, scenario["role"]) for email, refresh_token in accounts]
+    started = time.monotonic()
+    deadline = started + scenario["ramp_up"] + scenario["duration"]
+    async with client:
+        await asyncio.gather(*(
+            run_user(client, user, scenario, recorder, deadline,
+                     scenario["ramp_up"] * i / max(1, len(users)), random.Random(rng.random()))
+            for i, user in enumerate(users)
+        ))
+    return recorder, time.monotonic() - started
+
+
+# ------------------ REPORTING ------------------
+
+def percentile(ordered: list, fraction: float) -> float:
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def histogram(latencies: list) -> list:
+    counts = [0] * (len(HISTOGRAM_BOUNDS_MS) + 1)
+    for latency in latencies:
+        counts[bisect.bisect_left(HISTOGRAM_BOUNDS_MS, latency)] += 1
+    return counts
+
+
+def summarize(recorder: Recorder, elapsed: float) -> dict:
+    endpoints = {}
+    for step, latencies in sorted(recorder.latencies.items()):
+        ordered = sorted(latencies)
+        statuses = recorder.statuses[step]
+        errors = sum(count for status, count in statuses.items() if not isinstance(status, int) or status >= 400)
+        endpoints[step] = {
+            "requests": len(ordered),
+            "rps": round(len(ordered) / elapsed, 1),
+            "error_rate": round(errors / len(ordered), 4),
+            "statuses": {str(status): count for status, count in statuses.items()},
+            "p50_ms": round(percentile(ordered, 0.50), 2),
+            "p90_ms": round(percentile(ordered, 0.90), 2),
+            "p99_ms": round(percentile(ordered, 0.99), 2),
+            "max_ms": round(ordered[-1], 2),
+            "histogram": histogram(ordered),
+        }
+    total = sum(endpoint["requests"] for endpoint in endpoints.values())
+    return {"elapsed_s": round(elapsed, 2), "requests": total, "rps": round(total / elapsed, 1), "endpoints": endpoints}
+
+
+def print_report(scenario: dict, report: dict):
+    print(f"\nScenario {scenario['name']}: {scenario['users']} users, {report['requests']} requests "
+          f"in {report['elapsed_s']}s ({report['rps']} req/s)\n")
+    print(f"{'endpoint':24} {'reqs':>7} {'req/s':>7} {'errors':>7} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} {'max ms':>8}  statuses")
+    for step, endpoint in report["endpoints"].items():
+        statuses = " ".join(f"{status}:{count}" for status, count in sorted(endpoint["statuses"].items()))
+        print(f"{step:24} {endpoint['requests']:>7} {endpoint['rps']:>7} {endpoint['error_rate']:>7.1%} "
+              f"{endpoint['p50_ms']:>8} {endpoint['p90_ms']:>8} {endpoint['p99_ms']:>8} {endpoint['max_ms']:>8}  {statuses}")
+
+    labels = [f"<={bound}" for bound in HISTOGRAM_BOUNDS_MS] + [f">{HISTOGRAM_BOUNDS_MS[-1]}"]
+    for step, endpoint in report["endpoints"].items():
+        print(f"\n{step} latency (ms)")
+        largest = max(endpoint["histogram"]) or 1
+        for label, count in zip(labels, endpoint["histogram"]):
+            if count:
+                print(f"  {label:>7} {count:>7} {'#' * max(1, round(40 * count / largest))}")
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    scenario = load_scenario(args.scenario, args)
+    rng = random.Random(args.seed)
+
+    if args.mongo_uri:
+        os.environ["MONGO_URI"] = args.mongo_uri
+    elif args.base_url:
+        print("--base-url needs --mongo-uri (the server's database) to seed the test users", file=sys.stderr)
+        return 2
+    else:
+        import memory_mongo
+        memory_mongo.install()
+
+    app = None
+    if not args.base_url:
+        from main import app
+
+    accounts = seed(scenario, rng)
+    recorder, elapsed = asyncio.run(run(scenario, accounts, args.base_url, app, rng))
+    report = summarize(recorder, elapsed)
+    print_report(scenario, report)
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump({"scenario": scenario, **report}, file, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,17 +1,64 @@
+import asyncio
+import logging
+import os
+from contextlib import asynccontextmanager
+
 import uvicorn
 from fastapi import FastAPI
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from db import db_manager
+from invalidation import invalidation_bus
+from metrics import PrometheusMiddleware
+from profiler import ProfilerMiddleware
+from tracing import TracingMiddleware, configure_tracing
 from routes import router
 
-app = FastAPI(title="Solar Quotation System API", docs_url="/docs", redoc_url="/redoc")
+logger = logging.getLogger(__name__)
+
+# Longest wait between attempts to build indexes while MongoDB is unreachable
+INDEX_RETRY_MAX_SECONDS = float(os.getenv("INDEX_RETRY_MAX_SECONDS", "60"))
+
+
+async def build_indexes():
+    delay = 1.0
+    while True:
+        try:
+            await run_in_threadpool(db_manager.ensure_indexes)
+            logger.info("MongoDB indexes ready")
+            return
+        except Exception:
+            logger.exception("Building MongoDB indexes failed; retrying in %.0fs", delay)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, INDEX_RETRY_MAX_SECONDS)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Start serving right away; /readyz reports when MongoDB is reachable
+    indexes = asyncio.create_task(build_indexes())
+    invalidation_bus.start()
+    try:
+        yield
+    finally:
+        indexes.cancel()
+        await run_in_threadpool(invalidation_bus.stop)
+        db_manager.close()
+
+
+configure_tracing()
+app = FastAPI(title="Solar Quotation System API", docs_url="/docs", redoc_url="/redoc", lifespan=lifespan)
 # Set up CORS
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],  
+    allow_origins=["*"],
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(PrometheusMiddleware)
+app.add_middleware(TracingMiddleware)
+app.add_middleware(ProfilerMiddleware)
 app.include_router(router)
 if __name__ == "__main__":
-    uvicorn.run(app, host="127.0.0.1", port=8000)
\ No newline at end of file
+    uvicorn.run(app, host="127.0.0.1", port=8000)
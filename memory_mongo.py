@@ -0,0 +1,293 @@
+"""In-memory stand-in for the subset of pymongo this app uses.
+
+Used by benchmark.py and loadtest.py to run the real db_manager and routes
+offline. Install it before db is imported:
+
+    import memory_mongo
+    memory_mongo.install()
+    from db import db_manager
+
+Supports equality and $gt/$gte/$lt/$lte/$ne/$in/$nin/$exists/$or/$and queries
+on top-level fields, inclusion projections, sort/skip/limit, and the update
+operators $set, $setOnInsert, $inc and $push (with $each). It is not a
+general Mongo emulator: indexes are accepted and ignored, and there are no
+transactions or dotted paths.
+"""
+import copy
+import os
+from contextlib import contextmanager
+import threading
+from typing import Dict, Iterable, List, Optional
+
+import pymongo
+from bson import ObjectId
+from pymongo import ReturnDocument
+
+_MISSING = object()
+
+
+def _compare(value, op: str, operand) -> bool:
+    if op == "$in":
+        return value in operand
+    if op == "$nin":
+        return value not in operand
+    if op == "$ne":
+        return value != operand
+    if op == "$exists":
+        return (value is not _MISSING) == bool(operand)
+    if value is _MISSING or value is None:
+        return False
+    try:
+        if op == "$gt":
+            return value > operand
+        if op == "$gte":
+            return value >= operand
+        if op == "$lt":
+            return value < operand
+        if op == "$lte":
+            return value <= operand
+    except TypeError:
+        return False
+    raise NotImplementedError(f"Query operator {op} is not supported")
+
+
+def matches(document: Dict, query: Dict) -> bool:
+    for field, condition in query.items():
+        if field == "$or":
+            if not any(matches(document, clause) for clause in condition):
+                return False
+            continue
+        if field == "$and":
+            if not all(matches(document, clause) for clause in condition):
+                return False
+            continue
+        value = document.get(field, _MISSING)
+        if isinstance(condition, dict) and condition and all(key.startswith("$") for key in condition):
+            if not all(_compare(value, op, operand) for op, operand in condition.items()):
+                return False
+        elif condition is None:
+            if value is not _MISSING and value is not None:
+                return False
+        elif value is _MISSING or value != condition:
+            return False
+    return True
+
+
+def project(document: Dict, projection: Optional[Dict]) -> Dict:
+    if not projection:
+        return copy.deepcopy(document)
+    included = {field for field, flag in projection.items() if flag}
+    if not included:
+        return {field: copy.deepcopy(value) for field, value in document.items() if field not in projection}
+    result = {field: copy.deepcopy(document[field]) for field in included if field in document}
+    if projection.get("_id", 1) and "_id" in document:
+        result["_id"] = document["_id"]
+    return result
+
+
+def _sort_key(value):
+    # Missing/None sort first, then numbers, then everything else as strings
+    if value is _MISSING or value is None:
+        return (0, 0)
+    if isinstance(value, (int, float)):
+        return (1, value)
+    return (2, str(value))
+
+
+class _Result:
+    def __init__(self, **fields):
+        self.__dict__.update(fields)
+
+
+class Cursor:
+    def __init__(self, documents: List[Dict], projection: Optional[Dict]):
+        self._documents = documents
+        self._projection = projection
+        self._skip = 0
+        self._limit = 0
+
+    def sort(self, key, direction=pymongo.ASCENDING):
+        keys = [(key, direction)] if isinstance(key, str) else list(key)
+        for field, field_direction in reversed(keys):
+            self._documents.sort(key=lambda document: _sort_key(document.get(field, _MISSING)),
+                                 reverse=field_direction == pymongo.DESCENDING)
+        return self
+
+    def skip(self, count: int):
+        self._skip = count
+        return self
+
+    def limit(self, count: int):
+        self._limit = count
+        return self
+
+    def __iter__(self):
+        documents = self._documents[self._skip:]
+        if self._limit:
+            documents = documents[:self._limit]
+        return (project(document, self._projection) for document in documents)
+
+
+class Collection:
+    def __init__(self, name: str):
+        self.name = name
+        self._documents: List[Dict] = []
+        self._lock = threading.RLock()
+
+    def create_index(self, *args, **kwargs):
+        return "in-memory"
+
+    def with_options(self, **kwargs):
+        # One copy of the data: read preferences have nothing to route between
+        return self
+
+    def _matching(self, query: Optional[Dict]) -> List[Dict]:
+        return [document for document in self._documents if matches(document, query or {})]
+
+    def find(self, query: Optional[Dict] = None, projection: Optional[Dict] = None, session=None) -> Cursor:
+        with self._lock:
+            return Cursor(self._matching(query), projection)
+
+    def find_one(self, query: Optional[Dict] = None, projection: Optional[Dict] = None,
+                 session=None) -> Optional[Dict]:
+        with self._lock:
+            for document in self._documents:
+                if matches(document, query or {}):
+                    return project(document, projection)
+        return None
+
+    def count_documents(self, query: Dict) -> int:
+        with self._lock:
+            return len(self._matching(query))
+
+    def insert_one(self, document: Dict):
+        with self._lock:
+            document.setdefault("_id", ObjectId())
+            self._documents.append(copy.deepcopy(document))
+            return _Result(inserted_id=document["_id"], acknowledged=True)
+
+    def insert_many(self, documents: Iterable[Dict], ordered: bool = True):
+        ids = [self.insert_one(document).inserted_id for document in documents]
+        return _Result(inserted_ids=ids, acknowledged=True)
+
+    @staticmethod
+    def _apply(document: Dict, update: Dict, inserting: bool):
+        for op, fields in update.items():
+            if op == "$set" or (op == "$setOnInsert" and inserting):
+                document.update(copy.deepcopy(fields))
+            elif op == "$inc":
+                for field, amount in fields.items():
+                    document[field] = document.get(field, 0) + amount
+            elif op == "$push":
+                for field, value in fields.items():
+                    items = value["$each"] if isinstance(value, dict) and "$each" in value else [value]
+                    document.setdefault(field, []).extend(copy.deepcopy(items))
+            elif op != "$setOnInsert":
+                raise NotImplementedError(f"Update operator {op} is not supported")
+
+    def _upsert_document(self, query: Dict, update: Dict) -> Dict:
+        document = {field: value for field, value in query.items()
+                    if not field.startswith("$") and not isinstance(value, dict)}
+        document.setdefault("_id", ObjectId())
+        self._apply(document, update, inserting=True)
+        self._documents.append(document)
+        return document
+
+    def update_one(self, query: Dict, update: Dict, upsert: bool = False):
+        with self._lock:
+            for document in self._documents:
+                if matches(document, query):
+                    self._apply(document, update, inserting=False)
+                    return _Result(matched_count=1, modified_count=1, upserted_id=None)
+            if upsert:
+                return _Result(matched_count=0, modified_count=0,
+                               upserted_id=self._upsert_document(query, update)["_id"])
+            return _Result(matched_count=0, modified_count=0, upserted_id=None)
+
+    def find_one_and_update(self, query: Dict, update: Dict, upsert: bool = False, projection=None,
+                            return_document=ReturnDocument.BEFORE, **kwargs):
+        with self._lock:
+            for document in self._documents:
+                if matches(document, query):
+                    before = project(document, projection)
+                    self._apply(document, update, inserting=False)
+                    return project(document, projection) if return_document == ReturnDocument.AFTER else before
+            if upsert:
+                document = self._upsert_document(query, update)
+                return project(document, projection) if return_document == ReturnDocument.AFTER else None
+            return None
+
+    def delete_one(self, query: Dict):
+        with self._lock:
+            for i, document in enumerate(self._documents):
+                if matches(document, query):
+                    del self._documents[i]
+                    return _Result(deleted_count=1)
+            return _Result(deleted_count=0)
+
+    def delete_many(self, query: Dict):
+        with self._lock:
+            kept = [document for document in self._documents if not matches(document, query)]
+            deleted = len(self._documents) - len(kept)
+            self._documents = kept
+            return _Result(deleted_count=deleted)
+
+    def bulk_write(self, operations: List, ordered: bool = True):
+        matched = upserted = 0
+        upserted_ids = {}
+        for index, operation in enumerate(operations):
+            if isinstance(operation, pymongo.InsertOne):
+                self.insert_one(operation._doc)
+                continue
+            if not isinstance(operation, pymongo.UpdateOne):
+                raise NotImplementedError(f"{type(operation).__name__} is not supported")
+            result = self.update_one(operation._filter, operation._doc, upsert=bool(operation._upsert))
+            matched += result.matched_count
+            if result.upserted_id is not None:
+                upserted += 1
+                upserted_ids[index] = result.upserted_id
+        return _Result(matched_count=matched, modified_count=matched, upserted_count=upserted,
+                       upserted_ids=upserted_ids, inserted_count=0)
+
+
+class Database:
+    def __init__(self):
+        self._collections: Dict[str, Collection] = {}
+
+    def command(self, name: str, *args, **kwargs):
+        if name != "ping":
+            raise NotImplementedError(f"Command {name} is not supported")
+        return {"ok": 1.0}
+
+    def __getitem__(self, name: str) -> Collection:
+        if name not in self._collections:
+            self._collections[name] = Collection(name)
+        return self._collections[name]
+
+
+class MongoClient:
+    def __init__(self, *args, **kwargs):
+        self._databases: Dict[str, Database] = {}
+
+    @contextmanager
+    def start_session(self, **kwargs):
+        yield None
+
+    @property
+    def admin(self) -> Database:
+        return self["admin"]
+
+    def __getitem__(self, name: str) -> Database:
+        if name not in self._databases:
+            self._databases[name] = Database()
+        return self._databases[name]
+
+    def close(self):
+        pass
+
+
+def install():
+    """Make pymongo.MongoClient (and so db.MongoDBManager) use the in-memory stand-in."""
+    os.environ.setdefault("MONGO_URI", "mongodb://in-memory")
+    os.environ.setdefault("JWT_SECRET", "in-memory-secret")
+    pymongo.MongoClient = MongoClient
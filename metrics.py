@@ -0,0 +1,124 @@
+import time
+from typing import Dict, Tuple
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+from pymongo import monitoring
+from starlette.routing import Match
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# ------------------ HTTP ------------------
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds", "Time to serve a request, by route template",
+    ["method", "route", "status"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+REQUESTS_IN_PROGRESS = Gauge(
+    "http_requests_in_progress", "Requests currently being served", ["method", "route"],
+)
+
+# ------------------ MONGO ------------------
+
+MONGO_COMMAND_LATENCY = Histogram(
+    "mongodb_command_duration_seconds", "MongoDB command round trip time",
+    ["collection", "command", "outcome"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5),
+)
+
+# ------------------ DOMAIN ------------------
+
+QUOTATION_COMBINATIONS = Counter(
+    "quotation_combinations_enumerated_total", "Inventory quotation combinations built or looked up",
+)
+QUOTATIONS_RETURNED = Histogram(
+    "quotations_returned", "Quotations returned per response", ["kind"],
+    buckets=(1, 10, 50, 100, 500, 1000, 5000, 10000, 50000),
+)
+CACHE_REQUESTS = Counter(
+    "cache_requests_total", "Lookups in in-process caches", ["cache", "result"],
+)
+TOKEN_CHECKS = Counter(
+    "auth_token_checks_total", "Access token checks in get_current_user", ["result"],
+)
+INVALIDATION_EVENTS = Counter(
+    "invalidation_events_total", "Cross-worker invalidation events by key prefix", ["topic", "outcome"],
+)
+
+
+def cache_hit(cache: str, count: int = 1):
+    CACHE_REQUESTS.labels(cache, "hit").inc(count)
+
+
+def cache_miss(cache: str, count: int = 1):
+    CACHE_REQUESTS.labels(cache, "miss").inc(count)
+
+
+def latest() -> Tuple[bytes, str]:
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """Times every MongoDB command by collection and command name."""
+
+    def __init__(self):
+        # (connection, request id) -> collection, from the started event
+        self._collections: Dict[Tuple, str] = {}
+
+    @staticmethod
+    def _key(event) -> Tuple:
+        return event.connection_id, event.request_id
+
+    def started(self, event):
+        collection = event.command.get(event.command_name)
+        if event.command_name == "getMore":
+            collection = event.command.get("collection")
+        self._collections[self._key(event)] = collection if isinstance(collection, str) else "-"
+
+    def _observe(self, event, outcome: str):
+        collection = self._collections.pop(self._key(event), "-")
+        MONGO_COMMAND_LATENCY.labels(collection, event.command_name, outcome).observe(event.duration_micros / 1e6)
+
+    def succeeded(self, event):
+        self._observe(event, "success")
+
+    def failed(self, event):
+        self._observe(event, "failure")
+
+
+class PrometheusMiddleware:
+    """Records latency and in-flight requests per route template (not per raw path)."""
+
+    def __init__(self, app: ASGIApp, skip_paths: Tuple[str, ...] = ("/metrics",)):
+        self.app = app
+        self.skip_paths = skip_paths
+
+    @staticmethod
+    def _route(scope: Scope) -> str:
+        for route in scope["app"].router.routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return getattr(route, "path", "-")
+        return "unmatched"
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or scope["path"] in self.skip_paths:
+            await self.app(scope, receive, send)
+            return
+
+        method, route = scope["method"], self._route(scope)
+        status = "500"
+
+        async def send_wrapper(message: Message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = str(message["status"])
+            await send(message)
+
+        in_progress = REQUESTS_IN_PROGRESS.labels(method, route)
+        in_progress.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            in_progress.dec()
+            REQUEST_LATENCY.labels(method, route, status).observe(time.perf_counter() - started)
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import Any, List, Dict, Optional, Union
+from typing import Annotated, Any, List, Dict, Optional, Union
 import datetime
 
 class User(BaseModel):
@@ -18,6 +18,32 @@ class ComponentResponse(BaseModel):
     message: str = "Component added successfully"
 
 
+class ImportRowError(BaseModel):
+    row: int
+    error: str
+
+
+class InventoryImportResponse(ComponentResponse):
+    imported: int
+    duplicates: int
+    failed: int
+    errors: List[ImportRowError]
+
+
+class BatchItemResult(BaseModel):
+    index: int
+    status: str  # inserted, updated or error
+    id: Optional[str] = None
+    error: Optional[str] = None
+
+
+class BatchMaterialResponse(BaseModel):
+    inserted: int
+    updated: int
+    failed: int
+    results: List[BatchItemResult]
+
+
 # Component models
 class SolarPanel(BaseModel):
     brand: str
@@ -49,6 +75,7 @@ class Inverter(BaseModel):
     quantity: int
     rate: float
     profit: float
+    capacity_kw: Optional[float] = None  # rated AC output, used to size catalog quotations
 
 class MountingStructure(BaseModel):
     structure_type: str
@@ -61,6 +88,7 @@ class MountingStructure(BaseModel):
     quantity: int
     rate: float
     profit: float
+    coating_type: Optional[str] = None
 
 class BOSComponent(BaseModel):
     component_type: str
@@ -138,16 +166,39 @@ ComponentType = Union[
     NetMetering
 ]
 
+# Catalog material type (db_manager.collections key) -> model describing its documents
+MATERIAL_MODELS = {
+    "solar_panel": SolarPanel,
+    "inverter": Inverter,
+    "mounting_structure": MountingStructure,
+    "bos_component": BOSComponent,
+    "protection_equipment": ProtectionEquipment,
+    "earthing_system": EarthingSystem,
+    "net_metering": NetMetering,
+}
+
 
 # Define the request model
 class QuotationFilterRequest(BaseModel):
-    system_capacity_kw: float = Field(..., description="Desired system capacity in kilowatts")
+    system_capacity_kw: float = Field(..., gt=0, description="Desired system capacity in kilowatts")
     installation_type: Optional[str] = Field(None, description="Type of installation (residential, commercial, industrial)")
     location: Optional[str] = Field(None, description="Installation location")
     inverter_brands: Optional[List[str]] = Field(None, description="Filter by inverter brands")
     panel_brands: Optional[List[str]] = Field(None, description="Filter by solar panel brands")
     mounting_material: Optional[List[str]] = Field(None, description="Filter by mounting structure material")
     mounting_coating: Optional[List[str]] = Field(None, description="Filter by mounting structure coating")
+    max_options: int = Field(20, ge=1, le=200, description="Number of options to return, cheapest first")
+
+# Pricing rules for inventory quotations; percentages are keyed by inventory category, with "default" for the rest
+class VolumeDiscountTier(BaseModel):
+    min_subtotal: float = Field(..., ge=0, description="Smallest quotation subtotal (cost plus profit) the tier applies to")
+    percent: float = Field(..., ge=0, le=100, description="Discount on the subtotal")
+
+class PricingRulesRequest(BaseModel):
+    gst_percent: Dict[str, Annotated[float, Field(ge=0, le=100)]] = Field(default_factory=dict, description="GST slab per category")
+    margin_percent: Dict[str, Annotated[float, Field(ge=0)]] = Field(default_factory=dict, description="Margin on amount per category")
+    volume_discounts: List[VolumeDiscountTier] = Field(default_factory=list, description="Discount tiers; the highest tier reached applies")
+    include_row_profit: bool = Field(True, description="Add each inventory row's own profit on top of the margin")
 
 # Define response models
 class ComponentQuotation(BaseModel):
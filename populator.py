@@ -1,70 +1,239 @@
-import requests
+"""Load the material catalog from output_json/ into a running API.
+
+Chunks of items are posted concurrently to the batch ingestion endpoint
+(or one by one to the per-type endpoints with --batch-size 1), retried with
+exponential backoff, and recorded in a checkpoint file so an interrupted run
+picks up where it stopped. Batch upserts are idempotent, so re-sending a
+chunk after a crash is safe.
+
+    API_TOKEN=<admin access token> python populator.py --concurrency 8
+"""
+import argparse
+import asyncio
 import json
+import logging
 import os
-from pprint import pprint
+import random
+import time
+
+import httpx
 
 # Base URL of your FastAPI application
-BASE_URL = "http://localhost:8000/api"
+BASE_URL = "http://localhost:8000"
 
 # Path to the output_json folder
 OUTPUT_JSON_PATH = "output_json"
 
-# Function to load JSON data from a file
-def load_json(file_name):
-    file_path = os.path.join(OUTPUT_JSON_PATH, file_name)
-    print(file_path)
+CHECKPOINT_FILE = ".populator_checkpoint.json"
+
+# File name -> (material type for the batch endpoint, per-item endpoint)
+CATALOG_FILES = {
+    "Solar Panels.json": ("solar_panel", "solar-panels"),
+    "Inverters.json": ("inverter", "inverters"),
+    "Mounting Structures.json": ("mounting_structure", "mounting-structures"),
+    "BOS Components.json": ("bos_component", "bos-components"),
+    "Protection Equipment.json": ("protection_equipment", "protection-equipment"),
+    "Earthing Systems.json": ("earthing_system", "earthing-systems"),
+    "Net Metering.json": ("net_metering", "net-metering"),
+}
+
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+logger = logging.getLogger(__name__)
+
+
+class PermanentError(Exception):
+    """The server rejected the request; retrying will not help."""
+
+
+def load_json(data_dir, file_name):
+    file_path = os.path.join(data_dir, file_name)
+    if not os.path.exists(file_path):
+        return None
     with open(file_path, "r") as file:
         return json.load(file)
 
-# Load data from JSON files
-solar_panels = load_json("Solar Panels.json")
-for i in solar_panels:
-    print(i, end='\n')
-inverters = load_json("Inverters.json")
-mounting_structures = load_json("Mounting Structures.json")
-bos_components = load_json("BOS Components.json")
-protection_equipment = load_json("Protection Equipment.json")
-earthing_systems = load_json("Earthing Systems.json")
-net_meterings = load_json("Net Metering.json")
-
-# Function to make POST requests and handle responses
-def post_components(endpoint, component_list, component_type):
-    print(f"\n===== Adding {component_type} =====")
-    
-    for i, component in enumerate(component_list, 1):
+
+class Checkpoint:
+    """Indices of items already loaded, per material type, persisted after every chunk."""
+
+    def __init__(self, path, fresh=False):
+        self.path = path
+        self.done = {}
+        if path and not fresh and os.path.exists(path):
+            with open(path, "r") as file:
+                self.done = {key: set(indices) for key, indices in json.load(file).items()}
+
+    def is_done(self, material_type, index):
+        return index in self.done.get(material_type, ())
+
+    def mark(self, material_type, indices):
+        self.done.setdefault(material_type, set()).update(indices)
+        if not self.path:
+            return
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as file:
+            json.dump({key: sorted(indices) for key, indices in self.done.items()}, file)
+        os.replace(tmp_path, self.path)
+
+    def clear(self):
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class Progress:
+    def __init__(self, total, interval):
+        self.total = total
+        self.interval = interval
+        self.loaded = 0
+        self.failed = 0
+        self.requests = 0
+        self.retries = 0
+        self.started = time.monotonic()
+        self._last_report = self.started
+
+    def maybe_report(self, force=False):
+        now = time.monotonic()
+        if not force and now - self._last_report < self.interval:
+            return
+        self._last_report = now
+        elapsed = max(now - self.started, 1e-9)
+        print(
+            f"[{elapsed:6.1f}s] {self.loaded + self.failed}/{self.total} items "
+            f"({self.loaded} loaded, {self.failed} failed) | {self.loaded / elapsed:.1f} items/s | "
+            f"{self.requests} requests, {self.retries} retries"
+        )
+
+
+async def post_with_retry(client, url, payload, args, progress):
+    for attempt in range(args.retries + 1):
         try:
-            print(f"Payload for {component_type} #{i}:")
-            pprint(component)
-            response = requests.post(
-                f"{BASE_URL}/{endpoint}/",
-                json=component,
-                headers={"Content-Type": "application/json"}
+            response = await client.post(url, json=payload)
+            progress.requests += 1
+            if response.status_code not in RETRY_STATUS_CODES:
+                if response.status_code >= 400:
+                    raise PermanentError(f"{response.status_code}: {response.text[:200]}")
+                return response.json()
+            retry_after = response.headers.get("Retry-After")
+            delay = float(retry_after) if retry_after and retry_after.isdigit() else None
+            error = f"HTTP {response.status_code}"
+        except httpx.TransportError as e:
+            delay, error = None, repr(e)
+
+        if attempt == args.retries:
+            raise RuntimeError(f"Giving up after {args.retries + 1} attempts: {error}")
+        progress.retries += 1
+        if delay is None:
+            delay = min(args.max_backoff, args.backoff * 2 ** attempt) * (0.5 + random.random() / 2)
+        await asyncio.sleep(delay)
+
+
+async def load_chunk(client, chunk, args, checkpoint, progress):
+    material_type, endpoint, indexed_items = chunk
+    indices = [index for index, _ in indexed_items]
+    try:
+        if args.batch_size > 1:
+            result = await post_with_retry(
+                client, f"/api/materials/{material_type}/batch", [item for _, item in indexed_items], args, progress
             )
-            
-            # Check if request was successful
-            response.raise_for_status()
-            
-            # Print response
-            print(f"Added {component_type} #{i}:")
-            pprint(response.json())
-            
-        except requests.exceptions.RequestException as e:
-            print(f"Error adding {component_type} #{i}: {e}")
-            if hasattr(e, 'response') and e.response:
-                print(f"Response: {e.response.text}")
-
-# Execute POST requests for each component type
+            loaded = [index for index, item_result in zip(indices, result["results"]) if item_result["status"] != "error"]
+            for index, item_result in zip(indices, result["results"]):
+                if item_result["status"] == "error":
+                    print(f"  {material_type} #{index}: {item_result['error']}")
+        else:
+            index, item = indexed_items[0]
+            await post_with_retry(client, f"/api/{endpoint}/", item, args, progress)
+            loaded = [index]
+    except (PermanentError, RuntimeError) as e:
+        print(f"  {material_type} items {indices[0]}-{indices[-1]} failed: {e}")
+        loaded = []
+    except Exception:
+        # Anything unexpected fails this chunk only; the worker goes on with the rest of the queue
+        logger.exception("%s items %d-%d failed", material_type, indices[0], indices[-1])
+        loaded = []
+
+    checkpoint.mark(material_type, loaded)
+    progress.loaded += len(loaded)
+    progress.failed += len(indices) - len(loaded)
+    progress.maybe_report()
+
+
+async def worker(client, queue, args, checkpoint, progress):
+    while True:
+        chunk = await queue.get()
+        try:
+            await load_chunk(client, chunk, args, checkpoint, progress)
+        finally:
+            queue.task_done()
+
+
+def build_chunks(args, checkpoint):
+    chunks, total, skipped = [], 0, 0
+    size = max(1, args.batch_size)
+    for file_name, (material_type, endpoint) in CATALOG_FILES.items():
+        items = load_json(args.data_dir, file_name)
+        if items is None:
+            print(f"Skipping {file_name}: not found in {args.data_dir}")
+            continue
+        pending = [(index, item) for index, item in enumerate(items) if not checkpoint.is_done(material_type, index)]
+        skipped += len(items) - len(pending)
+        total += len(pending)
+        for start in range(0, len(pending), size):
+            chunks.append((material_type, endpoint, pending[start:start + size]))
+    return chunks, total, skipped
+
+
+async def populate(args):
+    checkpoint = Checkpoint(args.checkpoint, fresh=args.fresh)
+    chunks, total, skipped = build_chunks(args, checkpoint)
+    if skipped:
+        print(f"Resuming from {args.checkpoint}: {skipped} items already loaded")
+    print(f"Loading {total} items in {len(chunks)} requests with concurrency {args.concurrency}")
+
+    progress = Progress(total, args.report_interval)
+    queue = asyncio.Queue()
+    for chunk in chunks:
+        queue.put_nowait(chunk)
+
+    headers = {"Authorization": f"Bearer {args.token}"} if args.token else {}
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.base_url, headers=headers, limits=limits, timeout=args.timeout) as client:
+        workers = [asyncio.create_task(worker(client, queue, args, checkpoint, progress)) for _ in range(args.concurrency)]
+        await queue.join()
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+
+    progress.maybe_report(force=True)
+    if progress.failed == 0:
+        checkpoint.clear()
+        print("Completed adding all components!")
+    else:
+        print(f"{progress.failed} items failed; re-run to retry them (progress is kept in {args.checkpoint})")
+    return progress
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Load the material catalog into the Solar Quotation System API")
+    parser.add_argument("--base-url", default=os.getenv("API_BASE_URL", BASE_URL))
+    parser.add_argument("--token", default=os.getenv("API_TOKEN"), help="Admin access token (default: $API_TOKEN)")
+    parser.add_argument("--data-dir", default=OUTPUT_JSON_PATH)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--batch-size", type=int, default=200, help="Items per request; 1 posts items one by one")
+    parser.add_argument("--retries", type=int, default=5)
+    parser.add_argument("--backoff", type=float, default=0.5, help="Initial retry delay in seconds")
+    parser.add_argument("--max-backoff", type=float, default=30.0)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--checkpoint", default=CHECKPOINT_FILE)
+    parser.add_argument("--fresh", action="store_true", help="Ignore an existing checkpoint")
+    parser.add_argument("--report-interval", type=float, default=2.0)
+    return parser.parse_args(argv)
+
+
 def main():
     print("Starting to add components to the Solar Quotation System...")
-    
-    # Post all component types
-    post_components("solar-panels", solar_panels, "Solar Panel")
-    post_components("bos-components", bos_components, "BOS Component")
-    post_components("protection-equipment", protection_equipment, "Protection Equipment")
-    post_components("earthing-systems", earthing_systems, "Earthing System")
-    post_components("net-metering", net_meterings, "Net Metering")
-    
-    print("\nCompleted adding all components!")
+    asyncio.run(populate(parse_args()))
+
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,105 @@
+"""Per-user pricing rules for inventory quotations.
+
+A user's rules are a declarative document (see PricingRulesRequest):
+
+    {
+        "gst_percent": {"default": 18, "SolarPanels": 12},
+        "margin_percent": {"Inverters": 8},
+        "volume_discounts": [{"min_subtotal": 200000, "percent": 2}, {"min_subtotal": 500000, "percent": 4}],
+        "include_row_profit": true
+    }
+
+Rules are compiled once per rules version into per-category rates and a
+sorted tier table. A QuotationSpace then folds the per-line terms into
+each inventory row once, so every combination costs three sums and one
+bisect whatever the rules contain:
+
+    profit     = row profit (if included) + amount * margin%      per line
+    subtotal   = cost + profit
+    discount   = subtotal * tier%          tier: largest min_subtotal <= subtotal
+    gst        = sum(line price * gst%) * (1 - tier%)
+    grand_total = subtotal - discount + gst
+"""
+import threading
+from bisect import bisect_right
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# Users whose compiled rules are kept in memory
+PRICING_CACHE_USERS = 256
+
+
+class PricingRules:
+    """Compiled pricing rules; immutable, shared by every space built with them."""
+
+    def __init__(self, document: Dict, version: int = 0):
+        self.version = version
+        self.document = document
+        gst = document.get("gst_percent") or {}
+        margin = document.get("margin_percent") or {}
+        self._gst_default = gst.get("default", 0.0) / 100
+        self._gst = {category: percent / 100 for category, percent in gst.items() if category != "default"}
+        self._margin_default = margin.get("default", 0.0) / 100
+        self._margin = {category: percent / 100 for category, percent in margin.items() if category != "default"}
+        self.include_row_profit = document.get("include_row_profit", True)
+
+        tiers = sorted((tier["min_subtotal"], tier["percent"] / 100) for tier in document.get("volume_discounts") or [])
+        self._thresholds = [threshold for threshold, _ in tiers]
+        self._rates = [rate for _, rate in tiers]
+
+    @property
+    def has_discounts(self) -> bool:
+        return bool(self._thresholds)
+
+    def line_terms(self, category: str, amount: float, profit: float) -> Tuple[float, float, float]:
+        """(cost, profit, gst base) of one inventory row under these rules."""
+        profit = (profit if self.include_row_profit else 0) + amount * self._margin.get(category, self._margin_default)
+        return amount, profit, (amount + profit) * self._gst.get(category, self._gst_default)
+
+    def apply(self, costs: Sequence[float], profits: Sequence[float],
+              gst_bases: Sequence[float]) -> List[Tuple[float, Dict]]:
+        """Price a batch of combinations from their summed terms: (total_profit, pricing) each."""
+        thresholds, rates = self._thresholds, self._rates
+        priced = []
+        for cost, profit, gst_base in zip(costs, profits, gst_bases):
+            subtotal = cost + profit
+            tier = bisect_right(thresholds, subtotal) - 1
+            rate = rates[tier] if tier >= 0 else 0.0
+            discount = subtotal * rate
+            gst = gst_base * (1 - rate)
+            priced.append((round(profit - discount, 2), {
+                "subtotal": round(subtotal, 2),
+                "discount_percent": round(rate * 100, 4),
+                "discount": round(discount, 2),
+                "taxable_amount": round(subtotal - discount, 2),
+                "gst": round(gst, 2),
+                "grand_total": round(subtotal - discount + gst, 2),
+            }))
+        return priced
+
+
+class PricingRulesCache:
+    """Compiled rules per user, recompiled only when the user's rules version changes."""
+
+    def __init__(self, max_users: int = PRICING_CACHE_USERS):
+        self.max_users = max_users
+        self._rules: "OrderedDict[str, Tuple[int, Optional[PricingRules]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id: str, version: int, load: Callable[[], Optional[Dict]]) -> Optional[PricingRules]:
+        with self._lock:
+            cached = self._rules.get(user_id)
+            if cached is not None and cached[0] == version:
+                self._rules.move_to_end(user_id)
+                return cached[1]
+        document = load()
+        rules = PricingRules(document, version) if document else None
+        with self._lock:
+            self._rules[user_id] = (version, rules)
+            self._rules.move_to_end(user_id)
+            while len(self._rules) > self.max_users:
+                self._rules.popitem(last=False)
+        return rules
+
+
+pricing_rules = PricingRulesCache()
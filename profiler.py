@@ -0,0 +1,198 @@
+"""On-demand request profiling for admins.
+
+A request from an admin carrying ?profile=1 or an "X-Profile: 1" header runs
+under a sampling profiler. Every PROFILE_INTERVAL_MS a background thread
+records the stack of each busy thread: the event loop and the worker threads
+quotations are built in. Idle threads (waiting on a lock, queue or selector)
+are skipped. The result is kept in memory as collapsed stacks, the format
+flamegraph.pl and speedscope read, and its id is returned in the
+X-Profile-Id response header.
+
+Samples cover the whole process, so other requests served at the same time
+show up in the profile too. Only one request is profiled at a time; a second
+profiled request that arrives meanwhile is served normally.
+"""
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+from datetime import datetime
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs
+
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from auth import ensure_admin, get_current_user
+
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "20"))
+# Deeper stacks are cut at the root end, keeping the frames nearest the leaf
+PROFILE_MAX_DEPTH = 128
+
+# Leaf frames of threads that are waiting rather than working
+IDLE_FRAMES = {
+    ("threading.py", "wait"),
+    ("queue.py", "get"),
+    ("selectors.py", "select"),
+}
+
+_paths = sorted({os.path.abspath(path) for path in sys.path if path}, key=len, reverse=True)
+_labels: Dict = {}
+
+
+def frame_label(code) -> str:
+    """A stack frame as "package/module.py:function", without ";" (the collapsed-stack separator)."""
+    label = _labels.get(code)
+    if label is None:
+        filename = code.co_filename
+        for path in _paths:
+            if filename.startswith(path + os.sep):
+                filename = filename[len(path) + 1:]
+                break
+        label = _labels[code] = f"{filename}:{code.co_name}".replace(";", ",")
+    return label
+
+
+class Sampler:
+    """Background thread sampling the stacks of every other thread."""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                code = frame.f_code
+                if (os.path.basename(code.co_filename), code.co_name) in IDLE_FRAMES:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < PROFILE_MAX_DEPTH:
+                    stack.append(frame_label(frame.f_code))
+                    frame = frame.f_back
+                stack.append(names.get(ident, "thread").replace(";", ","))
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+
+class ProfileStore:
+    """The most recent PROFILE_KEEP profiles, newest last."""
+
+    def __init__(self, keep: int):
+        self.keep = keep
+        self._profiles: "OrderedDict[str, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, profile: Dict):
+        with self._lock:
+            self._profiles[profile["profile_id"]] = profile
+            while len(self._profiles) > self.keep:
+                self._profiles.popitem(last=False)
+
+    def get(self, profile_id: str) -> Optional[Dict]:
+        with self._lock:
+            return self._profiles.get(profile_id)
+
+    def summaries(self) -> List[Dict]:
+        with self._lock:
+            profiles = list(self._profiles.values())
+        return [{key: value for key, value in profile.items() if key != "stacks"} for profile in reversed(profiles)]
+
+
+def collapsed(profile: Dict) -> str:
+    """Profile stacks in collapsed format: one "frame;frame;frame count" line per stack."""
+    return "".join(f"{stack} {count}\n" for stack, count in profile["stacks"].most_common())
+
+
+profiles = ProfileStore(PROFILE_KEEP)
+
+
+def profile_requested(scope: Scope) -> bool:
+    for name, value in scope["headers"]:
+        if name == b"x-profile":
+            return value.decode("latin-1").lower() in ("1", "true")
+    values = parse_qs(scope["query_string"].decode("latin-1")).get("profile", [])
+    return any(value.lower() in ("1", "true") for value in values)
+
+
+def profiling_admin(scope: Scope) -> Optional[dict]:
+    """The admin asking for a profile, or None: anyone else is served unprofiled."""
+    for name, value in scope["headers"]:
+        if name == b"authorization":
+            scheme, _, token = value.decode("latin-1").partition(" ")
+            if scheme.lower() != "bearer" or not token:
+                return None
+            try:
+                return ensure_admin(get_current_user(token))
+            except HTTPException:
+                return None
+    return None
+
+
+class ProfilerMiddleware:
+    """Profiles requests from admins that ask for it."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        self._busy = threading.Lock()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or not profile_requested(scope):
+            await self.app(scope, receive, send)
+            return
+        # get_current_user reads Mongo; keep it off the event loop
+        user = await run_in_threadpool(profiling_admin, scope)
+        if user is None or not self._busy.acquire(blocking=False):
+            await self.app(scope, receive, send)
+            return
+
+        profile_id = uuid.uuid4().hex
+        status = 500
+
+        async def send_wrapper(message: Message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [(b"x-profile-id", profile_id.encode())]
+            await send(message)
+
+        sampler = Sampler(PROFILE_INTERVAL_MS / 1000)
+        started = time.perf_counter()
+        sampler.start()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # stop() joins the sampler thread, which may be in the middle of walking every stack
+            await run_in_threadpool(sampler.stop)
+            self._busy.release()
+            profiles.add({
+                "profile_id": profile_id,
+                "method": scope["method"],
+                "path": scope["path"],
+                "route": getattr(scope.get("route"), "path", scope["path"]),
+                "status": status,
+                "user": user.get("sub"),
+                "duration_ms": round((time.perf_counter() - started) * 1000, 3),
+                "interval_ms": PROFILE_INTERVAL_MS,
+                "samples": sampler.samples,
+                "created_at": datetime.utcnow(),
+                "stacks": sampler.stacks,
+            })
@@ -0,0 +1,549 @@
+import itertools
+import json
+import math
+import os
+import random
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Deque, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from metrics import cache_hit, cache_miss
+from pricing import PricingRules
+
+# Inventory category -> key of the chosen item in a quotation. A quotation picks one
+# item from each of these; the combination space is their cartesian product.
+CONFIGURABLE_CATEGORIES = (
+    ("SolarPanels", "SolarPanel"),
+    ("Inverters", "Inverter"),
+    ("MountingStructures", "MountingStructure"),
+    ("EarthingSystems", "EarthingSystem"),
+)
+# Every item of these categories is included in every quotation
+FIXED_CATEGORIES = ("BOSComponents", "ProtectionEquipment", "NetMetering")
+
+# Resolution of the value grid used to convolve per-category distributions. Value
+# ranges up to this many units are handled exactly (one cell per unit); wider
+# ranges are bucketed, which bounds the error of quantiles to a few cells.
+SUMMARY_GRID_CELLS = 1024
+
+# Admission limits for quotation generation
+MAX_QUOTATIONS_PER_REQUEST = int(os.getenv("MAX_QUOTATIONS_PER_REQUEST", "10000"))
+MAX_QUOTATIONS_PER_USER = int(os.getenv("MAX_QUOTATIONS_PER_USER", "50000"))
+QUOTATION_BUDGET_WINDOW_SECONDS = int(os.getenv("QUOTATION_BUDGET_WINDOW_SECONDS", "60"))
+# Number of quotations built to calibrate estimates
+ESTIMATE_PROBE_SIZE = 32
+
+# Inventories whose built quotations are kept in memory, and how many quotations each may keep
+QUOTATION_CACHE_USERS = int(os.getenv("QUOTATION_CACHE_USERS", "64"))
+QUOTATION_CACHE_SIZE = int(os.getenv("QUOTATION_CACHE_SIZE", "20000"))
+# Quotations kept across all users; a cached quotation takes roughly 0.7-1 KB
+QUOTATION_CACHE_TOTAL = int(os.getenv("QUOTATION_CACHE_TOTAL", "200000"))
+
+
+def to_int(component: list, index: int) -> int:
+    # Inventory rows are [model, quantity, rate, profit]; blanks and "N/A" count as 0
+    if len(component) > index and component[index] not in ["", "N/A"]:
+        return int(component[index])
+    return 0
+
+
+def item_keys(components: list) -> List[Tuple[str, int]]:
+    # Rows are identified by model; repeated models are told apart by occurrence
+    seen: Dict[str, int] = {}
+    keys = []
+    for component in components:
+        occurrence = seen.get(component[0], 0)
+        seen[component[0]] = occurrence + 1
+        keys.append((component[0], occurrence))
+    return keys
+
+
+def parse_line(component: list) -> Tuple[Dict, int]:
+    """Return the quotation line for an inventory row and the row's profit."""
+    quantity = to_int(component, 1)
+    rate = to_int(component, 2)
+    line = {
+        "model": component[0],
+        "quantity": quantity,
+        "rate": rate,
+        "amount": quantity * rate,
+    }
+    return line, to_int(component, 3)
+
+
+class QuotationLimitExceeded(Exception):
+    def __init__(self, message: str, status_code: int, retry_after: Optional[int] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class QuotationSpace:
+    """All quotations an inventory can produce, addressable by index.
+
+    Index i corresponds to the i-th element of itertools.product over the
+    configurable categories (the last category varies fastest), so any
+    quotation can be decoded directly without enumerating the ones before it.
+    Inventory rows are parsed once, and the fixed categories' totals are
+    computed once per inventory instead of once per quotation.
+
+    With pricing rules, each row's (cost, profit, GST base) terms are also
+    computed once here, and quotations are priced in batches (see price).
+    """
+
+    def __init__(self, inventory: Dict, pricing: Optional[PricingRules] = None):
+        self.user_id = inventory.get("user_id")
+        self.inventory_id = str(inventory["_id"])
+        self.pricing = pricing
+        self.pricing_version = pricing.version if pricing else None
+
+        # Per configurable category: list of (line, profit)
+        self.choices: List[List[Tuple[Dict, int]]] = [
+            [parse_line(component) for component in inventory.get(category, []) if component]
+            for category, _ in CONFIGURABLE_CATEGORIES
+        ]
+        self.radices = [len(choices) for choices in self.choices]
+        self.keys = [
+            item_keys([component for component in inventory.get(category, []) if component])
+            for category, _ in CONFIGURABLE_CATEGORIES
+        ]
+        # Per configurable category: (cost, profit, GST base) of each item
+        self.terms: List[List[Tuple[float, float, float]]] = [
+            [self._line_terms(category, line, profit) for line, profit in choices]
+            for (category, _), choices in zip(CONFIGURABLE_CATEGORIES, self.choices)
+        ]
+
+        self.fixed_lines: Dict[str, List[Dict]] = {}
+        self.fixed_amount = 0
+        self.fixed_profit = 0
+        fixed_terms = [0, 0, 0.0]
+        for category in FIXED_CATEGORIES:
+            parsed = [parse_line(component) for component in inventory.get(category, [])]
+            self.fixed_lines[category] = [line for line, _ in parsed]
+            self.fixed_amount += sum(line["amount"] for line, _ in parsed)
+            self.fixed_profit += sum(profit for _, profit in parsed)
+            for line, profit in parsed:
+                for term, value in enumerate(self._line_terms(category, line, profit)):
+                    fixed_terms[term] += value
+        self.fixed_terms = tuple(fixed_terms)
+
+        self.size = 1
+        for radix in self.radices:
+            self.size *= radix
+
+    def _line_terms(self, category: str, line: Dict, profit: int) -> Tuple[float, float, float]:
+        if self.pricing is None:
+            return line["amount"], profit, 0
+        return self.pricing.line_terms(category, line["amount"], profit)
+
+    def decode(self, index: int) -> Tuple[int, ...]:
+        """Turn a combination index into one item index per configurable category."""
+        if not 0 <= index < self.size:
+            raise IndexError(f"Combination {index} out of range (0-{self.size - 1})")
+        digits = []
+        for radix in reversed(self.radices):
+            index, digit = divmod(index, radix)
+            digits.append(digit)
+        return tuple(reversed(digits))
+
+    def encode(self, indices: Tuple[int, ...]) -> int:
+        index = 0
+        for radix, digit in zip(self.radices, indices):
+            index = index * radix + digit
+        return index
+
+    def price(self, combinations: Sequence[Tuple[int, ...]]) -> List[Tuple[float, float, Optional[Dict]]]:
+        """(total_cost, total_profit, pricing) of a batch of combinations given as item indices.
+
+        Each total is summed column by column over the whole batch from the
+        precomputed row terms, and the pricing rules' discount tiers are then
+        applied to the batch in one pass; no rule is looked up per quotation.
+        """
+        if not combinations:
+            return []
+        columns = list(zip(*combinations))
+        sums = []
+        for term, fixed in enumerate(self.fixed_terms):
+            chosen = [[terms[choice][term] for choice in column] for terms, column in zip(self.terms, columns)]
+            sums.append([fixed + sum(parts) for parts in zip(*chosen)])
+        costs, profits, gst_bases = sums
+        if self.pricing is None:
+            return [(float(cost), float(profit), None) for cost, profit in zip(costs, profits)]
+        return [
+            (float(cost), total_profit, pricing)
+            for cost, (total_profit, pricing) in zip(costs, self.pricing.apply(costs, profits, gst_bases))
+        ]
+
+    def build(self, combinations: Sequence[Tuple[int, ...]]) -> List[Dict]:
+        """Quotation documents for a batch of combinations given as item indices."""
+        return [self.document(indices, priced) for indices, priced in zip(combinations, self.price(combinations))]
+
+    def document(self, indices: Tuple[int, ...], priced: Tuple[float, float, Optional[Dict]]) -> Dict:
+        """The quotation document (same shape as InventoryQuotation) for item indices and their price.
+
+        Line dicts and the fixed categories' lists are the space's own, shared by
+        every quotation built from it (cached sets hold many), so treat them as read-only.
+        """
+        total_cost, total_profit, pricing = priced
+        quotation = {}
+        for (_, key), choices, choice in zip(CONFIGURABLE_CATEGORIES, self.choices, indices):
+            quotation[key] = choices[choice][0]
+        for category in FIXED_CATEGORIES:
+            quotation[category] = self.fixed_lines[category]
+
+        document = {
+            "user_id": self.user_id,
+            "inventory_id": self.inventory_id,
+            "quotation": quotation,
+            "total_cost": total_cost,  # Total amount is the cost
+            "total_profit": total_profit,
+        }
+        if pricing is not None:
+            document["pricing"] = pricing
+        return document
+
+    def combination_key(self, indices: Tuple[int, ...]) -> Tuple:
+        """Identity of a combination that survives reordering of the inventory rows."""
+        return tuple(keys[i] for keys, i in zip(self.keys, indices))
+
+    def compact(self, indices) -> List[Dict]:
+        """Quotations as combination index plus totals, to be expanded later against the same inventory."""
+        indices = list(indices)
+        priced = self.price([self.decode(index) for index in indices])
+        return [
+            {"index": index, "total_cost": total_cost, "total_profit": total_profit}
+            for index, (total_cost, total_profit, _) in zip(indices, priced)
+        ]
+
+    def iter_indices(self, limit: Optional[int] = None) -> Iterator[int]:
+        """Combination indices in product order, optionally only the first `limit`."""
+        return iter(range(self.size if limit is None else min(limit, self.size)))
+
+    def sample_indices(self, count: int, seed: Optional[int] = None) -> List[int]:
+        """Draw up to `count` distinct combination indices uniformly at random in O(count)."""
+        count = min(count, self.size)
+        rng = random.Random(seed)
+        if count * 2 >= self.size:
+            # Dense draw: the space is small enough to sample from directly
+            return rng.sample(range(self.size), count)
+        drawn: Dict[int, None] = {}
+        while len(drawn) < count:
+            drawn[rng.randrange(self.size)] = None
+        return list(drawn)
+
+    def quotations(self, indices) -> List[Dict]:
+        return self.build([self.decode(index) for index in indices])
+
+    def requested_count(self, max_quotations: Optional[int] = None, sample: Optional[int] = None) -> int:
+        """How many quotations a request with these parameters would build."""
+        if sample is not None:
+            return max(0, min(sample, self.size))
+        if max_quotations is not None:
+            return max(0, min(max_quotations, self.size))
+        return self.size
+
+    def estimate(self, count: int) -> Dict:
+        """Estimate response size and build time for `count` quotations from a small probe."""
+        probe = min(count, ESTIMATE_PROBE_SIZE)
+        if not probe:
+            return {"estimated_bytes": 0, "estimated_seconds": 0.0}
+        started = time.perf_counter()
+        quotations = self.quotations(self.iter_indices(probe))
+        serialized = json.dumps(quotations, default=str)
+        elapsed = time.perf_counter() - started
+        return {
+            "estimated_bytes": int(len(serialized) / probe * count),
+            "estimated_seconds": round(elapsed / probe * count, 4),
+        }
+
+    def summary(self, bins: int = 20) -> Dict:
+        """Statistics of total_cost and total_profit over every combination, without enumerating them.
+
+        Volume discounts depend on each combination's whole subtotal, so the
+        profit they leave cannot be convolved per category. Under rules with
+        discount tiers the profit statistics (margins included) are returned as
+        total_profit_before_discount, and total_profit is None.
+        """
+        cost_values = [[cost for cost, _, _ in terms] for terms in self.terms]
+        profit_values = [[profit for _, profit, _ in terms] for terms in self.terms]
+        profit = summarize_sum(profit_values, self.fixed_terms[1], bins) if self.size else None
+        summary = {
+            "count": self.size,
+            "total_cost": summarize_sum(cost_values, self.fixed_terms[0], bins) if self.size else None,
+            "total_profit": profit,
+        }
+        if self.pricing is not None and self.pricing.has_discounts:
+            summary.update(total_profit=None, total_profit_before_discount=profit)
+        return summary
+
+
+def _convolve(left: Dict[int, int], right: Dict[int, int]) -> Dict[int, int]:
+    result: Dict[int, int] = {}
+    for left_cell, left_count in left.items():
+        for right_cell, right_count in right.items():
+            cell = left_cell + right_cell
+            result[cell] = result.get(cell, 0) + left_count * right_count
+    return result
+
+
+def summarize_sum(categories: Sequence[Sequence[float]], offset: float, bins: int) -> Dict:
+    """Distribution of offset + one value from each category, over all combinations.
+
+    Mean and variance add across independent choices; the full distribution is
+    the convolution of the per-category value histograms, computed on a grid of
+    at most SUMMARY_GRID_CELLS cells.
+    """
+    minimum = offset + sum(min(values) for values in categories)
+    maximum = offset + sum(max(values) for values in categories)
+    mean = offset + sum(sum(values) / len(values) for values in categories)
+    variance = 0.0
+    for values in categories:
+        category_mean = sum(values) / len(values)
+        variance += sum((value - category_mean) ** 2 for value in values) / len(values)
+
+    value_range = maximum - minimum
+    width = value_range / SUMMARY_GRID_CELLS if value_range > SUMMARY_GRID_CELLS else 1.0
+    distribution = {0: 1}
+    for values in categories:
+        low = min(values)
+        cells: Dict[int, int] = {}
+        for value in values:
+            cell = round((value - low) / width)
+            cells[cell] = cells.get(cell, 0) + 1
+        distribution = _convolve(distribution, cells)
+
+    ordered = sorted(distribution.items())
+    total = sum(count for _, count in ordered)
+
+    def quantile(fraction: float) -> float:
+        target = fraction * total
+        running = 0
+        for cell, count in ordered:
+            running += count
+            if running >= target:
+                return min(maximum, minimum + cell * width)
+        return maximum
+
+    bins = max(1, bins)
+    bin_width = value_range / bins if value_range else 1.0
+    histogram = [0] * bins
+    for cell, count in ordered:
+        position = min(bins - 1, int(min(cell * width, value_range) / bin_width))
+        histogram[position] += count
+
+    return {
+        "min": minimum,
+        "max": maximum,
+        "mean": mean,
+        "std": math.sqrt(variance),
+        "median": quantile(0.5),
+        "p10": quantile(0.1),
+        "p90": quantile(0.9),
+        "histogram": [
+            {"from": minimum + i * bin_width, "to": minimum + (i + 1) * bin_width, "count": count}
+            for i, count in enumerate(histogram)
+        ],
+    }
+
+
+class QuotationBudget:
+    """Per-user sliding-window budget of generated quotations, plus a per-request cap."""
+
+    def __init__(self, per_request: int = MAX_QUOTATIONS_PER_REQUEST, per_user: int = MAX_QUOTATIONS_PER_USER,
+                 window_seconds: int = QUOTATION_BUDGET_WINDOW_SECONDS):
+        self.per_request = per_request
+        self.per_user = per_user
+        self.window_seconds = window_seconds
+        self._usage: Dict[str, Deque[Tuple[float, int]]] = {}
+        self._lock = threading.Lock()
+
+    def _used(self, user_id: str, now: float) -> Deque[Tuple[float, int]]:
+        usage = self._usage.setdefault(user_id, deque())
+        while usage and usage[0][0] <= now - self.window_seconds:
+            usage.popleft()
+        return usage
+
+    def _evaluate(self, user_id: str, count: int, now: float) -> Optional[QuotationLimitExceeded]:
+        if count > self.per_request:
+            return QuotationLimitExceeded(
+                f"Request would generate {count} quotations; the limit is {self.per_request} per request. "
+                f"Use max_quotations or sample to ask for fewer.",
+                status_code=413,
+            )
+        usage = self._used(user_id, now)
+        used = sum(n for _, n in usage)
+        if used + count <= self.per_user:
+            return None
+        # Wait until enough earlier requests leave the window
+        excess, retry_after = used + count - self.per_user, self.window_seconds
+        for at, n in usage:
+            excess -= n
+            if excess <= 0:
+                retry_after = at + self.window_seconds - now
+                break
+        return QuotationLimitExceeded(
+            f"Quotation budget exhausted: {used} of {self.per_user} quotations used in the last "
+            f"{self.window_seconds}s, this request needs {count}.",
+            status_code=429,
+            retry_after=max(1, math.ceil(retry_after)),
+        )
+
+    def check(self, user_id: str, count: int) -> Optional[QuotationLimitExceeded]:
+        """Return the error a request for `count` quotations would hit, without charging it."""
+        with self._lock:
+            return self._evaluate(user_id, count, time.monotonic())
+
+    def charge(self, user_id: str, count: int):
+        """Record `count` quotations for the user, or raise QuotationLimitExceeded."""
+        if count <= 0:
+            # Nothing is built; a negative count would hand budget back
+            return
+        with self._lock:
+            now = time.monotonic()
+            error = self._evaluate(user_id, count, now)
+            if error:
+                raise error
+            self._usage[user_id].append((now, count))
+
+
+quotation_budget = QuotationBudget()
+
+
+class QuotationSet:
+    """Quotations of one inventory, built on demand and patched when the inventory changes.
+
+    Built quotations are stored by combination key. When the inventory changes, only
+    combinations that involve a removed or changed item are dropped. Unchanged ones
+    are kept, and fixed-category edits are applied as a delta to their totals (or,
+    under pricing rules, whose discount tiers are not additive, drop everything).
+    Dropped combinations and those of new items are built on the next read that asks
+    for them.
+    """
+
+    def __init__(self, space: QuotationSpace, version: int, max_size: int = QUOTATION_CACHE_SIZE):
+        self.space = space
+        self.version = version
+        self.max_size = max_size
+        self.built: Dict[Tuple, Dict] = {}
+        # Held by QuotationSetCache while the set is patched or built
+        self.lock = threading.Lock()
+
+    def quotations(self, indices) -> List[Dict]:
+        result = []
+        misses: List[Tuple[int, Tuple[int, ...], Tuple]] = []
+        for index in indices:
+            digits = self.space.decode(index)
+            key = self.space.combination_key(digits)
+            quotation = self.built.get(key)
+            if quotation is None:
+                misses.append((len(result), digits, key))
+            result.append(quotation)
+        # Misses are built, and priced, as one batch
+        built = self.space.build([digits for _, digits, _ in misses])
+        for (position, _, key), quotation in zip(misses, built):
+            result[position] = quotation
+            if len(self.built) < self.max_size:
+                self.built[key] = quotation
+        cache_hit("quotation_set", len(result) - len(misses))
+        cache_miss("quotation_set", len(misses))
+        return result
+
+    def _stale_items(self, space: QuotationSpace) -> List[set]:
+        """Per configurable category, keys of items that were removed or changed."""
+        stale = []
+        for old_keys, old_choices, new_keys, new_choices in zip(
+                self.space.keys, self.space.choices, space.keys, space.choices):
+            current = dict(zip(new_keys, new_choices))
+            stale.append({key for key, choice in zip(old_keys, old_choices) if current.get(key) != choice})
+        return stale
+
+    def _drop(self, category: int, items: set):
+        # Enumerate the affected slice when it is smaller than the stored set
+        others = [len(keys) for i, keys in enumerate(self.space.keys) if i != category]
+        if len(items) * math.prod(others) < len(self.built):
+            slices = [items if i == category else keys for i, keys in enumerate(self.space.keys)]
+            for key in itertools.product(*slices):
+                self.built.pop(key, None)
+        else:
+            for key in [key for key in self.built if key[category] in items]:
+                del self.built[key]
+
+    def patch(self, space: QuotationSpace, version: int) -> Dict:
+        """Bring the set up to date with a newer inventory of the same user."""
+        before = len(self.built)
+        for category, items in enumerate(self._stale_items(space)):
+            if items:
+                self._drop(category, items)
+        dropped = before - len(self.built)
+
+        # Lines carry no profit, so a profit-only edit shows up in the terms alone
+        fixed_changed = (space.fixed_lines, space.fixed_terms) != (self.space.fixed_lines, self.space.fixed_terms)
+        if fixed_changed and space.pricing is not None:
+            dropped, self.built = before, {}
+        elif fixed_changed and self.built:
+            cost_delta = float(space.fixed_amount - self.space.fixed_amount)
+            profit_delta = float(space.fixed_profit - self.space.fixed_profit)
+            fixed = space.fixed_lines
+            # New dicts rather than in-place edits: earlier responses may still hold the old ones
+            self.built = {
+                key: {
+                    **quotation,
+                    "quotation": {**quotation["quotation"], **fixed},
+                    "total_cost": quotation["total_cost"] + cost_delta,
+                    "total_profit": quotation["total_profit"] + profit_delta,
+                }
+                for key, quotation in self.built.items()
+            }
+
+        self.space = space
+        self.version = version
+        return {"dropped": dropped, "kept": len(self.built), "fixed_changed": fixed_changed}
+
+
+class QuotationSetCache:
+    """Per-user QuotationSets, least recently used evicted first.
+
+    Bounded by number of users and by quotations held across all of them.
+    """
+
+    def __init__(self, max_users: int = QUOTATION_CACHE_USERS, max_total: int = QUOTATION_CACHE_TOTAL):
+        self.max_users = max_users
+        self.max_total = max_total
+        self._sets: "OrderedDict[str, QuotationSet]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _trim(self):
+        # Sizes of sets being built elsewhere are read without their locks, so the total is approximate
+        total = sum(len(quotation_set.built) for quotation_set in self._sets.values())
+        while len(self._sets) > 1 and (len(self._sets) > self.max_users or total > self.max_total):
+            _, evicted = self._sets.popitem(last=False)
+            total -= len(evicted.built)
+
+    def quotations(self, user_id: str, version: int, space: QuotationSpace, indices) -> List[Dict]:
+        # The cache lock covers lookup and LRU bookkeeping only; patching and building hold the
+        # set's own lock, so builds for different users run in parallel
+        with self._lock:
+            quotation_set = self._sets.get(user_id)
+            if (quotation_set is None or quotation_set.space.inventory_id != space.inventory_id
+                    or quotation_set.space.pricing_version != space.pricing_version):
+                quotation_set = QuotationSet(space, version, max_size=min(QUOTATION_CACHE_SIZE, self.max_total))
+            self._sets[user_id] = quotation_set
+            self._sets.move_to_end(user_id)
+            self._trim()
+
+        with quotation_set.lock:
+            if quotation_set.version != version:
+                quotation_set.patch(space, version)
+            quotations = quotation_set.quotations(indices)
+        with self._lock:
+            self._trim()
+        return quotations
+
+    def invalidate(self, user_id: str):
+        with self._lock:
+            self._sets.pop(user_id, None)
+
+
+quotation_sets = QuotationSetCache()
+
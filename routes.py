@@ -1,25 +1,53 @@
-import itertools
+import hashlib
+import json
+import logging
 import os
-from fastapi import APIRouter, Body, HTTPException, Query, status
-from typing import List, Dict, Union
+from fastapi import APIRouter, Body, File, HTTPException, Query, Request, Response, UploadFile, status
+from typing import List, Dict, Optional, Union
 from datetime import datetime
 from fastapi import Depends
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse
 import httpx
 from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError
 from bson import ObjectId
 from fastapi.encoders import jsonable_encoder
+from fastapi.concurrency import run_in_threadpool
+from pydantic import ValidationError
 
 # Import your component models
 from models import (
-    ComponentResponse, InventoryQuotation, SolarPanel, Inverter, MountingStructure, BOSComponent, 
-    ProtectionEquipment, EarthingSystem, NetMetering,
+    BatchMaterialResponse, ComponentResponse, InventoryImportResponse, SolarPanel, Inverter, MountingStructure, BOSComponent, 
+    ProtectionEquipment, EarthingSystem, NetMetering, MATERIAL_MODELS, PricingRulesRequest, QuotationFilterRequest,
+    QuotationResponse,
+)
+from db import (
+    db_manager, inventory_version_key, material_version_key, pricing_version_key, MATERIAL_KEY_FIELDS,
+    MATERIAL_SORT_FIELDS,
 )
-from db import db_manager
 from auth import create_access_token, create_refresh_token, oauth2_scheme, get_current_user, admin_only_route
+from catalog_cache import catalog_snapshot
+from catalog_quotation import build_catalog_quotations
+from catalog_search import catalog_index, DEFAULT_RESULT_LIMIT
+from admission import admit, limiters, Overloaded
+from quotation_engine import QuotationLimitExceeded, QuotationSpace, quotation_budget, quotation_sets
+from pricing import PricingRules, pricing_rules
+from single_flight import SingleFlight
+from metrics import QUOTATION_COMBINATIONS, QUOTATIONS_RETURNED, cache_hit, latest
+from tracing import span
+from profiler import collapsed, profiles
+from inventory_import import (
+    INVENTORY_CATEGORIES, IMPORT_CHUNK_SIZE, MAX_REPORTED_ERRORS, iter_inventory_rows, validate_row,
+)
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
+
+# In-flight inventory quotation computations, keyed by user, inventory version and parameters
+quotation_flights = SingleFlight("quotation_flight")
+
 
+READINESS_TIMEOUT_SECONDS = float(os.getenv("READINESS_TIMEOUT_SECONDS", "2"))
 
 GOOGLE_CLIENT_ID = os.getenv("GOOGLE_CLIENT_ID")
 GOOGLE_CLIENT_SECRET = os.getenv("GOOGLE_CLIENT_SECRET")
@@ -30,6 +58,49 @@ async def root():
     return {"message": "Valency Energy:---- Solar Quotation System API"}
 
 
+# Prometheus scrape endpoint
+@router.get("/metrics", include_in_schema=False)
+async def metrics():
+    body, content_type = latest()
+    return Response(content=body, media_type=content_type)
+
+
+# Liveness: the process is serving requests; never touches MongoDB
+@router.get("/healthz", include_in_schema=False)
+async def healthz():
+    return {"status": "ok"}
+
+
+# Readiness: MongoDB answers a ping; index builds may still be running
+@router.get("/readyz", include_in_schema=False)
+async def readyz():
+    try:
+        await run_in_threadpool(db_manager.ping, READINESS_TIMEOUT_SECONDS)
+    except Exception as e:
+        return JSONResponse(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            content={"status": "unavailable", "detail": type(e).__name__, "indexes": db_manager.index_state},
+        )
+    return {"status": "ready", "indexes": db_manager.index_state}
+
+
+# Request profiles recorded for ?profile=1 / X-Profile: 1, newest first
+@router.get("/api/admin/profiles")
+@admin_only_route
+async def list_profiles(user: dict = Depends(get_current_user)):
+    return {"profiles": profiles.summaries()}
+
+
+@router.get("/api/admin/profiles/{profile_id}", response_class=PlainTextResponse)
+@admin_only_route
+async def get_profile(profile_id: str, user: dict = Depends(get_current_user)):
+    # Collapsed stacks, ready for flamegraph.pl or speedscope
+    profile = profiles.get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail=f"Profile not found: {profile_id}")
+    return PlainTextResponse(collapsed(profile))
+
+
 @router.post("/auth/")
 async def google_login(data: Dict = Body(...)):
     role = data.get("role", "user") 
@@ -161,12 +232,174 @@ async def logout(token: str = Depends(oauth2_scheme)):
         )
 
 
+# ------------------------ conditional GET helpers
+# ETags are derived from the per-document/collection version counters, so checking
+# freshness only costs a version lookup.
+def make_etag(version_key: str, version: int) -> str:
+    digest = hashlib.sha1(version_key.encode()).hexdigest()[:12]
+    return f'W/"{digest}-{version}"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    # Weak comparison: W/"x" and "x" are treated as the same tag
+    candidates = {tag.strip().removeprefix("W/") for tag in header.split(",")}
+    return etag.removeprefix("W/") in candidates
+
+
+def cache_headers(etag: str) -> Dict[str, str]:
+    # Responses depend on the bearer token, so shared caches must not reuse them
+    return {"ETag": etag, "Cache-Control": "private, no-cache", "Vary": "Authorization"}
+
+
+def not_modified(etag: str) -> Response:
+    cache_hit("etag")
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=cache_headers(etag))
+
+
+def split_query_list(value: Optional[str]) -> Optional[List[str]]:
+    # "brand, model_number,rate" -> ["brand", "model_number", "rate"]
+    if not value:
+        return None
+    items = [item.strip() for item in value.split(",") if item.strip()]
+    return items or None
+
+
+def material_fields(material_type: str, fields: Optional[str]) -> Optional[List[str]]:
+    requested = split_query_list(fields)
+    if not requested:
+        return None
+    allowed = set(MATERIAL_MODELS[material_type].model_fields) | {"_id", "created_at"}
+    unknown = [field for field in requested if field not in allowed]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields for {material_type}: {', '.join(unknown)}")
+    return requested
+
+
+MAX_PAGE_SIZE = 500
+
+
+def material_list_params(
+    fields: Optional[str] = Query(None, description="Comma-separated fields to return, e.g. brand,model_number,rate"),
+    brand: Optional[str] = Query(None, description="Comma-separated brands"),
+    technology: Optional[str] = Query(None, description="Comma-separated panel technologies"),
+    material: Optional[str] = Query(None, description="Comma-separated materials"),
+    component_type: Optional[str] = Query(None, description="Comma-separated component types"),
+    structure_type: Optional[str] = Query(None, description="Comma-separated mounting structure types"),
+    min_rate: Optional[float] = Query(None, ge=0),
+    max_rate: Optional[float] = Query(None, ge=0),
+    in_stock: bool = Query(False, description="Only items with quantity > 0"),
+    sort: str = Query("_id", description=f"One of {', '.join(MATERIAL_SORT_FIELDS)}"),
+    order: str = Query("asc", pattern="^(asc|desc)$"),
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE, description="Page size; omit to return every match"),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+) -> dict:
+    return {
+        "fields": fields,
+        "equals": {
+            "brand": brand,
+            "technology": technology,
+            "material": material,
+            "component_type": component_type,
+            "structure_type": structure_type,
+        },
+        "min_rate": min_rate,
+        "max_rate": max_rate,
+        "in_stock": in_stock,
+        "sort": sort,
+        "order": order,
+        "limit": limit,
+        "cursor": cursor,
+    }
+
+
+def material_filters(material_type: str, params: dict) -> dict:
+    # Equality filters only apply to types whose model has the field
+    model_fields = MATERIAL_MODELS[material_type].model_fields
+    filters = {}
+    for field, value in params["equals"].items():
+        values = split_query_list(value)
+        if not values:
+            continue
+        if field not in model_fields:
+            raise HTTPException(status_code=400, detail=f"{material_type} cannot be filtered by {field}")
+        filters[field] = values[0] if len(values) == 1 else {"$in": values}
+
+    rate_range = {}
+    if params["min_rate"] is not None:
+        rate_range["$gte"] = params["min_rate"]
+    if params["max_rate"] is not None:
+        rate_range["$lte"] = params["max_rate"]
+    if rate_range:
+        filters["rate"] = rate_range
+    if params["in_stock"]:
+        filters["quantity"] = {"$gt": 0}
+    return filters
+
+
+def list_materials(material_type: str, response_key: str, request: Request, response: Response, params: dict):
+    projection = material_fields(material_type, params["fields"])
+    filters = material_filters(material_type, params)
+    if params["sort"] not in MATERIAL_SORT_FIELDS:
+        raise HTTPException(status_code=400, detail=f"Cannot sort by {params['sort']}")
+
+    # Plain full listings are served from the in-process snapshot without touching Mongo
+    if not filters and not params["limit"] and not params["cursor"] and params["sort"] == "_id" and params["order"] == "asc":
+        table = catalog_snapshot.table(material_type)
+        etag = make_etag(material_version_key(material_type), table.version)
+        if etag_matches(request, etag):
+            return not_modified(etag)
+        response.headers.update(cache_headers(etag))
+        return {response_key: table.to_dicts(projection), "next_cursor": None}
+
+    # The page comes from a secondary that has caught up with the version in the ETag
+    with db_manager.causal_session() as session:
+        etag = make_etag(
+            material_version_key(material_type),
+            db_manager.get_version(material_version_key(material_type), session=session),
+        )
+        if etag_matches(request, etag):
+            return not_modified(etag)
+
+        try:
+            materials, next_cursor = db_manager.query_materials(
+                material_type,
+                filters=filters,
+                sort_field=params["sort"],
+                descending=params["order"] == "desc",
+                limit=params["limit"],
+                cursor=params["cursor"],
+                fields=projection,
+                session=session,
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    response.headers.update(cache_headers(etag))
+    return {response_key: materials, "next_cursor": next_cursor}
+
+
 # Convert Pydantic models to dict with additional fields
 def prepare_component_data(component):
     component_dict = component.dict()
     component_dict["created_at"] = datetime.now()
     return component_dict
 
+
+def add_catalog_item(material_type: str, component, name: str) -> dict:
+    try:
+        inserted_id = db_manager.add_material(material_type, prepare_component_data(component))
+    except DuplicateKeyError:
+        # Catalog keys are unique; updates go through the batch endpoint, which upserts
+        raise HTTPException(
+            status_code=409,
+            detail=f"{name} with this {' + '.join(MATERIAL_KEY_FIELDS[material_type])} already exists",
+        )
+    return {"id": inserted_id, "message": f"{name} added successfully"}
+
 # Solar Panel Endpoints
 @router.post("/api/solar-panels/", response_model=ComponentResponse)
 @admin_only_route
@@ -175,107 +408,172 @@ async def add_solar_panel(
     user: dict = Depends(get_current_user)
 ):
     try:
-        panel_data = prepare_component_data(panel)
-        inserted_id = db_manager.add_material("solar_panel", panel_data)
-        return {"id": inserted_id, "message": "Solar panel added successfully"}
+        return add_catalog_item("solar_panel", panel, "Solar panel")
     except Exception as e:
+        if isinstance(e, HTTPException):
+            raise e
         raise HTTPException(status_code=500, detail=f"Failed to add solar panel: {str(e)}")
 
 @router.get("/api/solar-panels/")
 @admin_only_route
-async def get_solar_panels(user: dict = Depends(get_current_user)):
+async def get_solar_panels(request: Request, response: Response, params: dict = Depends(material_list_params), user: dict = Depends(get_current_user)):
     try:
-        panels = db_manager.get_all_materials("solar_panel")
-        return {"solar_panels": panels}
+        return list_materials("solar_panel", "solar_panels", request, response, params)
     except Exception as e:
+        if isinstance(e, HTTPException):
+            raise e
         raise HTTPException(status_code=500, detail=f"Failed to retrieve solar panels: {str(e)}")
 
 @router.post("/api/inverters/", response_model=ComponentResponse)
 @admin_only_route
 async def add_inverter(inverter: Inverter = Body(...), user: dict = Depends(get_current_user)):
-    inverter_data = prepare_component_data(inverter)
-    inserted_id = db_manager.add_material("inverter", inverter_data)
-    return {"id": inserted_id, "message": "Inverter added successfully"}
+    return add_catalog_item("inverter", inverter, "Inverter")
 
 @router.get("/api/inverters/")
 @admin_only_route
-async def get_inverters(user: dict = Depends(get_current_user)):
-    inverters = db_manager.get_all_materials("inverter")
-    return {"inverters": inverters}
+async def get_inverters(request: Request, response: Response, params: dict = Depends(material_list_params), user: dict = Depends(get_current_user)):
+    return list_materials("inverter", "inverters", request, response, params)
 
 # Mounting Structure Endpoints
 @router.post("/api/mounting-structures/", response_model=ComponentResponse)
 @admin_only_route
 async def add_mounting_structure(structure: MountingStructure = Body(...), user: dict = Depends(get_current_user)):
-    structure_data = prepare_component_data(structure)
-    inserted_id = db_manager.add_material("mounting_structure", structure_data)
-    return {"id": inserted_id, "message": "Mounting structure added successfully"}
+    return add_catalog_item("mounting_structure", structure, "Mounting structure")
 
 @router.get("/api/mounting-structures/")
 @admin_only_route
-async def get_mounting_structures(user: dict = Depends(get_current_user)):
-    structures = db_manager.get_all_materials("mounting_structure")
-    return {"mounting_structures": structures}
+async def get_mounting_structures(request: Request, response: Response, params: dict = Depends(material_list_params), user: dict = Depends(get_current_user)):
+    return list_materials("mounting_structure", "mounting_structures", request, response, params)
 
 
 # BOS Component Endpoints
 @router.post("/api/bos-components/", response_model=ComponentResponse)
 @admin_only_route
 async def add_bos_component(component: BOSComponent = Body(...), user: dict = Depends(get_current_user)):
-    component_data = prepare_component_data(component)
-    inserted_id = db_manager.add_material("bos_component", component_data)
-    return {"id": inserted_id, "message": "BOS component added successfully"}
+    return add_catalog_item("bos_component", component, "BOS component")
 
 @router.get("/api/bos-components/")
 @admin_only_route
-async def get_bos_components(user: dict = Depends(get_current_user)):
-    components = db_manager.get_all_materials("bos_component")
-    return {"bos_components": components}
+async def get_bos_components(request: Request, response: Response, params: dict = Depends(material_list_params), user: dict = Depends(get_current_user)):
+    return list_materials("bos_component", "bos_components", request, response, params)
 
 
 # Protection Equipment Endpoints
 @router.post("/api/protection-equipment/", response_model=ComponentResponse)
 @admin_only_route
 async def add_protection_equipment(equipment: ProtectionEquipment = Body(...), user: dict = Depends(get_current_user)):
-    equipment_data = prepare_component_data(equipment)
-    inserted_id = db_manager.add_material("protection_equipment", equipment_data)
-    return {"id": inserted_id, "message": "Protection equipment added successfully"}
+    return add_catalog_item("protection_equipment", equipment, "Protection equipment")
 
 @router.get("/api/protection-equipment/")
 @admin_only_route
-async def get_protection_equipment(user: dict = Depends(get_current_user)):
-    equipment = db_manager.get_all_materials("protection_equipment")
-    return {"protection_equipment": equipment}
+async def get_protection_equipment(request: Request, response: Response, params: dict = Depends(material_list_params), user: dict = Depends(get_current_user)):
+    return list_materials("protection_equipment", "protection_equipment", request, response, params)
 
 
 # Earthing System Endpoints
 @router.post("/api/earthing-systems/", response_model=ComponentResponse)
 @admin_only_route
 async def add_earthing_system(system: EarthingSystem = Body(...), user: dict = Depends(get_current_user)):
-    system_data = prepare_component_data(system)
-    inserted_id = db_manager.add_material("earthing_system", system_data)
-    return {"id": inserted_id, "message": "Earthing system added successfully"}
+    return add_catalog_item("earthing_system", system, "Earthing system")
 
 @router.get("/api/earthing-systems/")
 @admin_only_route
-async def get_earthing_systems(user: dict = Depends(get_current_user)):
-    systems = db_manager.get_all_materials("earthing_system")
-    return {"earthing_systems": systems}
+async def get_earthing_systems(request: Request, response: Response, params: dict = Depends(material_list_params), user: dict = Depends(get_current_user)):
+    return list_materials("earthing_system", "earthing_systems", request, response, params)
 
 
 # Net Metering Endpoints
 @router.post("/api/net-metering/", response_model=ComponentResponse)
 @admin_only_route
 async def add_net_metering(metering: NetMetering = Body(...), user: dict = Depends(get_current_user)):
-    metering_data = prepare_component_data(metering)
-    inserted_id = db_manager.add_material("net_metering", metering_data)
-    return {"id": inserted_id, "message": "Net metering added successfully"}
+    return add_catalog_item("net_metering", metering, "Net metering")
 
 @router.get("/api/net-metering/")
 @admin_only_route
-async def get_net_metering(user: dict = Depends(get_current_user)):
-    metering = db_manager.get_all_materials("net_metering")
-    return {"net_metering": metering}
+async def get_net_metering(request: Request, response: Response, params: dict = Depends(material_list_params), user: dict = Depends(get_current_user)):
+    return list_materials("net_metering", "net_metering", request, response, params)
+
+MAX_BATCH_SIZE = 5000
+
+
+# Batch ingestion: validate a list of items of one material type and upsert them by brand+model
+def upsert_material_batch(material_type: str, items: List[Dict]) -> dict:
+    """Validate and upsert one batch of catalog items; blocking, so run off the event loop."""
+    model = MATERIAL_MODELS[material_type]
+    key_fields = MATERIAL_KEY_FIELDS[material_type]
+    results = [None] * len(items)
+    valid, valid_indices, seen_keys = [], [], {}
+
+    for index, item in enumerate(items):
+        try:
+            material = model(**item).dict()
+        except ValidationError as e:
+            errors = "; ".join(f"{'.'.join(str(loc) for loc in err['loc'])}: {err['msg']}" for err in e.errors())
+            results[index] = {"index": index, "status": "error", "error": errors}
+            continue
+        key = tuple(material[field] for field in key_fields)
+        if key in seen_keys:
+            results[index] = {"index": index, "status": "error", "error": f"Duplicate of item {seen_keys[key]} in this batch"}
+            continue
+        seen_keys[key] = index
+        valid.append(material)
+        valid_indices.append(index)
+
+    for index, result in zip(valid_indices, db_manager.upsert_materials(material_type, valid)):
+        results[index] = {"index": index, **result}
+
+    statuses = [result["status"] for result in results]
+    return {
+        "inserted": statuses.count("inserted"),
+        "updated": statuses.count("updated"),
+        "failed": statuses.count("error"),
+        "results": results,
+    }
+
+
+@router.post("/api/materials/{material_type}/batch", response_model=BatchMaterialResponse)
+@admin_only_route
+async def add_materials_batch(
+    material_type: str,
+    items: List[Dict] = Body(...),
+    slot: None = Depends(admit("imports")),
+    user: dict = Depends(get_current_user)
+):
+    if material_type not in MATERIAL_MODELS:
+        raise HTTPException(status_code=404, detail=f"Unknown material type: {material_type}")
+    if len(items) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_SIZE} items per batch")
+
+    try:
+        # Validation and the bulk write run in the threadpool, holding the "imports" slot throughout
+        return await run_in_threadpool(upsert_material_batch, material_type, items)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to add {material_type} batch: {str(e)}")
+
+
+# Catalog search / autocomplete across every material type
+@router.get("/api/catalog/search")
+async def search_catalog(
+    q: str = Query(..., min_length=1, description="Search text, matched as prefixes of brand, model and specifications"),
+    types: Optional[str] = Query(None, description="Comma-separated material types, e.g. solar_panel,inverter"),
+    limit: int = Query(DEFAULT_RESULT_LIMIT, ge=1, le=50),
+    user: dict = Depends(get_current_user)
+):
+    material_types = split_query_list(types)
+    if material_types:
+        unknown = [name for name in material_types if name not in MATERIAL_MODELS]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown material types: {', '.join(unknown)}")
+    try:
+        results = catalog_index.search(q, limit=limit, material_types=material_types)
+        return {"results": results, "count": len(results)}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to search catalog: {str(e)}")
+
+def limit_exceeded(error: Union[QuotationLimitExceeded, Overloaded]) -> HTTPException:
+    headers = {"Retry-After": str(error.retry_after)} if error.retry_after else None
+    return HTTPException(status_code=error.status_code, detail=str(error), headers=headers)
+
 
 def sanitize_mongo_document(doc: dict) -> dict:
     """Convert ObjectId and datetime in a MongoDB document to JSON-serializable types."""
@@ -321,6 +619,14 @@ async def add_user_info(user: dict = Depends(get_current_user), info: dict = Bod
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to update user info: {str(e)}")
 
+def empty_inventory(user_id: str) -> dict:
+    inventory_data = {"user_id": user_id}
+    for category in INVENTORY_CATEGORIES:
+        inventory_data[category] = []
+    inventory_data["created_at"] = datetime.now()
+    inventory_data["updated_at"] = datetime.now()
+    return inventory_data
+
 #------------------------these are the routes for the quotation generation 
 # Add to Inventory (Admin Only)
 # saving the inventory to the database 
@@ -337,18 +643,7 @@ async def add_to_inventory(
 
         if not inventory:
             # If no inventory exists, create a new one with all items
-            inventory_data = {
-                "user_id": user_id,
-                "SolarPanels": [],
-                "Inverters": [],
-                "MountingStructures": [],
-                "BOSComponents": [],
-                "ProtectionEquipment": [],
-                "EarthingSystems": [],
-                "NetMetering": [],
-                "created_at": datetime.now(),
-                "updated_at": datetime.now(),
-            }
+            inventory_data = empty_inventory(user_id)
 
             for category, components in items.items():
                 if category in inventory_data:
@@ -383,6 +678,7 @@ async def add_to_inventory(
                     inventory_data[category] = processed_components
 
             insert_result = inventory_collection.insert_one(inventory_data)
+            db_manager.bump_version(inventory_version_key(user_id))
             return {"id": str(insert_result.inserted_id), "message": "Inventory created successfully"}
 
         else:
@@ -453,6 +749,7 @@ async def add_to_inventory(
             # Execute the bulk write if we have operations
             if update_operations:
                 inventory_collection.bulk_write(update_operations)
+                db_manager.bump_version(inventory_version_key(user_id))
                 
             # Return appropriate message based on whether new items were added
             if new_items_added:
@@ -462,14 +759,103 @@ async def add_to_inventory(
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to update inventory: {str(e)}")
-    
+
+
+# Bulk import inventory from a CSV/XLSX sheet with columns: category, model, quantity, rate, profit
+def import_inventory_rows(user_id: str, filename: str, stream) -> dict:
+    """Parse, validate and append an uploaded inventory file; blocking, so run off the event loop."""
+    inventory_collection = db_manager.collections["inventories"]
+    inventory = inventory_collection.find_one({"user_id": user_id})
+    if not inventory:
+        inventory = empty_inventory(user_id)
+        inventory["_id"] = inventory_collection.insert_one(inventory).inserted_id
+        db_manager.bump_version(inventory_version_key(user_id))
+
+    # Model names already present per category; rows repeating them are skipped like in add_to_inventory
+    known_models = {
+        category: {component[0] for component in inventory.get(category, []) if component}
+        for category in INVENTORY_CATEGORIES
+    }
+    chunk = {category: [] for category in INVENTORY_CATEGORIES}
+    chunk_size = 0
+    imported = duplicates = failed = 0
+    errors = []
+
+    for row_number, values in iter_inventory_rows(filename, stream):
+        try:
+            category, component = validate_row(values)
+        except ValueError as e:
+            failed += 1
+            if len(errors) < MAX_REPORTED_ERRORS:
+                errors.append({"row": row_number, "error": str(e)})
+            continue
+
+        if component[0] in known_models[category]:
+            duplicates += 1
+            continue
+        known_models[category].add(component[0])
+        chunk[category].append(component)
+        chunk_size += 1
+
+        if chunk_size >= IMPORT_CHUNK_SIZE:
+            db_manager.push_inventory_components(user_id, chunk)
+            imported += chunk_size
+            chunk = {category: [] for category in INVENTORY_CATEGORIES}
+            chunk_size = 0
+
+    if chunk_size:
+        db_manager.push_inventory_components(user_id, chunk)
+        imported += chunk_size
+
+    return {
+        "id": str(inventory["_id"]),
+        "message": f"Imported {imported} components",
+        "imported": imported,
+        "duplicates": duplicates,
+        "failed": failed,
+        "errors": errors,
+    }
+
+
+@router.post("/api/inventory/import", response_model=InventoryImportResponse)
+@admin_only_route
+async def import_inventory(
+    file: UploadFile = File(...),
+    slot: None = Depends(admit("imports")),
+    user: dict = Depends(get_current_user)
+):
+    try:
+        # Parsing and the chunked writes take seconds for large files; keep them off the event loop
+        return await run_in_threadpool(import_inventory_rows, user.get("sub"), file.filename, file.file)
+
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to import inventory: {str(e)}")
+
 
 # Get Inventory (User and Admin)
 @router.get("/api/inventory/", response_model=Dict)
-async def get_user_inventory(user: dict = Depends(get_current_user)):
+async def get_user_inventory(
+    request: Request,
+    response: Response,
+    category: Optional[str] = Query(None, description="Comma-separated inventory categories to return, e.g. SolarPanels,Inverters"),
+    user: dict = Depends(get_current_user)
+):
     try:
         user_id = user.get("sub")
-        inventory = db_manager.get_user_inventory(user_id)
+        categories = split_query_list(category)
+        if categories:
+            unknown = [name for name in categories if name not in INVENTORY_CATEGORIES]
+            if unknown:
+                raise HTTPException(status_code=400, detail=f"Unknown inventory categories: {', '.join(unknown)}")
+        version_key = inventory_version_key(user_id)
+        with db_manager.causal_session() as session:
+            etag = make_etag(version_key, db_manager.get_version(version_key, session=session))
+            if etag_matches(request, etag):
+                return not_modified(etag)
+
+            inventory = db_manager.get_user_inventory(user_id, categories, session=session)
 
         if not inventory:
             raise HTTPException(
@@ -478,6 +864,7 @@ async def get_user_inventory(user: dict = Depends(get_current_user)):
             )
 
         inventory["_id"] = str(inventory["_id"])
+        response.headers.update(cache_headers(etag))
         return inventory
 
     except Exception as e:
@@ -510,6 +897,8 @@ async def delete_entire_inventory(
         
         # Delete the entire inventory document
         result = db_manager.collections["inventories"].delete_one({"user_id": user_id})
+        db_manager.bump_version(inventory_version_key(user_id))
+        quotation_sets.invalidate(user_id)
         
         if result.deleted_count == 0:
             raise HTTPException(
@@ -531,181 +920,225 @@ async def delete_entire_inventory(
         )      
         
         
-#this will help in generating the quotations for the user by permuting the components in the inventory
-@router.get("/api/inventory/quotations")
-async def generate_user_quotations(max_quotations: int = Query(None, description="Maximum number of quotations to generate"), user: dict = Depends(get_current_user)):
-    try:
-        user_id = user.get("sub")
-        inventory = db_manager.get_user_inventory(user_id)
-        
+def encode_json(content) -> bytes:
+    # Same bytes as JSONResponse; jsonable_encoder is only called for values json cannot encode,
+    # since running it over a whole quotation list is about ten times slower than json.dumps
+    return json.dumps(
+        content, ensure_ascii=False, allow_nan=False, separators=(",", ":"), default=jsonable_encoder,
+    ).encode("utf-8")
+
+
+async def serialize(result: dict) -> Response:
+    # Large quotation lists are encoded off the event loop, in a span of their own
+    with span("response.serialize"):
+        return Response(content=await run_in_threadpool(encode_json, result), media_type="application/json")
+
+
+def pricing_rules_for(user_id: str) -> Optional[PricingRules]:
+    # Rules are compiled once per rules version; on a hit the version read is the only round trip
+    with span("db.get_pricing_rules"):
+        version = db_manager.get_version(pricing_version_key(user_id))
+        return pricing_rules.get(user_id, version, lambda: db_manager.get_pricing_rules(user_id))
+
+
+async def build_user_quotations(user_id: str, pricing: Optional[PricingRules], max_quotations: Optional[int],
+                                sample: Optional[int], seed: Optional[int]) -> dict:
+    async with limiters["quotations"].slot(user_id):
+        # The version is read first: a write racing the read only causes an extra patch later
+        with span("db.get_inventory_at_version"):
+            version, inventory = db_manager.get_inventory_at_version(user_id)
+
         if not inventory:
             raise HTTPException(status_code=404, detail=f"No inventory found for user ID: {user_id}")
-        
-        user_info = db_manager.get_user(user_id)
+
+        with span("db.get_user"):
+            user_info = db_manager.get_user(user_id)
         if not user_info:
             raise HTTPException(status_code=404, detail="User not found")
         if not user_info.get("gstin"):
             raise HTTPException(status_code=400, detail="GSTIN is required to generate quotations")
-        if user_info["company_name"] :
-            company_name = user_info["company_name"]
-            print(company_name)
-        if user_info["company_address"] :
-            company_address = user_info["company_address"]
-        if user_info["gstin"] :
-            gstin = user_info["gstin"]
-        if user_info["phone"] :
-            phone = user_info["phone"]
 
-        # Ensure the inventory is in the correct format
-        
-        # Get components from inventory
-        solar_panels = inventory.get("SolarPanels", [])
-        inverters = inventory.get("Inverters", [])
-        mounting_structures = inventory.get("MountingStructures", [])
-        earthing_systems = inventory.get("EarthingSystems", [])
-        
-        # These will be included in all quotations
-        bos_components = inventory.get("BOSComponents", [])
-        protection_equipment = inventory.get("ProtectionEquipment", [])
-        net_metering = inventory.get("NetMetering", [])
-        
-        # Generate permutations of configurable components
-        permutations = list(itertools.product(
-            solar_panels if solar_panels else [[]],
-            inverters if inverters else [[]],
-            mounting_structures if mounting_structures else [[]],
-            earthing_systems if earthing_systems else [[]]
-        ))
-        
-        # Apply max_quotations limit if specified
-        if max_quotations is not None:
-            permutations = permutations[:max_quotations]
-        
-        quotations = []
-        
-        for idx, (panel, inverter, mount, earth) in enumerate(permutations):
-            # Skip invalid combinations (empty components)
-            if not panel or not inverter or not mount or not earth:
-                continue
-            
-            # Extract quantities, rates, and profits using correct indices [model, quantity, rate, profit]
-            # Calculate amounts as quantity * rate
-            panel_quantity = int(panel[1]) if len(panel) > 1 and panel[1] not in ["", "N/A"] else 0
-            panel_rate = int(panel[2]) if len(panel) > 2 and panel[2] not in ["", "N/A"] else 0
-            panel_amount = panel_quantity * panel_rate
-            panel_profit = int(panel[3]) if len(panel) > 3 and panel[3] not in ["", "N/A"] else 0
-            
-            inverter_quantity = int(inverter[1]) if len(inverter) > 1 and inverter[1] not in ["", "N/A"] else 0
-            inverter_rate = int(inverter[2]) if len(inverter) > 2 and inverter[2] not in ["", "N/A"] else 0
-            inverter_amount = inverter_quantity * inverter_rate
-            inverter_profit = int(inverter[3]) if len(inverter) > 3 and inverter[3] not in ["", "N/A"] else 0
-            
-            mount_quantity = int(mount[1]) if len(mount) > 1 and mount[1] not in ["", "N/A"] else 0
-            mount_rate = int(mount[2]) if len(mount) > 2 and mount[2] not in ["", "N/A"] else 0
-            mount_amount = mount_quantity * mount_rate
-            mount_profit = int(mount[3]) if len(mount) > 3 and mount[3] not in ["", "N/A"] else 0
-            
-            earth_quantity = int(earth[1]) if len(earth) > 1 and earth[1] not in ["", "N/A"] else 0
-            earth_rate = int(earth[2]) if len(earth) > 2 and earth[2] not in ["", "N/A"] else 0
-            earth_amount = earth_quantity * earth_rate
-            earth_profit = int(earth[3]) if len(earth) > 3 and earth[3] not in ["", "N/A"] else 0
-            
-            # Calculate amounts and profits for additional components
-            bos_amount = sum((int(comp[1]) if len(comp) > 1 and comp[1] not in ["", "N/A"] else 0) * 
-                            (int(comp[2]) if len(comp) > 2 and comp[2] not in ["", "N/A"] else 0) 
-                            for comp in bos_components)
-            bos_profit = sum(int(comp[3]) if len(comp) > 3 and comp[3] not in ["", "N/A"] else 0 
-                           for comp in bos_components)
-            
-            protection_amount = sum((int(comp[1]) if len(comp) > 1 and comp[1] not in ["", "N/A"] else 0) * 
-                                  (int(comp[2]) if len(comp) > 2 and comp[2] not in ["", "N/A"] else 0) 
-                                  for comp in protection_equipment)
-            protection_profit = sum(int(comp[3]) if len(comp) > 3 and comp[3] not in ["", "N/A"] else 0 
-                                  for comp in protection_equipment)
-            
-            metering_amount = sum((int(comp[1]) if len(comp) > 1 and comp[1] not in ["", "N/A"] else 0) * 
-                                (int(comp[2]) if len(comp) > 2 and comp[2] not in ["", "N/A"] else 0) 
-                                for comp in net_metering)
-            metering_profit = sum(int(comp[3]) if len(comp) > 3 and comp[3] not in ["", "N/A"] else 0 
-                                for comp in net_metering)
-            
-            # Calculate total amount and profit
-            total_amount = panel_amount + inverter_amount + mount_amount + earth_amount + bos_amount + protection_amount + metering_amount
-            total_profit = panel_profit + inverter_profit + mount_profit + earth_profit + bos_profit + protection_profit + metering_profit
-            
-            # Create simple quotation with just model numbers
-            quotation = {
-    "SolarPanel": {
-        "model": panel[0],
-        "quantity": panel_quantity,
-        "rate": panel_rate,
-        "amount": panel_amount
-    },
-    "Inverter": {
-        "model": inverter[0],
-        "quantity": inverter_quantity,
-        "rate": inverter_rate,
-        "amount": inverter_amount
-    },
-    "MountingStructure": {
-        "model": mount[0],
-        "quantity": mount_quantity,
-        "rate": mount_rate,
-        "amount": mount_amount
-    },
-    "EarthingSystem": {
-        "model": earth[0],
-        "quantity": earth_quantity,
-        "rate": earth_rate,
-        "amount": earth_amount
-    },
-    "BOSComponents": [
-        {
-            "model": comp[0],
-            "quantity": int(comp[1]) if len(comp) > 1 and comp[1] not in ["", "N/A"] else 0,
-            "rate": int(comp[2]) if len(comp) > 2 and comp[2] not in ["", "N/A"] else 0,
-            "amount": (int(comp[1]) if len(comp) > 1 and comp[1] not in ["", "N/A"] else 0) * 
-                     (int(comp[2]) if len(comp) > 2 and comp[2] not in ["", "N/A"] else 0)
-        } for comp in bos_components
-    ],
-    "ProtectionEquipment": [
-        {
-            "model": comp[0],
-            "quantity": int(comp[1]) if len(comp) > 1 and comp[1] not in ["", "N/A"] else 0,
-            "rate": int(comp[2]) if len(comp) > 2 and comp[2] not in ["", "N/A"] else 0,
-            "amount": (int(comp[1]) if len(comp) > 1 and comp[1] not in ["", "N/A"] else 0) * 
-                     (int(comp[2]) if len(comp) > 2 and comp[2] not in ["", "N/A"] else 0)
-        } for comp in protection_equipment
-    ],
-    "NetMetering": [
-        {
-            "model": comp[0],
-            "quantity": int(comp[1]) if len(comp) > 1 and comp[1] not in ["", "N/A"] else 0,
-            "rate": int(comp[2]) if len(comp) > 2 and comp[2] not in ["", "N/A"] else 0,
-            "amount": (int(comp[1]) if len(comp) > 1 and comp[1] not in ["", "N/A"] else 0) * 
-                     (int(comp[2]) if len(comp) > 2 and comp[2] not in ["", "N/A"] else 0)
-        } for comp in net_metering
-    ]
-}
-            
-            quotation_obj = InventoryQuotation(
-                user_id=user_id,
-                inventory_id=str(inventory["_id"]),
-                quotation=quotation,
-                total_cost=total_amount,  # Total amount is the cost
-                total_profit=total_profit
-            )
-            
-            quotations.append(quotation_obj.dict())
-        
-        return {"quotations": quotations, "count": len(quotations), "company_name": company_name, "company_address": company_address, "gstin": gstin, "phone": phone}
-        
+        space = QuotationSpace(inventory, pricing)
+        # Reject oversized requests before building anything
+        quotation_budget.charge(user_id, space.requested_count(max_quotations, sample))
+        if sample is not None:
+            indices = space.sample_indices(sample, seed)
+        else:
+            indices = space.iter_indices(max_quotations)
+        # Build off the event loop so light requests are not stuck behind it; quotations
+        # built for an earlier version of the inventory are reused where still valid
+        with span("quotation.enumerate", combinations=space.size) as current:
+            quotations = await run_in_threadpool(quotation_sets.quotations, user_id, version, space, indices)
+            if current is not None:
+                current.set_attribute("quotations", len(quotations))
+        QUOTATION_COMBINATIONS.inc(len(quotations))
+        QUOTATIONS_RETURNED.labels("inventory").observe(len(quotations))
+
+        return {
+            "quotations": quotations,
+            "count": len(quotations),
+            "total_combinations": space.size,
+            "company_name": user_info.get("company_name"),
+            "company_address": user_info.get("company_address"),
+            "gstin": user_info.get("gstin"),
+            "phone": user_info.get("phone"),
+        }
+
+
+#this will help in generating the quotations for the user by permuting the components in the inventory
+@router.get("/api/inventory/quotations")
+async def generate_user_quotations(
+    max_quotations: Optional[int] = Query(None, ge=1, description="Maximum number of quotations to generate"),
+    sample: Optional[int] = Query(None, ge=1, description="Return this many distinct combinations drawn uniformly at random"),
+    seed: Optional[int] = Query(None, description="Seed for sample, to get a reproducible selection"),
+    user: dict = Depends(get_current_user)
+):
+    try:
+        user_id = user.get("sub")
+        pricing = pricing_rules_for(user_id)
+        if sample is not None and seed is None:
+            # Unseeded samples are meant to differ, so they are never shared
+            return await serialize(await build_user_quotations(user_id, pricing, max_quotations, sample, seed))
+        # Identical requests in flight for the same inventory and pricing versions share one computation
+        version = db_manager.get_version(inventory_version_key(user_id))
+        key = (user_id, version, pricing.version if pricing else 0, max_quotations, sample, seed)
+        result = await quotation_flights.do(key, build_user_quotations, user_id, pricing, max_quotations, sample, seed)
+        return await serialize(result)
+
+    except (QuotationLimitExceeded, Overloaded) as e:
+        raise limit_exceeded(e)
     except Exception as e:
         if isinstance(e, HTTPException):
             raise e
         raise HTTPException(status_code=500, detail=f"Failed to generate quotations: {str(e)}")
 
+
+# Save quotations for later; stored as references into a snapshot of the inventory
+@router.post("/api/inventory/quotations/save")
+async def save_user_quotations(
+    max_quotations: Optional[int] = Query(None, ge=1, description="Maximum number of quotations to save"),
+    sample: Optional[int] = Query(None, ge=1, description="Save this many distinct combinations drawn uniformly at random"),
+    seed: Optional[int] = Query(None, description="Seed for sample, to get a reproducible selection"),
+    user: dict = Depends(get_current_user)
+):
+    try:
+        user_id = user.get("sub")
+        async with limiters["quotations"].slot(user_id):
+            version, inventory = db_manager.get_inventory_at_version(user_id)
+            if not inventory:
+                raise HTTPException(status_code=404, detail=f"No inventory found for user ID: {user_id}")
+
+            pricing = pricing_rules_for(user_id)
+            space = QuotationSpace(inventory, pricing)
+            quotation_budget.charge(user_id, space.requested_count(max_quotations, sample))
+            if sample is not None:
+                indices = space.sample_indices(sample, seed)
+            else:
+                indices = space.iter_indices(max_quotations)
+            rows = await run_in_threadpool(space.compact, indices)
+            QUOTATION_COMBINATIONS.inc(len(rows))
+
+            snapshot_id = db_manager.save_inventory_snapshot(inventory, version, pricing)
+            batch_id = await run_in_threadpool(db_manager.save_quotation_batch, user_id, snapshot_id, rows)
+        return {"batch_id": batch_id, "snapshot_id": snapshot_id, "count": len(rows)}
+
+    except (QuotationLimitExceeded, Overloaded) as e:
+        raise limit_exceeded(e)
+    except Exception as e:
+        if isinstance(e, HTTPException):
+            raise e
+        raise HTTPException(status_code=500, detail=f"Failed to save quotations: {str(e)}")
+
+
+# Dry run: what a quotation request would cost, without generating it
+@router.get("/api/inventory/quotations/estimate")
+async def estimate_user_quotations(
+    max_quotations: Optional[int] = Query(None, ge=1, description="Maximum number of quotations to generate"),
+    sample: Optional[int] = Query(None, ge=1, description="Number of randomly sampled quotations"),
+    user: dict = Depends(get_current_user)
+):
+    try:
+        user_id = user.get("sub")
+        _, inventory = db_manager.get_inventory_at_version(user_id)
+        if not inventory:
+            raise HTTPException(status_code=404, detail=f"No inventory found for user ID: {user_id}")
+
+        space = QuotationSpace(inventory, pricing_rules_for(user_id))
+        count = space.requested_count(max_quotations, sample)
+        error = quotation_budget.check(user_id, count)
+        return {
+            "total_combinations": space.size,
+            "requested": count,
+            **space.estimate(count),
+            "max_per_request": quotation_budget.per_request,
+            "allowed": error is None,
+            "reason": str(error) if error else None,
+        }
+    except Exception as e:
+        if isinstance(e, HTTPException):
+            raise e
+        raise HTTPException(status_code=500, detail=f"Failed to estimate quotations: {str(e)}")
+
     
+@router.get("/api/inventory/quotations/summary")
+async def summarize_user_quotations(
+    bins: int = Query(20, ge=1, le=200, description="Number of histogram buckets"),
+    slot: None = Depends(admit("quotations")),
+    user: dict = Depends(get_current_user)
+):
+    try:
+        user_id = user.get("sub")
+        _, inventory = db_manager.get_inventory_at_version(user_id)
+        if not inventory:
+            raise HTTPException(status_code=404, detail=f"No inventory found for user ID: {user_id}")
+        space = QuotationSpace(inventory, pricing_rules_for(user_id))
+        return await run_in_threadpool(space.summary, bins)
+    except Exception as e:
+        if isinstance(e, HTTPException):
+            raise e
+        raise HTTPException(status_code=500, detail=f"Failed to summarize quotations: {str(e)}")
+
+
+# Pricing rules applied to the user's inventory quotations (GST slabs, margins, volume discounts)
+@router.get("/api/pricing_rules")
+async def get_pricing_rules(user: dict = Depends(get_current_user)):
+    try:
+        user_id = user.get("sub")
+        return {
+            "rules": db_manager.get_pricing_rules(user_id),
+            "version": db_manager.get_version(pricing_version_key(user_id)),
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to retrieve pricing rules: {str(e)}")
+
+
+@router.put("/api/pricing_rules")
+@admin_only_route
+async def set_pricing_rules(rules: PricingRulesRequest = Body(...), user: dict = Depends(get_current_user)):
+    try:
+        categories = {*rules.gst_percent, *rules.margin_percent} - {"default"}
+        unknown = sorted(name for name in categories if name not in INVENTORY_CATEGORIES)
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown inventory categories: {', '.join(unknown)}")
+        document = rules.dict()
+        version = db_manager.save_pricing_rules(user.get("sub"), document)
+        return {"rules": document, "version": version}
+    except Exception as e:
+        if isinstance(e, HTTPException):
+            raise e
+        raise HTTPException(status_code=500, detail=f"Failed to save pricing rules: {str(e)}")
+
+
+@router.delete("/api/pricing_rules")
+@admin_only_route
+async def delete_pricing_rules(user: dict = Depends(get_current_user)):
+    try:
+        version = db_manager.save_pricing_rules(user.get("sub"), None)
+        return {"rules": None, "version": version}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to delete pricing rules: {str(e)}")
+
+
 @router.post("/api/get_user_info")
 async def get_user_info(user: dict = Depends(get_current_user)):
     try:
@@ -735,165 +1168,43 @@ async def get_user_info(user: dict = Depends(get_current_user)):
     
 
 
-# @router.post("/api/quotations/", response_model=QuotationResponse)
-# async def get_quotation(request: QuotationFilterRequest = Body(...), user: dict = Depends(get_current_user)):
-#     try:
-#         # Fetch all components
-#         inverters = db_manager.get_all_materials("inverter")
-#         solar_panels = db_manager.get_all_materials("solar_panel")
-#         mounting_structures = db_manager.get_all_materials("mounting_structure")
-#         bos_components = db_manager.get_all_materials("bos_component")
-#         protection_equipment = db_manager.get_all_materials("protection_equipment")
-        
-#         # Apply filters if provided
-#         if request.inverter_brands:
-#             inverters = [inv for inv in inverters if inv.get("brand") in request.inverter_brands]
-        
-#         if request.panel_brands:
-#             solar_panels = [panel for panel in solar_panels if panel.get("brand") in request.panel_brands]
-        
-#         if request.mounting_material:
-#             mounting_structures = [mount for mount in mounting_structures 
-#                                   if mount.get("Material") in request.mounting_material]
-        
-#         if request.mounting_coating:
-#             mounting_structures = [mount for mount in mounting_structures 
-#                                   if mount.get("Coating_Type") in request.mounting_coating]
-        
-#         # Generate all permutations
-#         permutations = list(product(inverters, solar_panels, mounting_structures))
-        
-#         # Create quotation options
-#         quotation_options = []
-        
-#         for i, (inverter, panel, mount) in enumerate(permutations):
-#             # Calculate required number of panels based on system capacity
-#             panel_capacity_kw = panel.get("power_w", 0) / 1000
-#             required_panels = max(1, round(request.system_capacity_kw / panel_capacity_kw))
-            
-#             # Calculate costs for components
-#             inverter_cost = inverter.get("cost", 0)
-#             inverter_profit = inverter.get("profit", 0)
-#             inverter_total = inverter_cost * (1 + inverter_profit)
-            
-#             panel_cost = panel.get("cost", 0) * required_panels
-#             panel_profit = panel.get("profit", 0)
-#             panel_total = panel_cost * (1 + panel_profit)
-            
-#             mount_cost = mount.get("cost", 0)
-#             mount_profit = mount.get("profit", 0)
-#             mount_total = mount_cost * (1 + mount_profit)
-            
-#             # Calculate BOS and protection equipment costs
-#             bos_total_cost = sum(item.get("cost", 0) for item in bos_components)
-#             bos_total_profit = sum(item.get("cost", 0) * item.get("profit", 0) for item in bos_components)
-            
-#             protection_total_cost = sum(item.get("cost", 0) for item in protection_equipment)
-#             protection_total_profit = sum(item.get("cost", 0) * item.get("profit", 0) for item in protection_equipment)
-            
-#             # Calculate total system cost and profit
-#             total_system_cost = inverter_cost + panel_cost + mount_cost + bos_total_cost + protection_total_cost
-#             total_profit = inverter_cost * inverter_profit + panel_cost * panel_profit + mount_cost * mount_profit + bos_total_profit + protection_total_profit
-#             total_price = total_system_cost + total_profit
-            
-#             # Create component quotations
-#             inverter_quotation = ComponentQuotation(
-#                 id=inverter.get("id", str(uuid.uuid4())),
-#                 brand=inverter.get("brand", ""),
-#                 model=inverter.get("model", ""),
-#                 specifications=f"{inverter.get('Efficiency', 0)}% efficiency, {inverter.get('MPPT_Channels', 0)} MPPT channels",
-#                 warranty=inverter.get("Warranty", 0),
-#                 cost=inverter_cost,
-#                 profit=inverter_profit,
-#                 total_price=inverter_total
-#             )
-            
-#             panel_quotation = ComponentQuotation(
-#                 id=panel.get("id", str(uuid.uuid4())),
-#                 brand=panel.get("brand", ""),
-#                 model=panel.get("model_number", ""),
-#                 specifications=f"{panel.get('power_w', 0)}W, {panel.get('efficiency_percent', 0)}% efficiency, {required_panels} panels",
-#                 warranty=panel.get("Warranty", 0),
-#                 cost=panel_cost,
-#                 profit=panel_profit,
-#                 total_price=panel_total
-#             )
-            
-#             mounting_quotation = MountingQuotation(
-#                 id=mount.get("id", str(uuid.uuid4())),
-#                 material=mount.get("Material", ""),
-#                 coating_type=mount.get("Coating_Type", ""),
-#                 brand=mount.get("Brand", ""),
-#                 specifications=mount.get("Specifications", ""),
-#                 warranty=mount.get("Warranty", 0),
-#                 cost=mount_cost,
-#                 profit=mount_profit,
-#                 total_price=mount_total
-#             )
-            
-#             # Create BOS component quotations
-#             bos_quotations = []
-#             for bos in bos_components:
-#                 bos_cost = bos.get("cost", 0)
-#                 bos_profit = bos.get("profit", 0)
-#                 bos_total = bos_cost * (1 + bos_profit)
-                
-#                 bos_quotations.append(ComponentQuotation(
-#                     id=bos.get("id", str(uuid.uuid4())),
-#                     brand=bos.get("Brand", ""),
-#                     model=bos.get("Component_Type", ""),
-#                     specifications=bos.get("Specifications", ""),
-#                     warranty=bos.get("Warranty", 0),
-#                     cost=bos_cost,
-#                     profit=bos_profit,
-#                     total_price=bos_total
-#                 ))
-            
-#             # Create protection equipment quotations
-#             protection_quotations = []
-#             for protection in protection_equipment:
-#                 protection_cost = protection.get("cost", 0)
-#                 protection_profit = protection.get("profit", 0)
-#                 protection_total = protection_cost * (1 + protection_profit)
-                
-#                 protection_quotations.append(ComponentQuotation(
-#                     id=protection.get("id", str(uuid.uuid4())),
-#                     brand=protection.get("Brand", ""),
-#                     model=protection.get("Model", ""),
-#                     specifications=protection.get("Specifications", ""),
-#                     warranty=protection.get("Warranty", 0),
-#                     cost=protection_cost,
-#                     profit=protection_profit,
-#                     total_price=protection_total
-#                 ))
-                
-#             # Create quotation option
-#             quotation_option = QuotationOption(
-#                 quotation_id=f"QT-{i+1}-{uuid.uuid4().hex[:6]}",
-#                 inverter=inverter_quotation,
-#                 solar_panel=panel_quotation,
-#                 mounting_structure=mounting_quotation,
-#                 bos_components=bos_quotations,
-#                 protection_equipment=protection_quotations,
-#                 total_system_cost=total_system_cost,
-#                 total_profit=total_profit,
-#                 total_price=total_price
-#             )
-            
-#             quotation_options.append(quotation_option)
-        
-#         # Create and return the response
-#         response = QuotationResponse(
-#             quotation_options=quotation_options,
-#             total_options=len(quotation_options),
-#             system_capacity_kw=request.system_capacity_kw
-#         )
-        
-#         return response
-        
-#     except Exception as e:
-#         print(f"Error generating quotation: {str(e)}")
-#         raise HTTPException(status_code=500, detail=f"Failed to generate quotation: {str(e)}")
+MAX_SAVED_PAGE_SIZE = 1000
+
+
+@router.get("/api/quotations/batches/{batch_id}")
+async def get_saved_quotations(
+    batch_id: str,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=MAX_SAVED_PAGE_SIZE),
+    user: dict = Depends(get_current_user)
+):
+    try:
+        user_id = user.get("sub")
+        total = db_manager.count_quotation_batch(batch_id, user_id)
+        if not total:
+            raise HTTPException(status_code=404, detail=f"No saved quotations found for batch: {batch_id}")
+        quotations = await run_in_threadpool(db_manager.get_quotation_batch, batch_id, user_id, offset, limit)
+        QUOTATIONS_RETURNED.labels("saved").observe(len(quotations))
+        return {"quotations": quotations, "count": len(quotations), "total": total, "offset": offset}
+    except Exception as e:
+        if isinstance(e, HTTPException):
+            raise e
+        raise HTTPException(status_code=500, detail=f"Failed to retrieve saved quotations: {str(e)}")
+
+
+@router.post("/api/quotations/", response_model=QuotationResponse)
+async def get_quotation(
+    request: QuotationFilterRequest = Body(...),
+    slot: None = Depends(admit("quotations")),
+    user: dict = Depends(get_current_user)
+):
+    try:
+        response = await run_in_threadpool(build_catalog_quotations, request)
+        QUOTATIONS_RETURNED.labels("catalog").observe(response.total_options)
+        return response
+    except Exception as e:
+        logger.exception("Generating catalog quotations failed")
+        raise HTTPException(status_code=500, detail=f"Failed to generate quotation: {str(e)}")
 
 @router.get("/")
 async def root():
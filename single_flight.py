@@ -0,0 +1,41 @@
+import asyncio
+from typing import Awaitable, Callable, Dict, Hashable
+
+from metrics import cache_hit, cache_miss
+
+
+class SingleFlight:
+    """Coalesces concurrent calls with the same key into one computation.
+
+    The first caller for a key starts the computation as a task; callers
+    arriving while it runs await the same task and get the same result (or
+    exception). Nothing is kept once the task finishes, so this only removes
+    duplicate work that overlaps in time. A caller that disconnects does not
+    cancel the computation for the others.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: Dict[Hashable, asyncio.Task] = {}
+        self.started = 0
+        self.shared = 0
+
+    def _finished(self, key: Hashable, task: asyncio.Task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled():
+            # Mark the exception retrieved even if every caller went away
+            task.exception()
+
+    async def do(self, key: Hashable, func: Callable[..., Awaitable], *args):
+        task = self._calls.get(key)
+        if task is None:
+            self.started += 1
+            cache_miss(self.name)
+            task = asyncio.ensure_future(func(*args))
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._finished(key, done))
+        else:
+            self.shared += 1
+            cache_hit(self.name)
+        return await asyncio.shield(task)
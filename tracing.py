@@ -0,0 +1,248 @@
+"""Tracing spans and the slow-operation log.
+
+Spans use OpenTelemetry when it is installed and are no-ops otherwise. With
+opentelemetry-sdk installed, TRACING_EXPORTER selects where spans go:
+"otlp" sends them to a collector (OTEL_EXPORTER_OTLP_ENDPOINT, needs
+opentelemetry-exporter-otlp) and "log" writes one JSON line per span to the
+"tracing" logger.
+
+Independently of tracing, requests, spans and MongoDB commands slower than
+their threshold are written as JSON lines to the "slow_operations" logger;
+Mongo entries carry the command's filter shape (values replaced by their
+types), never the values themselves.
+"""
+import json
+import logging
+import os
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Dict, Optional, Tuple
+
+from pymongo import monitoring
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    from opentelemetry import trace
+except ImportError:  # tracing is optional
+    trace = None
+
+# Thresholds (milliseconds) above which an operation is written to the slow log
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", "1000"))
+SLOW_SPAN_MS = float(os.getenv("SLOW_SPAN_MS", "250"))
+SLOW_MONGO_MS = float(os.getenv("SLOW_MONGO_MS", "100"))
+TRACING_EXPORTER = os.getenv("TRACING_EXPORTER", "")
+
+slow_log = logging.getLogger("slow_operations")
+logger = logging.getLogger(__name__)
+
+tracer = trace.get_tracer("solar_quotation") if trace else None
+
+
+def configure_tracing():
+    """Install a tracer provider for TRACING_EXPORTER; without the SDK spans stay no-ops."""
+    if not TRACING_EXPORTER or trace is None:
+        return
+    try:
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+    except ImportError:
+        logger.warning("TRACING_EXPORTER=%s needs opentelemetry-sdk; tracing disabled", TRACING_EXPORTER)
+        return
+
+    if TRACING_EXPORTER == "otlp":
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        exporter = OTLPSpanExporter()
+    elif TRACING_EXPORTER == "log":
+        exporter = _log_exporter()
+    else:
+        logger.warning("Unknown TRACING_EXPORTER %r; tracing disabled", TRACING_EXPORTER)
+        return
+
+    provider = TracerProvider(resource=Resource.create({"service.name": "solar-quotation-api"}))
+    provider.add_span_processor(BatchSpanProcessor(exporter))
+    trace.set_tracer_provider(provider)
+
+
+def _log_exporter():
+    from opentelemetry.sdk.trace.export import SpanExporter, SpanExportResult
+
+    span_log = logging.getLogger("tracing")
+
+    class LogSpanExporter(SpanExporter):
+        def export(self, spans):
+            for span in spans:
+                span_log.info(json.dumps({
+                    "trace_id": format(span.context.trace_id, "032x"),
+                    "span_id": format(span.context.span_id, "016x"),
+                    "parent_id": format(span.parent.span_id, "016x") if span.parent else None,
+                    "name": span.name,
+                    "duration_ms": round((span.end_time - span.start_time) / 1e6, 3),
+                    "attributes": dict(span.attributes or {}),
+                }, default=str))
+            return SpanExportResult.SUCCESS
+
+    return LogSpanExporter()
+
+
+def current_trace_id() -> Optional[str]:
+    if trace is None:
+        return None
+    context = trace.get_current_span().get_span_context()
+    return format(context.trace_id, "032x") if context.is_valid else None
+
+
+def log_slow(kind: str, duration_ms: float, **fields):
+    slow_log.warning(json.dumps({
+        "kind": kind,
+        "duration_ms": round(duration_ms, 3),
+        "trace_id": current_trace_id(),
+        **fields,
+    }, default=str))
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """Trace a stage of a request; stages slower than SLOW_SPAN_MS also go to the slow log."""
+    started = time.perf_counter()
+    if tracer is None:
+        try:
+            yield None
+        finally:
+            duration_ms = (time.perf_counter() - started) * 1000
+            if duration_ms > SLOW_SPAN_MS:
+                log_slow("span", duration_ms, name=name, **attributes)
+        return
+
+    with tracer.start_as_current_span(name, attributes=attributes) as current:
+        try:
+            yield current
+        finally:
+            duration_ms = (time.perf_counter() - started) * 1000
+            if duration_ms > SLOW_SPAN_MS:
+                log_slow("span", duration_ms, name=name, **attributes)
+
+
+def filter_shape(value, depth: int = 0):
+    """A query with every value replaced by its type name, e.g. {"user_id": "str"}."""
+    if depth > 8:
+        return "..."
+    if isinstance(value, dict):
+        return {key: filter_shape(item, depth + 1) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        if not value:
+            return []
+        # Operators like $in/$or keep the shape of their first element and the length
+        return [filter_shape(value[0], depth + 1), f"x{len(value)}"] if len(value) > 1 else [filter_shape(value[0], depth + 1)]
+    return type(value).__name__
+
+
+def command_filter(command_name: str, command: Dict):
+    if command_name in ("find", "count", "distinct", "delete", "update"):
+        if command_name == "update":
+            statements = command.get("updates") or [{}]
+            return statements[0].get("q")
+        if command_name == "delete":
+            statements = command.get("deletes") or [{}]
+            return statements[0].get("q")
+        return command.get("filter", command.get("query"))
+    if command_name == "findAndModify":
+        return command.get("query")
+    if command_name == "aggregate":
+        return command.get("pipeline")
+    return None
+
+
+class MongoTracing(monitoring.CommandListener):
+    """A span per MongoDB command, and slow-log entries for commands over SLOW_MONGO_MS.
+
+    pymongo calls the listener on the thread that runs the command, so command
+    spans become children of whatever span is current there.
+    """
+
+    def __init__(self):
+        # (connection, request id) -> (span, command name, collection, command document)
+        self._pending: Dict[Tuple, tuple] = {}
+
+    @staticmethod
+    def _key(event) -> Tuple:
+        return event.connection_id, event.request_id
+
+    def started(self, event):
+        collection = event.command.get(event.command_name)
+        if event.command_name == "getMore":
+            collection = event.command.get("collection")
+        collection = collection if isinstance(collection, str) else None
+        command_span = None
+        if tracer is not None:
+            command_span = tracer.start_span(f"mongodb.{event.command_name}", attributes={
+                "db.system": "mongodb",
+                "db.name": event.database_name,
+                "db.operation": event.command_name,
+                "db.mongodb.collection": collection or "",
+            })
+        self._pending[self._key(event)] = (command_span, event.command_name, collection, event.command)
+
+    def _finish(self, event, failure=None):
+        pending = self._pending.pop(self._key(event), None)
+        if pending is None:
+            return
+        command_span, command_name, collection, command = pending
+        duration_ms = event.duration_micros / 1000
+        if command_span is not None:
+            if failure is not None:
+                command_span.set_attribute("error", True)
+                command_span.set_attribute("db.mongodb.error", str(failure))
+            command_span.end()
+        if duration_ms > SLOW_MONGO_MS:
+            log_slow("mongo", duration_ms, command=command_name, collection=collection,
+                     filter=filter_shape(command_filter(command_name, command)),
+                     error=str(failure) if failure is not None else None)
+
+    def succeeded(self, event):
+        self._finish(event)
+
+    def failed(self, event):
+        self._finish(event, failure=event.failure)
+
+
+class TracingMiddleware:
+    """Root span per request, named after the route template, plus slow-request logging."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_wrapper(message: Message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        method, path = scope["method"], scope["path"]
+        started = time.perf_counter()
+        request_span = None
+        context = nullcontext()
+        if tracer is not None:
+            context = tracer.start_as_current_span(f"{method} {path}", attributes={
+                "http.method": method, "http.target": path,
+            })
+        with context as request_span:
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                # The router has recorded the matched route in the scope by now
+                route_path = getattr(scope.get("route"), "path", path)
+                if request_span is not None:
+                    request_span.update_name(f"{method} {route_path}")
+                    request_span.set_attribute("http.route", route_path)
+                    request_span.set_attribute("http.status_code", status)
+                duration_ms = (time.perf_counter() - started) * 1000
+                if duration_ms > SLOW_REQUEST_MS:
+                    log_slow("request", duration_ms, method=method, route=route_path, status=status)